@@ -0,0 +1,791 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""Benchmarks for the cf module.
+
+Usage: python bench_cf.py [name...]
+Runs the named benchmarks, or all of them if no name is given."""
+
+import sys
+from time import clock
+import cf
+
+def bench_memory(nodes=100000, pqs=10000):
+    """Compare the bytes per node and per cached partial quotient
+    of the slotted layout with the former layout, in which every
+    node carried a __dict__ and a list of partial quotients."""
+
+    class legacy_node(object):
+        pass
+
+    def legacy_size(node):
+        return (sys.getsizeof(node) + sys.getsizeof(node.__dict__) +
+            sys.getsizeof(node.cache))
+
+    def slotted_size(node):
+        size = sys.getsizeof(node) + sys.getsizeof(node.cache)
+        if node.spill is not None:
+            size += sys.getsizeof(node.spill)
+            for t in node.spill.itervalues():
+                size += sys.getsizeof(t)
+        return size
+
+    x = cf.cf(3, 7)
+    legacy_total = slotted_total = 0
+    for i in xrange(nodes):
+        node = legacy_node()
+        node.cache = []
+        node.next_pq = None
+        legacy_total += legacy_size(node)
+        slotted_total += slotted_size(cf.unop(x, i, 1, 0, 1))
+    print 'bytes per node:           %8.1f before, %8.1f after' % (
+        float(legacy_total)/nodes, float(slotted_total)/nodes)
+
+    # Cache the partial quotients of pi in both layouts. Python
+    # shares the objects of small ints, so count only the others.
+    pi = cf.pi
+    for i in xrange(pqs):
+        pi.pq(i)
+    node = legacy_node()
+    node.cache = [pi.pq(i) for i in xrange(pqs)]
+    legacy_total = sys.getsizeof(node.cache)
+    for t in node.cache:
+        if not -5 <= t <= 256:
+            legacy_total += sys.getsizeof(t)
+    print 'bytes per cached pq:      %8.1f before, %8.1f after' % (
+        float(legacy_total)/pqs,
+        float(sys.getsizeof(pi.cache))/pqs)
+
+def bench_interning(count=20, precision=200):
+    """Time sin(x), cos(x), sinh(x), cosh(x) and x**8 with and
+    without the interning of nodes, and report the hits and misses."""
+
+    from random import random, seed
+    for intern_nodes in (0, 1):
+        cf.set_cf_parameter('intern_nodes', intern_nodes)
+        seed(42)
+        hits, misses = cf.intern_stats()
+        start_time = clock()
+        for i in xrange(count):
+            x = cf.cf(3*random())/7
+            for y in (cf.sin(x), cf.cos(x), cf.sinh(x), cf.cosh(x),
+                x**8, x**8):
+                for j in xrange(precision):
+                    if y.pq(j) is None:
+                        break
+        new_hits, new_misses = cf.intern_stats()
+        print 'intern_nodes=%d: %.3f s, %d hits, %d misses' % (
+            intern_nodes, clock() - start_time,
+            new_hits - hits, new_misses - misses)
+    cf.set_cf_parameter('intern_nodes', 0)
+
+def bench_fusion(depth=50, precision=2000):
+    """Time the partial quotients of a chain of depth affine
+    operations on e, with and without the fusion of nodes."""
+
+    for fuse_nodes in (0, 1):
+        cf.set_cf_parameter('fuse_nodes', fuse_nodes)
+        y = cf.e
+        for i in xrange(depth):
+            if i%3 == 0:
+                y = 3*y
+            elif i%3 == 1:
+                y = y + 1
+            else:
+                y = y/2
+        start_time = clock()
+        for j in xrange(precision):
+            y.pq(j)
+        print 'fuse_nodes=%d: %.3f s for %d pqs of a %d-deep chain' % (
+            fuse_nodes, clock() - start_time, precision, depth)
+    cf.set_cf_parameter('fuse_nodes', 1)
+
+def bench_blocks(depths=(1000, 10000), blocks=(1, 8, 32)):
+    """Report the throughput in partial quotients per second of sums,
+    products and quotients of e, pi and sqrt(2), computed to a given
+    depth with various numbers of partial quotients ingested at a
+    time."""
+
+    operands = [('e', cf.e), ('pi', cf.pi), ('sqrt(2)', cf.cf((1,), (2,)))]
+    # Compute the partial quotients of the operands beforehand,
+    # so that only the binary operations are timed.
+    for name, x in operands:
+        for j in xrange(2*max(depths)):
+            x.pq(j)
+    for depth in depths:
+        for i, (x_name, x) in enumerate(operands):
+            for y_name, y in operands[i+1:]:
+                for op in '+*/':
+                    line = '%-11s depth %5d:' % (
+                        x_name + op + y_name, depth)
+                    for ingest_block in blocks:
+                        cf.set_cf_parameter('ingest_block', ingest_block)
+                        z = eval('x' + op + 'y')
+                        start_time = clock()
+                        for j in xrange(depth):
+                            z.pq(j)
+                        line += ' %8.0f pq/s (k=%d)' % (
+                            depth/(clock() - start_time), ingest_block)
+                    print line
+    cf.set_cf_parameter('ingest_block', 1)
+
+def bench_renormalise(iterations=60, precision=20000):
+    """Report the maximal bit length of the coefficients of the
+    nodes of the logistic map demo, and time the digits of e with
+    and without renormalisation."""
+
+    cf.set_cf_parameter('track_coefficient_bits', 1)
+    x = cf.cf(671875, 1000000)
+    sizes = []
+    for i in xrange(iterations):
+        x = 4*x*(1 - x)
+        str(x)
+        sizes.append(cf.coefficient_bits(x))
+    cf.set_cf_parameter('track_coefficient_bits', 0)
+    print 'logistic map: max coefficient bits %d, last %d' % (
+        max(sizes), sizes[-1])
+
+    for renormalise_bits in (sys.maxint, 256):
+        cf.set_cf_parameter('renormalise_bits', renormalise_bits)
+        start_time = clock()
+        digits = cf.digits(cf.e)
+        for j in xrange(precision):
+            digits.next()
+        print 'renormalise_bits=%d: %.3f s for %d digits of e' % (
+            renormalise_bits, clock() - start_time, precision)
+    cf.set_cf_parameter('renormalise_bits', 256)
+
+def bench_to_decimal(places=(1000, 10000, 30000)):
+    """Time the decimal expansions of e, pi and sqrt(2) computed
+    by digits() and by to_decimal()."""
+
+    operands = [('e', cf.e), ('pi', cf.pi), ('sqrt(2)', cf.cf((1,), (2,)))]
+    # Compute the partial quotients beforehand, so that
+    # only the conversions are timed.
+    for name, x in operands:
+        cf.to_decimal(x, max(places))
+    for n in places:
+        for name, x in operands:
+            start_time = clock()
+            get_digit = cf.digits(x).next
+            for j in xrange(n + 1):
+                get_digit()
+            digits_time = clock() - start_time
+            start_time = clock()
+            cf.to_decimal(x, n)
+            to_decimal_time = clock() - start_time
+            print '%-8s %5d digits: %.4f s digits(), %.4f s to_decimal()' % (
+                name, n, digits_time, to_decimal_time)
+
+def bench_chunks(precision=100000):
+    """Time printing the decimal digits of e, pi and sqrt(2) one at
+    a time, ingesting one partial quotient at a time, as digit_by_digit()
+    used to, and in chunks of 18 digits. The digits go to os.devnull."""
+
+    import os
+    output = open(os.devnull, 'w')
+    operands = [('e', cf.e), ('pi', cf.pi), ('sqrt(2)', cf.cf((1,), (2,)))]
+    for name, x in operands:
+        # Compute the partial quotients beforehand,
+        # so that only the output is timed.
+        cf.to_decimal(x, precision + 100)
+
+        cf.set_cf_parameter('ingest_block', 1)
+        start_time = clock()
+        get_digit = cf.digits(x).next
+        output.write(str(get_digit()) + '.')
+        for i in xrange(precision):
+            output.write(str(get_digit()))
+        single_time = clock() - start_time
+        cf.set_cf_parameter('ingest_block', 8)
+
+        start_time = clock()
+        get_digits = cf._cf_digit_strings(x).next
+        output.write(str(get_digits()) + '.')
+        left = precision
+        while left > 0:
+            digit_string = get_digits()[:left]
+            output.write(digit_string)
+            left -= len(digit_string)
+        print '%-8s %d digits: %.3f s one at a time, %.3f s in chunks' % (
+            name, precision, single_time, clock() - start_time)
+    cf.set_cf_parameter('ingest_block', 1)
+    output.close()
+
+def legacy_float(x):
+    """The former cf_base.__float__(), which divided floats
+    for every convergent until two of them agreed."""
+
+    x_pq = x.pq
+    last_num, last_den, curr_num, curr_den = 1, 0, x_pq(0), 1
+    curr_convergent = float(curr_num)
+    n = 1
+    pq = x_pq(1)
+    while pq is not None:
+        last_num, curr_num, last_den, curr_den = (
+            curr_num, pq*curr_num + last_num,
+            curr_den, pq*curr_den + last_den)
+        last_convergent = curr_convergent
+        curr_convergent = float(curr_num)/float(curr_den)
+        if curr_convergent == last_convergent:
+            break
+        n += 1
+        pq = x_pq(n)
+    return curr_convergent
+
+def bench_float(count=20000):
+    """Time the conversion to float of products and quotients of
+    random numbers by the former and the current __float__(), and
+    count how often the former wasn't correctly rounded."""
+
+    from random import random, seed
+    seed(42)
+    values = []
+    for i in xrange(count):
+        x = cf.cf(random())*cf.cf(1000*random())/cf.cf(random())
+        float(x)
+        values.append(x)
+    for name, function in (('before', legacy_float), ('after', float)):
+        start_time = clock()
+        for x in values:
+            function(x)
+        print '%-6s %.2f us per conversion' % (
+            name, 1e6*(clock() - start_time)/count)
+    wrong = 0
+    for x in values:
+        if legacy_float(x) != float(x):
+            wrong += 1
+    print 'results of the former that differ: %d of %d' % (wrong, count)
+
+def legacy_cf(x, y=1):
+    """The former construction of cf(x, y) from numbers, which
+    converted x to float and divided floats."""
+
+    if isinstance(x, float) and cf.isnan(x):
+        return cf.cf(())
+    if isinstance(x, cf.cf_base):
+        return x
+    if hasattr(x, '__getitem__'):
+        return cf.cf(x, y)
+    self = object.__new__(cf.cf)
+    def ratio(x, y):
+        while y:
+            x_div_y, x_mod_y = divmod(x, y)
+            yield int(x_div_y)
+            x, y = y, x_mod_y
+        yield None
+    self.cache = cf.array('l')
+    self.spill = None
+    if not isinstance(x, (float, int)):
+        x = float(x)
+    self.next_pq = ratio(x, y).next
+    return self
+
+def bench_construction(count=1000000, expanded=100000):
+    """Time constructing count cf objects from random floats, and
+    constructing and expanding completely expanded ones, before and
+    after the exact constructors."""
+
+    from random import random, seed
+    seed(42)
+    values = [random()*1000 for i in xrange(count)]
+    for name, constructor in (('before', legacy_cf), ('after', cf.cf)):
+        start_time = clock()
+        for x in values:
+            constructor(x)
+        construction_time = clock() - start_time
+        start_time = clock()
+        for x in values[:expanded]:
+            x = constructor(x)
+            n = 0
+            while x.pq(n) is not None:
+                n += 1
+        print '%-6s %.3f s for %d, %.3f s for %d expanded' % (
+            name, construction_time, count,
+            clock() - start_time, expanded)
+
+def bench_hgcd(sizes=(10**3, 10**4, 10**5, 10**6), euclid_limit=10**5):
+    """Time expanding cf(p, q) completely for random p and q of
+    various bit lengths with Euclid's algorithm, up to euclid_limit
+    bits, and with the half-gcd algorithm."""
+
+    from random import getrandbits, seed
+    seed(42)
+    for bits in sizes:
+        p, q = getrandbits(bits), getrandbits(bits)
+        line = '%8d bits:' % bits
+        for name, threshold in (('Euclid', sys.maxint), ('half-gcd', 1024)):
+            if threshold == sys.maxint and bits > euclid_limit:
+                continue
+            cf.set_cf_parameter('hgcd_threshold', threshold)
+            x = cf.cf(p, q)
+            start_time = clock()
+            n = 0
+            while x.pq(n) is not None:
+                n += 1
+            line += ' %8.3f s %s,' % (clock() - start_time, name)
+        print line + ' %d partial quotients' % n
+    cf.set_cf_parameter('hgcd_threshold', 1024)
+
+def bench_evaluate_many(count=64, precision=500):
+    """Compare the throughput of evaluate_many() on a single process,
+    two processes and one process per CPU."""
+
+    from multiprocessing import cpu_count
+
+    expressions = []
+    for i in xrange(1, count + 1):
+        expressions.append(['exp(cf(1, %d))' % i, (cf.atan2, i, 7),
+            (cf.log, i + 1), (cf.sqrt, i + 1)][i % 4])
+    for processes in sorted(set([1, 2, cpu_count()])):
+        stats = {}
+        cf.evaluate_many(expressions, precision, processes=processes,
+            stats=stats)
+        print '%2d processes: %8.3f s, %8.1f tasks/s' % (
+            processes, stats['seconds'], stats['tasks_per_second'])
+
+def bench_pickle(precision=5000, more=100):
+    """Compare continuing an expression unpickled after precision
+    partial quotients with computing it from scratch."""
+
+    import cPickle
+
+    def expression():
+        return cf.pi*cf.e + cf.sqrt(2)
+
+    x = expression()
+    for i in xrange(precision):
+        x.pq(i)
+    data = cPickle.dumps(x, 2)
+    start_time = clock()
+    x = cPickle.loads(data)
+    for i in xrange(precision + more):
+        x.pq(i)
+    resumed = clock() - start_time
+    start_time = clock()
+    x = expression()
+    for i in xrange(precision + more):
+        x.pq(i)
+    print '%d partial quotients: %8.3f s from scratch, %8.3f s resumed' \
+        ' from %d bytes' % (precision + more, clock() - start_time,
+            resumed, len(data))
+
+def bench_constant_store(precision=10000):
+    """Time the first precision digits of tan(10**6) and of pi,
+    including the import of the module, in a process that starts
+    with an empty constant store and in one that reuses it."""
+
+    import os
+    import shutil
+    import subprocess
+    import tempfile
+    import time
+
+    for expression in ('tan(10**6)', 'pi'):
+        directory = tempfile.mkdtemp()
+        environment = dict(os.environ, CF_CACHE_DIR=directory)
+        command = [sys.executable, '-c',
+            'import cf; cf.to_decimal(cf.%s, %d)' % (expression, precision)]
+        line = '%-10s %d digits:' % (expression, precision)
+        try:
+            for run in ('cold', 'warm'):
+                start_time = time.time()
+                subprocess.check_call(command, env=environment)
+                line += ' %8.3f s %s,' % (time.time() - start_time, run)
+        finally:
+            shutil.rmtree(directory)
+        print line[:-1]
+
+def legacy_pi():
+    """Generate the partial quotients of pi the former way, from
+    a generalized continued fraction for 4/pi, one term at a time."""
+
+    yield 3
+    a, b, c, d, p, q = 51, 6, 7, 1, 16, 9
+    while 1:
+        ac, a_mod_c = divmod(a, c)
+        bd, b_mod_d = divmod(b, d)
+        if ac == bd:
+            yield ac
+            a, b, c, d = c, d, a_mod_c, b_mod_d
+        else:
+            a, b, c, d = p*b + q*a, a, p*d + q*c, c
+            p += q
+            q += 2
+            if q&2047 == 1:
+                gcd_abcd = cf._cf_gcd(cf._cf_gcd(a, b), cf._cf_gcd(c, d))
+                a //= gcd_abcd
+                b //= gcd_abcd
+                c //= gcd_abcd
+                d //= gcd_abcd
+
+def bench_pi(counts=(10000, 100000)):
+    """Compare the Chudnovsky binary splitting behind cf.pi with
+    the former generalized continued fraction."""
+
+    for count in counts:
+        start_time = clock()
+        x = cf._cf_pi()
+        for i in xrange(count):
+            x.pq(i)
+        chudnovsky = clock() - start_time
+        start_time = clock()
+        pq = legacy_pi().next
+        for i in xrange(count):
+            pq()
+        print '%6d partial quotients: %8.3f s before, %8.3f s after' % (
+            count, clock() - start_time, chudnovsky)
+
+def bench_exp_rational(counts=(1000, 10000, 100000), legacy_limit=100000):
+    """Compare exp, sinh, cosh and tanh of 2/3 by binary splitting with
+    the general algorithms, which see a sequence of partial quotients."""
+
+    from fractions import Fraction
+    x = Fraction(2, 3)
+    sequence = cf.cf((0, 1, 2))
+    for function in (cf.exp, cf.sinh, cf.cosh, cf.tanh):
+        for count in counts:
+            start_time = clock()
+            y = function(x)
+            for i in xrange(count):
+                y.pq(i)
+            after = clock() - start_time
+            if count > legacy_limit:
+                print '%-4s %6d partial quotients: %10s before, %8.3f s' \
+                    ' after' % (function.__name__, count, '-', after)
+                continue
+            start_time = clock()
+            y = function(sequence)
+            for i in xrange(count):
+                y.pq(i)
+            print '%-4s %6d partial quotients: %8.3f s before, %8.3f s' \
+                ' after' % (function.__name__, count, clock() - start_time,
+                    after)
+
+def bench_atan_rational(pairs=2000, counts=(1000, 10000, 100000),
+                        legacy_limit=10000):
+    """Compare atan2 of float pairs by binary splitting with the general
+    algorithms, which see sequences of partial quotients: the time per
+    conversion to float, and the time for count partial quotients."""
+
+    import random
+    random.seed(1)
+    points = [(random.uniform(-1, 1), random.uniform(-1, 1))
+              for i in xrange(pairs)]
+    def sequence(x):
+        x = cf.cf(x)
+        pqs = []
+        while pqs[-1:] != [None]:
+            pqs.append(x.pq(len(pqs)))
+        return cf.cf(tuple(pqs[:-1]))
+    sequences = [(sequence(y), sequence(x)) for y, x in points]
+    start_time = clock()
+    for y, x in points:
+        float(cf.atan2(y, x))
+    after = clock() - start_time
+    start_time = clock()
+    for y, x in sequences:
+        float(cf.atan2(y, x))
+    print 'float(atan2(y, x)): %8.1f us before, %8.1f us after' % (
+        (clock() - start_time)/pairs*1e6, after/pairs*1e6)
+    y, x = points[0]
+    for count in counts:
+        start_time = clock()
+        z = cf.atan2(y, x)
+        for i in xrange(count):
+            z.pq(i)
+        after = clock() - start_time
+        if count > legacy_limit:
+            print '%6d partial quotients: %10s before, %8.3f s after' % (
+                count, '-', after)
+            continue
+        start_time = clock()
+        z = cf.atan2(*sequences[0])
+        for i in xrange(count):
+            z.pq(i)
+        print '%6d partial quotients: %8.3f s before, %8.3f s after' % (
+            count, clock() - start_time, after)
+
+def bench_log_rational(values=2000, counts=(1000, 10000, 100000),
+                       legacy_limit=10000):
+    """Compare log of rationals by binary splitting with the general
+    algorithm, which sees sequences of partial quotients: the time per
+    conversion to float, and the time for count partial quotients."""
+
+    import random
+    from fractions import Fraction
+    random.seed(1)
+    points = [random.uniform(0, 100) for i in xrange(values)]
+    def sequence(x):
+        x = cf.cf(x)
+        pqs = []
+        while pqs[-1:] != [None]:
+            pqs.append(x.pq(len(pqs)))
+        return cf.cf(tuple(pqs[:-1]))
+    sequences = map(sequence, points)
+    start_time = clock()
+    for x in points:
+        float(cf.log(x))
+    after = clock() - start_time
+    start_time = clock()
+    for x in sequences:
+        float(cf.log(x))
+    print 'float(log(x)): %8.1f us before, %8.1f us after' % (
+        (clock() - start_time)/values*1e6, after/values*1e6)
+    x = Fraction(22, 7)
+    for count in counts:
+        start_time = clock()
+        y = cf.log(x)
+        for i in xrange(count):
+            y.pq(i)
+        after = clock() - start_time
+        if count > legacy_limit:
+            print 'log(22/7) %6d partial quotients: %10s before, %8.3f s' \
+                ' after' % (count, '-', after)
+            continue
+        start_time = clock()
+        y = cf.log(sequence(x))
+        for i in xrange(count):
+            y.pq(i)
+        print 'log(22/7) %6d partial quotients: %8.3f s before, %8.3f s' \
+            ' after' % (count, clock() - start_time, after)
+
+def bench_series(counts=(1000, 10000, 100000)):
+    """Time constants defined in a line each with cf.series, next to
+    the hand-written e and pi."""
+
+    constants = [
+        ('e', lambda: cf.series(1, (0, 1))),
+        ('e, by hand', lambda: cf._cf_exp_1n(1)),
+        ('pi', lambda: cf.series((0, 1), (1, 2), 2)),
+        ('pi, Chudnovsky', cf._cf_pi),
+        ('zeta(3)', lambda: cf.series((-1, -1), (2, 4), 5, (4, 12, 12, 4))),
+        ('J0(1)', lambda: cf.series(-1, (0, 0, 4))),
+    ]
+    for name, constant in constants:
+        times = []
+        for count in counts:
+            start_time = clock()
+            x = constant()
+            for i in xrange(count):
+                x.pq(i)
+            times.append('%8.3f s' % (clock() - start_time))
+        print '%-15s %s' % (name, ', '.join(times))
+
+def bench_gcf(counts=(1000, 10000)):
+    """Compare cf.gcf, one term at a time and in blocks, with the
+    former state machine for 4/pi."""
+
+    for count in counts:
+        times = []
+        for block in 1, 8, 64:
+            start_time = clock()
+            x = cf.gcf(lambda n: n*n, lambda n: 2*n + 1, block)
+            for i in xrange(count):
+                x.pq(i)
+            times.append('%8.3f s' % (clock() - start_time))
+        start_time = clock()
+        pq = legacy_pi().next
+        for i in xrange(count):
+            pq()
+        print ('4/pi %6d partial quotients: %8.3f s by hand, '
+               'blocks of 1, 8, 64: %s' % (count, clock() - start_time,
+                                           ', '.join(times)))
+
+def bench_root(counts=(100, 1000, 10000), legacy_limit=1000):
+    """Compare cf.root and rational exponents with the former
+    exp(log(x)*p/q), for rational and irrational x."""
+
+    cases = [
+        ('2**(1/3)', lambda: cf.cf(2)**cf.cf(1, 3),
+         lambda: cf.exp(cf.log(cf.cf(2))/3)),
+        ('(22/7)**(3/5)', lambda: cf.cf(22, 7)**cf.cf(3, 5),
+         lambda: cf.exp(cf.log(cf.cf(22, 7))*3/5)),
+        ('16**0.25', lambda: cf.cf(16)**0.25,
+         lambda: cf.exp(cf.log(cf.cf(16))*0.25)),
+        ('pi**(1/3)', lambda: cf.pi**cf.cf(1, 3),
+         lambda: cf.exp(cf.log(cf.pi)/3)),
+    ]
+    for name, after, before in cases:
+        for count in counts:
+            start_time = clock()
+            x = after()
+            for i in xrange(count):
+                if x.pq(i) is None:
+                    break
+            after_time = clock() - start_time
+            if count <= legacy_limit:
+                start_time = clock()
+                x = before()
+                for i in xrange(count):
+                    if x.pq(i) is None:
+                        break
+                before_time = '%8.3f s' % (clock() - start_time)
+            else:
+                before_time = '%8s  ' % '-'
+            print '%-14s %6d partial quotients: %s before, %8.3f s after' % (
+                name, count, before_time, after_time)
+
+def bench_sqrt_rational(counts=(1000, 10000, 100000)):
+    """Time the periodic square roots of rationals, next to the kth
+    root enclosure for k == 2, and Ron Graham's sum of 18 square
+    roots from the demo."""
+
+    for name, p, q in ('sqrt(2)', 2, 1), ('sqrt(22/7)', 22, 7):
+        for count in counts:
+            times = []
+            for x in cf.sqrt(cf.cf(p, q)), cf._cf_root_ratio(p, q, 2):
+                start_time = clock()
+                for i in xrange(count):
+                    x.pq(i)
+                times.append(clock() - start_time)
+            print ('%-10s %6d partial quotients: %8.3f s periodic, '
+                   '%8.3f s root' % ((name, count) + tuple(times)))
+    start_time = clock()
+    sqrt = cf.sqrt
+    x = ((sqrt(1000001) + sqrt(1000025) + sqrt(1000031) + sqrt(1000084) +
+          sqrt(1000087) + sqrt(1000134) + sqrt(1000158) + sqrt(1000182) +
+          sqrt(1000198)) -
+         (sqrt(1000002) + sqrt(1000018) + sqrt(1000042) + sqrt(1000066) +
+          sqrt(1000113) + sqrt(1000116) + sqrt(1000169) + sqrt(1000175) +
+          sqrt(1000199)))
+    str(x)
+    print 'Graham\'s sum: %.3f s' % (clock() - start_time)
+
+def bench_root_stream(counts=(1000, 3000, 10000)):
+    """Time the roots of irrational numbers, which the functions
+    calling sqrt() depend on."""
+
+    cases = [
+        ('sqrt(pi)', lambda: cf.sqrt(cf.pi)),
+        ('root(pi, 3)', lambda: cf.root(cf.pi, 3)),
+        ('hypot(e, pi)', lambda: cf.hypot(cf.e, cf.pi)),
+        ('asinh(pi)', lambda: cf.asinh(cf.pi)),
+    ]
+    for name, constant in cases:
+        times = []
+        for count in counts:
+            start_time = clock()
+            x = constant()
+            for i in xrange(count):
+                x.pq(i)
+            times.append('%8.3f s' % (clock() - start_time))
+        print '%-12s %s' % (name, ', '.join(times))
+
+def bench_quadratic(repeat=100):
+    """Time identities between quadratic irrationals, which are
+    decided exactly."""
+
+    sqrt = cf.sqrt
+    cases = [
+        ('(1 - sqrt(2))*(1 + sqrt(2))',
+         lambda: str((1 - sqrt(2))*(1 + sqrt(2)))),
+        ('sqrt(2)**2', lambda: str(sqrt(2)**2)),
+        ('sqrt(5 + 2*sqrt(6)) == sqrt(2) + sqrt(3)',
+         lambda: sqrt(5 + 2*sqrt(6)) == sqrt(2) + sqrt(3)),
+        ('g**20 - 6765*g == 4181',
+         lambda: ((1 + sqrt(5))/2)**20 - 6765*(1 + sqrt(5))/2 == 4181),
+        ('sqrt(2)*sqrt(3) == sqrt(6)', lambda: sqrt(2)*sqrt(3) == sqrt(6)),
+    ]
+    for name, case in cases:
+        start_time = clock()
+        for i in xrange(repeat):
+            case()
+        print '%-42s %8.3f ms' % (name, (clock() - start_time)*1000/repeat)
+
+def bench_folding(repeat=10):
+    """Compare arithmetic on rationals and floats with the folding
+    of constants in unop() and binop() and without it."""
+
+    def float_sum():
+        total = cf.cf(0)
+        for i in xrange(1, 201):
+            total += 1.0/i
+        return str(total)
+    cases = [
+        ('str(cf(3, 7)**100)', lambda: str(cf.cf(3, 7)**100)),
+        ('cf(22, 7)*2/2 == cf(22, 7)',
+         lambda: cf.cf(22, 7)*2/2 == cf.cf(22, 7)),
+        ('str(sum of 200 floats)', float_sum),
+        ('float((cf(1, 3) + 0.25)*7 - 1)',
+         lambda: float((cf.cf(1, 3) + 0.25)*7 - 1)),
+    ]
+    for name, case in cases:
+        times = []
+        for bits in -1, 4096:
+            cf.set_cf_parameter('fold_bits', bits)
+            start_time = clock()
+            for i in xrange(repeat):
+                case()
+            times.append((clock() - start_time)*1000/repeat)
+        print '%-32s %9.3f ms lazy, %9.3f ms folded' % ((name,) + tuple(times))
+    start_time = clock()
+    cf.cf(3**300000, 2**475000 + 1) + cf.cf(1, 5**200000 + 7)
+    print '%-32s %9.3f ms' % ('constructing long operands',
+                               (clock() - start_time)*1000)
+
+def bench_simplify(repeat=5):
+    """Compare the identities among the examples in cf.py's __main__
+    and a few more with the simplification at construction and
+    without it; see simplify_nodes."""
+
+    e, pi = cf.e, cf.pi
+    cases = [
+        ('e - e', lambda: str(e - e)),
+        ('pi/pi', lambda: str(pi/pi)),
+        ('pi*1/pi', lambda: str(pi*1/pi)),
+        ('tan(pi/4)', lambda: str(cf.tan(pi/4))),
+        ('degrees(2*pi)', lambda: str(cf.degrees(2*pi))),
+        ('radians(360)/pi', lambda: str(cf.radians(360)/pi)),
+        ('exp(log(pi))', lambda: str(cf.exp(cf.log(pi)))),
+        ('log(exp(pi))', lambda: str(cf.log(cf.exp(pi)))),
+        ('tan(atan(pi))', lambda: str(cf.tan(cf.atan(pi)))),
+        ('cbrt(pi)**3', lambda: str(cf.root(pi, 3)**3)),
+    ]
+    for name, case in cases:
+        times = []
+        for simplify in 0, 1:
+            cf.set_cf_parameter('simplify_nodes', simplify)
+            start_time = clock()
+            for i in xrange(repeat):
+                case()
+            times.append((clock() - start_time)*1000/repeat)
+        print '%-16s %9.3f ms as is, %9.3f ms simplified' % ((name,) +
+                                                             tuple(times))
+
+benchmarks = [
+    ('memory', bench_memory),
+    ('interning', bench_interning),
+    ('fusion', bench_fusion),
+    ('blocks', bench_blocks),
+    ('renormalise', bench_renormalise),
+    ('to_decimal', bench_to_decimal),
+    ('chunks', bench_chunks),
+    ('float', bench_float),
+    ('construction', bench_construction),
+    ('hgcd', bench_hgcd),
+    ('evaluate_many', bench_evaluate_many),
+    ('pickle', bench_pickle),
+    ('constant_store', bench_constant_store),
+    ('pi', bench_pi),
+    ('exp_rational', bench_exp_rational),
+    ('atan_rational', bench_atan_rational),
+    ('log_rational', bench_log_rational),
+    ('series', bench_series),
+    ('gcf', bench_gcf),
+    ('root', bench_root),
+    ('sqrt_rational', bench_sqrt_rational),
+    ('root_stream', bench_root_stream),
+    ('quadratic', bench_quadratic),
+    ('folding', bench_folding),
+    ('simplify', bench_simplify),
+]
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or [name for name, function in benchmarks]
+    for name, function in benchmarks:
+        if name in names:
+            print '%s:' % name
+            start_time = clock()
+            function()
+            print 'time: %.3f s' % (clock() - start_time)
+            print
@@ -26,7 +26,6 @@ Changed by Adam Przybyla <adam@ertel.com.pl> 07.09.2011
 
 # TODO:
 # Check IEEE-754 about NaNs - when to signal them?
-# Maybe use __slots__.
 # Maybe make the transcendental functions (and __cmp__())
 # work when we feed them with non-positive partial quotients
 # or the last partial quotient equal one. If done, fix also
@@ -37,14 +36,18 @@ Changed by Adam Przybyla <adam@ertel.com.pl> 07.09.2011
 # If we're using Python 2.2, then enable generators and override
 # int() with long(). No effect in Python version 2.3 and later.
 from __future__ import generators
+import os
 import sys
+import weakref
+from array import array
+from operator import truediv
 try:
     int(sys.maxint+1)
 except OverflowError:
     int = long
 
 max_iters = 100
-# The global variable max_iters is used in two places
+# The global variable max_iters is used in three places
 # to limit the number of iterations when the result of
 # an operation probably has a finite continued fraction
 # while the arguments probably have infinite continued
@@ -62,6 +65,11 @@ max_iters = 100
 #   If the __cmp__() method consumes max_iters/2 equal partial
 # quotients of each argument, then it decides that the two
 # numbers are equal.
+#   If the enclosures of a _cf_enclosure, such as root() or series(),
+# gain more than 4*max_iters bits of precision with unchanging,
+# differing by one lower and upper bounds for the next partial
+# quotient, or with an infinite upper bound, then it likewise outputs
+# the upper bound, followed by None.
 #   The _cf_homographic() function needs 81 iterations to decide
 # that (math.sqrt(5) - 1)/2 - (cf.sqrt(5) - 1)/2 > 0; the
 # __cmp__() method needs 39 == 78/2 iterations to find out that
@@ -164,12 +172,330 @@ scientific_notation_threshold = 4
 # The number of partial quotients output by repr().
 repr_pqs = 17
 
+# If intern_nodes is true, then binop(), unop(), exp() and the tangent
+# node underlying tan(), sin() and cos() return an existing live node
+# instead of creating a new one, when the operands are the same objects,
+# or equal rationals for exp() and the tangent node, and the
+# coefficients are the same up to a common factor. Common
+# subexpressions then share one cache of partial quotients. The table
+# of interned nodes refers to the nodes and to their operands weakly,
+# so it doesn't keep anything alive. intern_stats() returns the number
+# of hits and misses.
+intern_nodes = 0
+
+# If fuse_nodes is true, then unop() and binop() fold a unop operand
+# that is still being computed into their own coefficients, and unop()
+# applied to such a binop returns a single binop. A chain of homographic
+# operations such as (2*x + 3)/5 - 1 then becomes a single node, and
+# each partial quotient of x passes through a single generator.
+fuse_nodes = 1
+
+# If ingest_block is greater than 1, then binop() and unop() ingest
+# that many partial quotients of an operand at a time, multiplying in
+# their product matrix, and check whether they can emit a partial
+# quotient only after each block. This pays off when many partial
+# quotients of the operands are needed per partial quotient of the
+# result, as with large partial quotients and near-rational results.
+# The max_iters heuristic then counts every partial quotient of a
+# block, but only checks after whole blocks, so it may take up to
+# ingest_block - 1 more of them before it cuts a continued fraction
+# short. The default of 1 ingests one partial quotient at a time.
+ingest_block = 1
+
+# The Gosper engines (binop(), unop() and digits()) look at the bit
+# length of their coefficients after every renormalise_period ingested
+# partial quotients. Once it exceeds a limit, which starts at
+# renormalise_bits, they divide the coefficients by their gcd and
+# double the limit, so that a common factor can't make them grow
+# without bound, while the cost of the gcd's stays small compared
+# with that of the arithmetic on the coefficients.
+renormalise_bits = 256
+renormalise_period = 64
+
+# The partial quotients of rationals whose denominators are longer
+# than hgcd_threshold bits come from the half-gcd algorithm instead
+# of Euclid's algorithm. The threshold is the bit length below which
+# the latter wins, due to the overhead of the former in Python.
+hgcd_threshold = 1024
+
+# unop() and binop() fold rational operands into their coefficients
+# at construction, and return rational results as plain cf's, as long
+# as the operands are at most fold_bits bits long. Longer ones stay
+# lazy, so that e.g. cf(2)**10**10 costs nothing until its partial
+# quotients are needed, and reducing the result to lowest terms
+# with Euclid's algorithm, which takes time quadratic in its length,
+# stays cheap. Setting fold_bits to -1 disables the folding.
+fold_bits = 4096
+
+# If simplify_nodes is true, then the constructors return the values
+# of a few expressions known without computing any partial quotients,
+# which would otherwise take max_iters partial quotients of the
+# operands before the heuristic decided that the result is rational.
+# binop() and unop() return constants when the operand cancels out,
+# as in x - x, x/x or 2*x/x, and binop() of an operand with itself
+# that is linear in it becomes a unop(). exp() and log() undo each
+# other, as do tan() and atan(), tan() knows the odd multiples of
+# pi/4, and the kth root of x raised to a multiple of k is a power
+# of x.
+simplify_nodes = 1
+
+# Raising a number to a rational power p/q, for q up to
+# root_max_degree, computes the qth root of its pth power, or the
+# pth power of its qth root, instead of exp(p/q*log(x)). The cost of
+# a qth root grows with q, so larger denominators, such as those of
+# most floats, still take the detour through exp() and log().
+root_max_degree = 64
+
+# If track_coefficient_bits is true, then binop() and unop() record
+# the maximal bit length of the coefficients of each new node after
+# every ingested partial quotient, and coefficient_bits(x) reports it.
+# This slows the computation down and is meant for diagnostics only.
+track_coefficient_bits = 0
+
+# If constant_store names a directory, then the module constants pi,
+# half_pi, quarter_pi, log_of_2, log_of_10 and the powers e**(2**n)
+# used by exp() and log() start with the partial quotients stored
+# there in previous runs, read into their caches at their first use,
+# and resume their computation after the stored depth. At exit,
+# save_constants() extends the store with the partial quotients
+# computed in this run. A constant is stored once something has asked
+# for its partial quotients; e.g. the functions of rational arguments
+# sum their series directly and don't touch log_of_2 or e**(2**n).
+# The default is taken from the environment variable CF_CACHE_DIR,
+# since the constants are created on import.
+constant_store = os.environ.get('CF_CACHE_DIR')
+
 def set_cf_parameter(name, value):
     """Sets the global variable with a given name to the
     given value. Useful if you do 'from cf import *'."""
 
     globals()[name] = value
 
+# Partial quotients are cached in arrays of machine words. A partial
+# quotient that doesn't fit in a machine word, and the None that ends
+# a finite continued fraction, is replaced in the array by the marker
+# _cf_spilled and kept in the dictionary self.spill, keyed by index.
+# So is a partial quotient equal to the marker itself.
+_cf_spilled = -sys.maxint - 1
+
+def _cf_lookup(x, n):
+    """Return the nth cached partial quotient of x."""
+
+    t = x.cache[n]
+    if t == _cf_spilled:
+        return x.spill[n]
+    return t
+
+def _cf_store(x, t):
+    """Append the partial quotient t to the cache of x."""
+
+    cache = x.cache
+    if t != _cf_spilled:
+        try:
+            cache.append(t)
+            return
+        except (OverflowError, TypeError):
+            pass
+    if x.spill is None:
+        x.spill = {}
+    x.spill[len(cache)] = t
+    cache.append(_cf_spilled)
+
+def _cf_gcd(x, y):
+    """Return the non-negative gcd of x and y."""
+
+    while y:
+        x, y = y, x%y
+    return abs(x)
+
+def _cf_normalize(coefficients):
+    """Return the tuple of coefficients divided by their gcd,
+    with the sign chosen so that the first nonzero one is positive."""
+
+    divisor = 0
+    for t in coefficients:
+        divisor = _cf_gcd(divisor, t)
+        if divisor == 1:
+            break
+    if not divisor:
+        return tuple(coefficients)
+    for t in coefficients:
+        if t:
+            if t < 0:
+                divisor = -divisor
+            break
+    return tuple([t//divisor for t in coefficients])
+
+# Maps keys (class, id(operand),..., coefficients) to tuples of weak
+# references to the interned node and to its operands. An entry is
+# removed as soon as any of them dies, so the ids in the key can't be
+# reused by other objects while the entry exists. Rational operands
+# of exp() and of the tangent node are keyed by their value instead;
+# see _cf_operand_key().
+_cf_intern_table = {}
+# The numbers of hits and misses of the table.
+_cf_intern_counts = [0, 0]
+
+def _cf_interned(key):
+    """Return the live node interned under key, or None."""
+
+    entry = _cf_intern_table.get(key)
+    if entry is not None:
+        node = entry[0]()
+        if node is not None:
+            _cf_intern_counts[0] += 1
+            return node
+    _cf_intern_counts[1] += 1
+    return None
+
+def _cf_intern(key, node, operands):
+    """Intern node under key for as long as node
+    and all its operands are alive."""
+
+    def discard(ref):
+        if _cf_intern_table.get(key) is entry:
+            del _cf_intern_table[key]
+    entry = tuple([weakref.ref(x, discard) for x in (node,) + operands])
+    _cf_intern_table[key] = entry
+
+def _cf_operand_key(x):
+    """Return a tuple (key, operands) identifying the operand x in
+    the key of an interned node. A rational is identified by its value,
+    so that equal rationals created anew share the node, and anything
+    else by its id, which _cf_intern() must then guard by a weak
+    reference to x, passed in operands."""
+
+    ratio = _cf_rational(x)
+    if ratio is not None:
+        return ratio, ()
+    return id(x), (x,)
+
+def intern_stats():
+    """Return a tuple (hits, misses) counting the lookups
+    of the table of interned nodes; see intern_nodes."""
+
+    return tuple(_cf_intern_counts)
+
+# Maps id(y) to tuples (weak reference to y, name, x) for the results
+# y of the injective functions exp(), log() and atan() of x, so that
+# log(), exp() and tan() can return x itself; see simplify_nodes.
+# An entry is removed as soon as y dies, so the id in the key can't be
+# reused by other objects while the entry exists.
+_cf_inverse_table = {}
+
+def _cf_remember(y, name, x):
+    """Record that y is the function name of x, and return y."""
+
+    if simplify_nodes and isinstance(y, cf_base) and (y is not NaN):
+        key = id(y)
+        # The module globals may be gone when y dies at exit.
+        table = _cf_inverse_table
+        def discard(ref):
+            if table.get(key) is entry:
+                del table[key]
+        entry = (weakref.ref(y, discard), name, x)
+        table[key] = entry
+    return y
+
+def _cf_inverse(y, name):
+    """Return x if y is known to be the function name of x,
+    or None."""
+
+    entry = _cf_inverse_table.get(id(y))
+    if (entry is not None) and (entry[0]() is y) and (entry[1] == name):
+        return entry[2]
+    return None
+
+# Maps the ids of nodes created with track_coefficient_bits set to
+# pairs (weak reference to the node, [maximal bit length]).
+_cf_coefficient_bits = {}
+
+def _cf_track_bits(node):
+    """Return the list in which the engine of node should
+    record the maximal bit length of its coefficients."""
+
+    def discard(ref):
+        if _cf_coefficient_bits.get(key, (None,))[0] is ref:
+            del _cf_coefficient_bits[key]
+    key = id(node)
+    bits = [0]
+    _cf_coefficient_bits[key] = (weakref.ref(node, discard), bits)
+    return bits
+
+def coefficient_bits(x):
+    """Return the maximal bit length of the coefficients seen so far
+    by the engine of x, or None if x wasn't created with
+    track_coefficient_bits set."""
+
+    entry = _cf_coefficient_bits.get(id(x))
+    if entry is None or entry[0]() is not x:
+        return None
+    return entry[1][0]
+
+def _cf_renormalise(coefficients, limit, bits):
+    """Return the coefficients of a Gosper engine, divided by
+    their gcd if their bit length exceeds limit, and the next limit.
+    Record the bit length in bits[0] unless bits is None."""
+
+    size = 0
+    for t in coefficients:
+        if t < 0:
+            t = -t
+        if t > size:
+            size = t
+    size = size.bit_length()
+    if bits is not None and size > bits[0]:
+        bits[0] = size
+    if size <= limit:
+        return coefficients, limit
+    return _cf_normalize(coefficients), 2*size
+
+# The names of the constants that are pickled by reference,
+# as the code of this module checks for some of them with 'is'.
+_cf_pickled_by_name = ('NaN', 'zero', 'one', 'e')
+
+def _cf_reconstruct(cls):
+    """Return a blank instance of cls, to be filled by __setstate__();
+    used in unpickling."""
+
+    return object.__new__(cls)
+
+def _cf_resumed(x, numerator, denominator):
+    """Given the coefficients of the numerator and the denominator
+    of a function that equals x, return those of the function that
+    equals the complete quotient of x after its cached partial
+    quotients."""
+
+    # x == (p*x' + r)/(q*x' + s), so x' == (s*x - r)/(p - q*x).
+    n = len(x.cache)
+    p, q, r, s = _cf_product([_cf_lookup(x, i) for i in xrange(n)], 0, n)
+    return ([s*t - r*u for t, u in zip(numerator, denominator)],
+        [p*u - q*t for t, u in zip(numerator, denominator)])
+
+def _cf_skip(next_pq, n):
+    """Generate the partial quotients returned by next_pq
+    after skipping the first n of them."""
+
+    for i in xrange(n):
+        next_pq()
+    while 1:
+        yield next_pq()
+
+def _cf_ingest_limit(node, *operands):
+    """Return the number of partial quotients of the operands
+    that the checkpoint of node may ingest before it gives up."""
+
+    # Operands that compute their partial quotients with closures
+    # have no cache; count on the engine of node to have ingested
+    # at most about twice as many of them as it has output.
+    limit = max(max_iters, 0)
+    for x in operands:
+        if hasattr(x, 'cache'):
+            limit += len(x.cache)
+        else:
+            limit += 2*len(node.cache)
+    return limit
+
 class cf_base(object):
 #class cf_base(float):
     """The abstract base class for continued fractions.
@@ -192,7 +518,12 @@ class cf_base(object):
     x = cf(x) in the code of this module and a peculiar behaviour
     of Python 2.2's __new__(). See
     http://sourceforge.net/tracker/index.php?func=detail&aid=537450&group_id=5470&atid=105470
-    and the comment in cf.__new__() below."""
+    and the comment in cf.__new__() below.
+
+    Derived classes should declare __slots__, since expressions
+    can consist of very many nodes."""
+
+    __slots__ = ('__weakref__',)
 
     def pq(self, n):
         """Returns the nth partial quotient of self.
@@ -201,69 +532,110 @@ class cf_base(object):
         that generate them with a stateful generator.
         The self.next_pq field must be set to the generator's
         next() method; the self.cache field must be set to an
-        initially empty list."""
+        initially empty array('l') and the self.spill field
+        to None."""
 
         self_cache = self.cache
         if n < len(self_cache):
-            return self_cache[n]
+            t = self_cache[n]
+            if t == _cf_spilled:
+                return self.spill[n]
+            return t
         t = self.next_pq()
-        self_cache.append(t)
+        if t == _cf_spilled:
+            _cf_store(self, t)
+        else:
+            try:
+                self_cache.append(t)
+            except (OverflowError, TypeError):
+                _cf_store(self, t)
         if t is None:
-            # Allow the gc'ing of whatever contributed to self.
-            del self.next_pq
+            self._finish()
         return t
 
+    def _finish(self):
+        """Called by pq() after the generator self.next_pq
+        has signalled the end of the continued fraction."""
+
+        # Allow the gc'ing of whatever contributed to self.
+        del self.next_pq
+
+    def __reduce_ex__(self, protocol):
+        """Support pickling. The state of a node consists of its
+        slots, so that pickling a node pickles the whole expression
+        with the cached partial quotients of all its nodes. The
+        generator in self.next_pq is replaced by self._checkpoint(),
+        from which self._resume() creates a generator that goes on
+        after the cached partial quotients. Nodes that compute their
+        partial quotients with closures are pickled as the callable
+        and the arguments returned by self._arguments() instead."""
+
+        for name in _cf_pickled_by_name:
+            if globals()[name] is self:
+                return name
+        if hasattr(self, '_arguments'):
+            return self._arguments()
+        state = {}
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if name != '__weakref__' and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        if 'next_pq' in state:
+            state['next_pq'] = self._checkpoint()
+        return _cf_reconstruct, (type(self),), state
+
+    def __setstate__(self, state):
+        """Restore the slots pickled by __reduce_ex__()."""
+
+        for name, value in state.iteritems():
+            if name != 'next_pq':
+                setattr(self, name, value)
+        if 'next_pq' in state:
+            self.next_pq = self._resume(*state['next_pq'])
+
     def __str__(self):
         """Return a string representation of self: 'NaN',
         '-?[0-9]+\.[0-9]*' or '-?[1-9]\.[0-9]*e-[1-9][0-9]*'.
         Does not append excess zeroes to the fractional part."""
 
-        get_digit = digits(self).next
+        get_digits = _cf_digit_strings(self).next
         try:
-            integer_part = get_digit()
+            integer_part = get_digits()
             if integer_part < 0:
                 return '-' + str(-self)
-            else:
-                # Don't use self.pq(0) as the integer part,
-                # because e.g. cf((1, 0, -2)) == -1.
-                # The digits() function handles non-initial
-                # non-positive partial-quotients properly.
-                digit_list = [str(integer_part), '.']
         except StopIteration:
             return 'NaN'
-        only_zeroes = (integer_part == 0)
-        initial_zeroes = 0
+        # Don't use self.pq(0) as the integer part,
+        # because e.g. cf((1, 0, -2)) == -1.
+        # The digits() function handles non-initial
+        # non-positive partial-quotients properly.
+        fraction = ''
         try:
-            for i in xrange(decimal_digits):
-                digit = get_digit()
-                if only_zeroes:
-                    if digit == 0:
-                        initial_zeroes += 1
-                    else:
-                        only_zeroes = 0
-                digit_list.append(str(digit))
+            while len(fraction) < decimal_digits:
+                fraction += get_digits()
         except StopIteration:
             pass
+        if integer_part == 0:
+            leading = fraction[:decimal_digits]
+            initial_zeroes = len(leading) - len(leading.lstrip('0'))
+        else:
+            initial_zeroes = 0
         if initial_zeroes//scientific_notation_threshold < 1:
-            return ''.join(digit_list)
+            return str(integer_part) + '.' + fraction[:decimal_digits]
 
         # Get more digits, until accumulate decimal_digits
         # of them after the initial zeroes.
         try:
-            while i < initial_zeroes + decimal_digits:
-                digit = get_digit()
-                if only_zeroes:
-                    if digit == 0:
-                        initial_zeroes += 1
-                    else:
-                        only_zeroes = 0
-                digit_list.append(str(digit))
-                i += 1
+            while 1:
+                initial_zeroes = len(fraction) - len(fraction.lstrip('0'))
+                if len(fraction) > initial_zeroes + decimal_digits:
+                    break
+                fraction += get_digits()
         except StopIteration:
             pass
-        return ''.join([digit_list[initial_zeroes + 2], '.'] +
-            digit_list[initial_zeroes + 3:] +
-            ['e-', str(initial_zeroes + 1)])
+        return ''.join([fraction[initial_zeroes], '.',
+            fraction[initial_zeroes + 1:initial_zeroes + decimal_digits + 1],
+            'e-', str(initial_zeroes + 1)])
 
     def __repr__(self):
         """Return a printable representation of self's
@@ -450,8 +822,20 @@ class cf_base(object):
         elif self.pq(0) < 0:
             raise (ValueError,
                 'negative number cannot be raised to a fractional power')
-        else:
-            return exp(other*log(self))
+        ratio = _cf_rational(other)
+        if ratio is not None and ratio[1] <= root_max_degree:
+            # Fast track for rational other; see root_max_degree.
+            p, q = ratio
+            base = _cf_rational(self)
+            if base is not None:
+                # Keep the power rational, so that the root
+                # is exact for the powers of rationals.
+                a, b = base
+                if p < 0:
+                    a, b, p = b, a, -p
+                return root(cf(a**p, b**p), q)
+            return _cf_ipow(root(self, q), p)
+        return exp(other*log(self))
 
     def __radd__(self, other):
         """Add self to other."""
@@ -552,31 +936,44 @@ class cf_base(object):
         return long(x.__int__())
 
     def __float__(self):
-        """Convert self to a floating point number."""
-
+        """Convert self to the nearest floating point number.
+        Raises OverflowError if it is too large."""
+
+        # x lies between its last two convergents, so if both round
+        # to the same float, then so does x. Python's true division
+        # of longs is correctly rounded. The bit lengths tell when
+        # the convergents are close enough: abs(p/q - r/s) == 1/(q*s)
+        # is below half an ulp of p/q when p*s has more than 54 bits,
+        # give or take a couple of bits, except for denormals.
         self_pq = self.pq
-        if self_pq(0) is None:
+        p = self_pq(0)
+        if p is None:
             # TODO: find the NaN strings used by various
             # C libraries; do a cascaded try...except on them.
             return float('NaN')
+        q, r, s = 1, 1, 0
+        needed = 58
         n = 1
-        last_num = 1
-        last_den = 0
-        curr_num = self_pq(0)
-        curr_den = 1
-        curr_convergent = float(curr_num)
         pq = self_pq(1)
         while pq is not None:
-            last_num, curr_num, last_den, curr_den = (
-                curr_num, pq*curr_num + last_num,
-                curr_den, pq*curr_den + last_den)
-            last_convergent = curr_convergent
-            curr_convergent = float(curr_num)/float(curr_den)
-            if curr_convergent == last_convergent:
+            if pq <= 0:
+                # See _cf_convergents().
+                for p, q, r, s in _cf_convergents(self):
+                    if s and p.bit_length() + s.bit_length() > needed:
+                        result = truediv(p, q)
+                        if result == truediv(r, s):
+                            return result
+                        needed += 8
                 break
+            p, q, r, s = pq*p + r, pq*q + s, p, q
+            if p.bit_length() + s.bit_length() > needed:
+                result = truediv(p, q)
+                if result == truediv(r, s):
+                    return result
+                needed += 8
             n += 1
             pq = self_pq(n)
-        return curr_convergent
+        return truediv(p, q)
 
     def __complex__(self):
         """Convert self to a complex number."""
@@ -587,6 +984,8 @@ class cf(cf_base):
     """Class for continued fractions constructed from numbers,
     quotients of numbers, or canned partial quotients."""
 
+    __slots__ = ('cache', 'spill', 'next_pq', 'ratio')
+
     def __new__(cls, x, y=None):
         """Construct a continued fraction object.
 
@@ -607,10 +1006,14 @@ class cf(cf_base):
         #if isinstance(x, float) and str(x)=='inf':
 	#		return x
 
-        if isinstance(x, float) and isnan(x):
-			return cf(())
-
-        if isinstance(x, cf_base):
+        if type(x) is float:
+            # Take the commonest case by the shortest way;
+            # see _cf_exact_ratio() for the exceptions.
+            try:
+                p, q = x.as_integer_ratio()
+            except (OverflowError, ValueError):
+                p, q = _cf_exact_ratio(x)
+        elif isinstance(x, cf_base):
             # Be idempotent.
             if y is not None:
                 raise TypeError, 'cf(cf, anything) is invalid'
@@ -618,11 +1021,13 @@ class cf(cf_base):
             # __new__() returns, which will cause all kinds of
             # funny errors if x.__init__() is defined.
             return x
-
-        self = object.__new__(cls)
-        if hasattr(x, '__getitem__'):
+        elif hasattr(x, '__getitem__'):
             # x is sequence-like; if y is not None,
             # it'd better be a sequence, too.
+            # The closure is kept in a slot of its own,
+            # which would shadow cf_base.pq() in cf.
+            self = object.__new__(_cf_sequence)
+            self.sequence = x, y
             def fixed_pqs_closure(n):
                 """First return the partial quotients from x,
                 then from y, then from y, then from y,..."""
@@ -634,29 +1039,915 @@ class cf(cf_base):
             if y is None:
                 y = (None,)
             self.pq = fixed_pqs_closure
+            return self
         else:
             # x is presumably a number; if y is not None,
             # it'd better be a number, too.
-            def ratio(x, y):
-                """Lazily generate subsequent partial quotients
-                of a rational number. Works also fine for ratios,
-                where at least one part is a floating point number."""
-                while y:
-                    x_div_y, x_mod_y = divmod(x, y)
-                    # int() is crucial, because the result of
-                    # division involving at least one float is
-                    # a float, albeit without fractional part.
-                    yield int(x_div_y)
-                    x, y = y, x_mod_y
+            p, q = _cf_exact_ratio(x)
+        if y is not None:
+            r, s = _cf_exact_ratio(y)
+            p, q = p*s, q*r
+            if q < 0:
+                p, q = -p, -q
+        self = object.__new__(cls)
+        self.cache = array('l')
+        self.spill = None
+        self.ratio = p, q
+        self.next_pq = _cf_ratio(p, q).next
+        return self
+
+    def __cmp__(self, other):
+        """Compare self to other, exactly if both are
+        known to be rational; see _cf_rational()."""
+
+        if hasattr(self, 'ratio'):
+            ratio = _cf_rational(other)
+            if self.ratio[1] and ratio is not None:
+                p, q = self.ratio
+                r, s = ratio
+                return cmp(p*s, r*q)
+        return cf_base.__cmp__(self, other)
+
+    def __nonzero__(self):
+        """Return True iff self != 0."""
+
+        if hasattr(self, 'ratio') and self.ratio[1]:
+            return self.ratio[0] != 0
+        return cf_base.__nonzero__(self)
+
+    def __int__(self):
+        """Return an integer equal to self rounded towards zero."""
+
+        if hasattr(self, 'ratio') and self.ratio[1]:
+            p, q = self.ratio
+            if p < 0:
+                return -(-p//q)
+            return p//q
+        return cf_base.__int__(self)
+
+    def __float__(self):
+        """Convert self to the nearest floating point number.
+        Raises OverflowError if it is too large."""
+
+        if hasattr(self, 'ratio') and self.ratio[1]:
+            return truediv(*self.ratio)
+        return cf_base.__float__(self)
+
+    def _checkpoint(self):
+        """Return the remainder (u, v) of self.ratio
+        after the cached partial quotients."""
+
+        p, q = self.ratio
+        (u,), (v,) = _cf_resumed(self, (p,), (q,))
+        if v < 0:
+            u, v = -u, -v
+        return u, v
+
+    def _resume(self, u, v):
+        """Return the generator of the partial quotients
+        of the remainder returned by self._checkpoint()."""
+
+        return _cf_ratio(u, v).next
+
+def _cf_exact_ratio(x):
+    """Return a pair of integers (p, q), q >= 0, such that p/q equals
+    the number x exactly. Infinities give (1, 0) or (-1, 0), NaNs
+    give (0, 0). Knows ints, longs, floats and anything with the
+    numerator and denominator attributes, like fractions.Fraction,
+    or with the as_tuple() method, like decimal.Decimal; converts
+    anything else to float."""
+
+    if isinstance(x, float):
+        try:
+            return x.as_integer_ratio()
+        except OverflowError:
+            if x > 0:
+                return 1, 0
+            return -1, 0
+        except ValueError:
+            return 0, 0
+    try:
+        return x.numerator, x.denominator
+    except AttributeError:
+        pass
+    if hasattr(x, 'as_tuple'):
+        sign, digit_tuple, exponent = x.as_tuple()
+        if not isinstance(exponent, (int, long)):
+            # 'F' for infinities, 'n' or 'N' for NaNs.
+            if exponent != 'F':
+                return 0, 0
+            elif sign:
+                return -1, 0
+            return 1, 0
+        p = int(''.join(map(str, digit_tuple)))
+        if sign:
+            p = -p
+        if exponent >= 0:
+            return p*10**exponent, 1
+        return p, 10**-exponent
+    return _cf_exact_ratio(float(x))
+
+def _cf_rational(x):
+    """Return a pair of integers (p, q), q > 0, such that p/q equals x,
+    if x is known to be a rational number without computing any partial
+    quotients: a finite number as known to _cf_exact_ratio(), a cf made
+    from such numbers, or a continued fraction whose partial quotients
+    are all cached already. Otherwise return None."""
+
+    if isinstance(x, cf_base):
+        if type(x) is cf and hasattr(x, 'ratio'):
+            p, q = x.ratio
+        elif (hasattr(x, 'cache') and not hasattr(x, 'next_pq')
+              and len(x.cache) > 1):
+            n = len(x.cache) - 1
+            if _cf_lookup(x, n) is not None:
+                return None
+            pqs = [_cf_lookup(x, i) for i in xrange(n)]
+            p, q, r, s = _cf_product(pqs, 0, n)
+        else:
+            return None
+    elif (isinstance(x, (int, long, float)) or hasattr(x, 'denominator')
+          or hasattr(x, 'as_tuple')):
+        p, q = _cf_exact_ratio(x)
+    else:
+        return None
+    if not q:
+        # Infinities and NaNs.
+        return None
+    if q < 0:
+        p, q = -p, -q
+    return p, q
+
+def _cf_foldable(x):
+    """Return _cf_rational(x) if it is short enough
+    to fold; see fold_bits."""
+
+    ratio = _cf_rational(x)
+    if ratio is None:
+        return None
+    p, q = ratio
+    if max(abs(p), q).bit_length() > fold_bits:
+        return None
+    return ratio
+
+def _cf_fraction(p, q):
+    """Return a cf for p/q in lowest terms."""
+
+    divisor = _cf_gcd(p, q)
+    if q < 0:
+        divisor = -divisor
+    if divisor not in (0, 1):
+        p, q = p//divisor, q//divisor
+    return cf(p, q)
+
+def _cf_cancelled(numerator, denominator, x):
+    """Return the constant value of the ratio of two polynomials
+    in x with the given coefficients, if they are proportional and
+    x is not a NaN, or None."""
+
+    for p, q in zip(numerator, denominator):
+        if q:
+            break
+    else:
+        return None
+    for t, u in zip(numerator, denominator):
+        if t*q != u*p:
+            return None
+    if x.pq(0) is None:
+        return None
+    return _cf_fraction(p, q)
+
+def _cf_ratio(p, q):
+    """Lazily generate the partial quotients of p/q,
+    for integers p and q >= 0, followed by None."""
+
+    # Euclid's algorithm takes time quadratic in the length of p and
+    # q, so long ones go through _cf_hgcd(), a chunk at a time. The
+    # chunks come from the leading size bits of p and q, where size
+    # doubles with every chunk, so that the first partial quotients
+    # don't cost much more than with Euclid's algorithm. The first
+    # partial quotient is the floor of p/q, which leaves _cf_hgcd() with
+    # positive operands, the larger one first.
+    if q:
+        t, r = divmod(p, q)
+        yield t
+        p, q = q, r
+    size = hgcd_threshold
+    while q:
+        if q.bit_length() > hgcd_threshold:
+            shift = max(p.bit_length() - size, 0)
+            size *= 2
+            quotients, matrix, u, v = _cf_hgcd(p >> shift, q >> shift)
+            if shift:
+                quotients, matrix, u, v = _cf_hgcd_reduce(
+                    p, q, quotients, matrix)
+            if quotients:
+                for t in quotients:
+                    yield t
+                p, q = u, v
+                continue
+        t, r = divmod(p, q)
+        yield t
+        p, q = q, r
+    yield None
+
+def _cf_hgcd(a, b):
+    """Return a tuple (quotients, (p, q, r, s), u, v) for integers
+    a > b > 0, where quotients is the list of the partial quotients
+    of a/b after the first, up to where the remainder u/v of a/b has
+    roughly half the bit length of a, [[p, r], [q, s]] is the product
+    of the matrices [[t, 1], [1, 0]] for t in quotients, and (a, b) ==
+    [[p, r], [q, s]]*(u, v), u > v > 0. This is the half-gcd
+    algorithm, which takes time O(M(n)*log(n)), where M(n) is the
+    time of multiplying n-bit numbers."""
+
+    half = a.bit_length()//2
+    quotients = []
+    matrix = 1, 0, 0, 1
+    if half > hgcd_threshold:
+        # The partial quotients of the ratio of the leading bits of
+        # a and b are mostly those of a/b; _cf_hgcd_reduce() gets rid
+        # of the few last ones, which might not be. Starting with the
+        # leading half of the bits reduces the bit length of b to
+        # about 3/4 of that of a; the next call reduces it to 1/2.
+        for shift in (half, None):
+            if shift is None:
+                # If the first call didn't get anywhere, e.g.
+                # because of a long common factor, leave it
+                # to Euclid's algorithm below.
+                shift = 2*half - a.bit_length()
+                if shift <= 0:
+                    break
+            if (b >> shift).bit_length() <= (a >> shift).bit_length()//2:
+                continue
+            quotients2, matrix2, u, v = _cf_hgcd(a >> shift, b >> shift)
+            if shift:
+                quotients2, matrix2, u, v = _cf_hgcd_reduce(
+                    a, b, quotients2, matrix2)
+            quotients.extend(quotients2)
+            matrix = _cf_matrix_product(matrix, matrix2)
+            a, b = u, v
+    p, q, r, s = matrix
+    while b.bit_length() > half:
+        t, c = divmod(a, b)
+        if not c:
+            # Leave the last partial quotient to the caller,
+            # so that v stays positive.
+            break
+        quotients.append(t)
+        p, q, r, s = p*t + r, q*t + s, p, q
+        a, b = b, c
+    return quotients, (p, q, r, s), a, b
+
+def _cf_matrix_product(matrix1, matrix2):
+    """Return the product of two matrices represented as in
+    _cf_product()."""
+
+    a, b, c, d = matrix1
+    e, f, g, h = matrix2
+    return a*e + c*f, b*e + d*f, a*g + c*h, b*g + d*h
+
+def _cf_hgcd_reduce(a, b, quotients, matrix):
+    """Return a tuple (quotients, matrix, u, v) like _cf_hgcd(a, b),
+    given candidate partial quotients of a/b and the product of
+    their matrices, e.g. obtained from the leading bits of a and b.
+    Drops the last candidates until u > v > 0, which guarantees
+    that the rest are the partial quotients of a/b."""
+
+    p, q, r, s = matrix
+    # The inverse of [[p, r], [q, s]] is [[s, -r], [-q, p]] divided by
+    # its determinant, which is (-1)**len(quotients).
+    if len(quotients) & 1:
+        u, v = r*b - s*a, q*a - p*b
+    else:
+        u, v = s*a - r*b, p*b - q*a
+    if not u > v > 0:
+        quotients = quotients[:]
+        while not u > v > 0:
+            t = quotients.pop()
+            u, v = t*u + v, u
+            p, q, r, s = r, s, p - t*r, q - t*s
+    return quotients, (p, q, r, s), u, v
+
+def _cf_common_quotients(a, b, c, d, determinant=None):
+    """Return the list of the common leading partial quotients of a/b
+    and c/d, for b, d >= 0, followed by the remainders a', b', c', d'
+    of a/b and c/d after them. The determinant a*d - b*c, if known,
+    saves a long multiplication; its sign doesn't matter."""
+
+    quotients = []
+    # The partial quotients preserve the determinant up to the sign.
+    if determinant is None:
+        determinant = a*d - b*c
+    determinant = abs(determinant).bit_length()
+    while b and d:
+        # The partial quotients agree about as long as the square of
+        # the denominator of the convergent stays below b*d/|a*d - b*c|;
+        # agree is the bit length of that bound.
+        agree = b.bit_length() + d.bit_length() - determinant
+        shift = max(a.bit_length() - agree, 0)
+        if (a > b > 0 and c > d > 0 and agree > 2*hgcd_threshold and
+            b >> shift and (a >> shift) > (b >> shift)):
+            # Take the partial quotients of the leading agree bits of
+            # a/b in bulk and keep those that are also the partial
+            # quotients of c/d. A longer chunk would mostly go to waste
+            # in _cf_hgcd_reduce(), which drops one quotient at a time.
+            chunk, matrix, u, v = _cf_hgcd(a >> shift, b >> shift)
+            if shift:
+                chunk, matrix, u, v = _cf_hgcd_reduce(a, b, chunk, matrix)
+            chunk, matrix, w, x = _cf_hgcd_reduce(c, d, chunk, matrix)
+            if chunk:
+                chunk, matrix, u, v = _cf_hgcd_reduce(a, b, chunk, matrix)
+                quotients.extend(chunk)
+                a, b, c, d = u, v, w, x
+                continue
+        t, r = divmod(a, b)
+        if t != c//d:
+            break
+        quotients.append(t)
+        a, b, c, d = b, r, d, c - d*t
+    return quotients, a, b, c, d
+
+def _cf_round_outwards(enclosure, bits):
+    """Return (a', b', c', d') for an enclosure (a, b, c, d), b, d > 0,
+    of the same kind as _cf_enclosure._enclose() returns, with the
+    denominators shortened to about bits bits, such that a'/b' <= a/b
+    and c/d <= c'/d'."""
+
+    a, b, c, d = enclosure
+    shift = min(b.bit_length(), d.bit_length()) - bits
+    if shift > 0:
+        if a < 0:
+            a, b = a >> shift, b >> shift
+        else:
+            a, b = a >> shift, (b >> shift) + 1
+        if c < 0:
+            c, d = (c >> shift) + 1, (d >> shift) + 1
+        else:
+            c, d = (c >> shift) + 1, d >> shift
+    return a, b, c, d
+
+class _cf_enclosure(cf_base):
+    """Abstract base class for continued fractions of numbers computed
+    as rational enclosures of increasing precision, e.g. by binary
+    splitting of series. Derived classes implement self._enclose(bits),
+    which returns (a, b, c, d), such that b, d > 0, a/b <= self <= c/d
+    and c/d - a/b is about 2**-bits times self. The partial quotients
+    common to a/b and c/d are those of self; each time they run out,
+    the precision doubles."""
+
+    __slots__ = ('cache', 'spill', 'next_pq')
+
+    # The precision of the first enclosure.
+    initial_bits = 128
+
+    def __new__(cls, *args):
+        self = object.__new__(cls)
+        self.cache = array('l')
+        self.spill = None
+        self.next_pq = self._resume()
+        return self
+
+    def _enclosure_generator(self):
+        """Generate the partial quotients of self after those
+        already cached."""
+
+        n = len(self.cache)
+        pqs = [_cf_lookup(self, i) for i in xrange(n)]
+        p, q, r, s = _cf_product(pqs, 0, n)
+        # The partial quotients of a/b and c/d agree up to about a half
+        # of the bit length of c/d - a/b, so the cached ones took twice
+        # as many bits as the denominator of their convergent.
+        bits = max(self.initial_bits, 2*q.bit_length() + 64)
+        # The bits of precision gained while the next partial quotient
+        # stayed undecided between two consecutive integers, or between
+        # an integer and infinity; see max_iters.
+        stalled = 0
+        while 1:
+            # Rounding the ends outwards to bits + 64 bits widens the
+            # enclosure a little, but keeps _cf_common_quotients() from
+            # working on digits beyond its precision.
+            a, b, c, d = _cf_round_outwards(self._enclose(bits), bits + 64)
+            # self == (p*x + r)/(q*x + s), so x == (s*self - r)/(p - q*self).
+            a, b = s*a - r*b, p*b - q*a
+            c, d = s*c - r*d, p*d - q*c
+            if b < 0:
+                a, b = -a, -b
+            if d < 0:
+                c, d = -c, -d
+            quotients, a, b, c, d = _cf_common_quotients(a, b, c, d)
+            for t in quotients:
+                yield t
+            if not (b or d):
+                # The enclosure has shrunk to a rational number.
                 yield None
-            if y is None:
-                y = 1
-            self.cache = []
-            if not isinstance(x,(float,int)):
-                x=float(x)
-            self.next_pq = ratio(x, y).next
+            if quotients:
+                stalled = 0
+            else:
+                # An exactly rational self never leaves this state, as
+                # its enclosures don't shrink to it. As in the Gosper
+                # engines, give up after about as much precision as
+                # max_iters partial quotients carry on the average,
+                # at 1.03 decimal digits each, and end the continued
+                # fraction with the upper bound.
+                if b and d:
+                    lower, upper = sorted((a//b, c//d))
+                    undecided = (upper - lower == 1)
+                else:
+                    upper = None
+                    undecided = 1
+                if undecided:
+                    stalled += bits//2
+                    if 0 <= max_iters and 4*max_iters < stalled:
+                        yield upper
+                        yield None
+                else:
+                    stalled = 0
+            p, q, r, s = _cf_matrix_product((p, q, r, s),
+                _cf_product(quotients, 0, len(quotients)))
+            bits *= 2
+
+    def _checkpoint(self):
+        """The cache is all the state there is."""
+
+        return ()
+
+    def _resume(self):
+        """Return the generator of the partial quotients
+        of self after those already cached."""
+
+        return self._enclosure_generator().next
+
+def _cf_polynomial(coefficients, k):
+    """Return the value at k of the polynomial with
+    the given coefficients, constant term first."""
+
+    result = 0
+    for c in reversed(coefficients):
+        result = result*k + c
+    return result
+
+def _cf_series_split(lo, hi, p, q, a, b):
+    """Return (P, Q, B, T) for the terms lo..hi-1 of the series
+    summed by series(p, q, a, b), so that their sum, with the
+    product of p(j)/q(j) starting at j == lo, is T/(B*Q) and the
+    product of p(j)/q(j) for j == lo..hi-1 is P/Q."""
+
+    if hi - lo == 1:
+        if lo:
+            pk, qk = _cf_polynomial(p, lo), _cf_polynomial(q, lo)
+        else:
+            pk = qk = 1
+        return pk, qk, _cf_polynomial(b, lo), _cf_polynomial(a, lo)*pk
+    middle = (lo + hi)//2
+    p1, q1, b1, t1 = _cf_series_split(lo, middle, p, q, a, b)
+    p2, q2, b2, t2 = _cf_series_split(middle, hi, p, q, a, b)
+    if b == (1,):
+        # Save two multiplications by 1.
+        return p1*p2, q1*q2, 1, q2*t1 + p1*t2
+    return p1*p2, q1*q2, b1*b2, b2*q2*t1 + b1*p1*t2
+
+class series(_cf_enclosure):
+    """Sum of a hypergeometric series,
+    sum(a(k)/b(k)*prod(p(j)/q(j), j=1..k), k=0..inf),
+    for polynomials p, q, a and b with integer coefficients, given as
+    integers or as sequences of coefficients, constant term first.
+    For example, series(1, (0, 1)) is e == sum(1/k!), series((0, 1),
+    (1, 2), 2) is pi == 2*sum(k!/(2*k + 1)!!), series((-1, -1), (2, 4),
+    5, (4, 12, 12, 4)) is zeta(3) == 5/2*sum((-1)**(k - 1)/(k**3*
+    binomial(2*k, k)), k=1..inf), and series(-1, (0, 0, 4)) is the
+    Bessel function J0(1).
+
+    The terms are summed by binary splitting, with the precision
+    doubling whenever the partial quotients run out. The ratio of
+    consecutive terms must tend to a limit below 1 in absolute value;
+    the bound on the tail assumes that beyond the terms summed, the
+    absolute values of the ratios don't exceed the greater of the last
+    one and their limit, which holds for all long enough sums."""
+
+    __slots__ = ('p', 'q', 'a', 'b')
+
+    def __new__(cls, p, q, a=1, b=1):
+        self = _cf_enclosure.__new__(cls)
+        for name, coefficients in ('p', p), ('q', q), ('a', a), ('b', b):
+            if isinstance(coefficients, (int, long)):
+                coefficients = (coefficients,)
+            coefficients = tuple(coefficients)
+            while coefficients and not coefficients[-1]:
+                coefficients = coefficients[:-1]
+            if not coefficients:
+                if name in 'pa':
+                    # A finite series.
+                    coefficients = (0,)
+                else:
+                    raise ZeroDivisionError, 'series with %s == 0' % name
+            setattr(self, name, coefficients)
+        self._limit()
+        return self
+
+    def _limit(self):
+        """Return the limit of the absolute values of the ratios of
+        consecutive terms as a pair of integers (u, v), u < v. Raise
+        ValueError if the series doesn't converge fast enough."""
+
+        p, q = self.p, self.q
+        if len(p) < len(q) or p == (0,):
+            return 0, 1
+        if len(p) == len(q) and abs(p[-1]) < abs(q[-1]):
+            return abs(p[-1]), abs(q[-1])
+        raise ValueError, 'the series must converge geometrically'
+
+    def _terms(self, bits):
+        """Return (n, u, v), such that the sum of the terms n..inf is at
+        most 2**-bits, and u/v < 1 bounds the absolute values of the
+        ratios of the terms n..inf to their predecessors."""
+
+        from fractions import Fraction
+        from math import log
+        p, q, a, b = self.p, self.q, self.a, self.b
+        limit = Fraction(*self._limit())
+        polynomial = _cf_polynomial
+        log2 = lambda x: log(abs(x), 2)
+        k = 1
+        a0 = polynomial(a, 0)
+        b0 = polynomial(b, 0)
+        # log2(abs(prod(p(j)/q(j), j=1..k-1))).
+        log_product = 0.0
+        while 1:
+            pk, qk = polynomial(p, k), polynomial(q, k)
+            ak, bk = polynomial(a, k), polynomial(b, k)
+            if not (qk and bk):
+                raise ZeroDivisionError, 'series with q(%d)*b(%d) == 0' % (
+                    k, k)
+            if not pk:
+                # The terms from k on vanish.
+                return k, 0, 1
+            if (a0 and ak and
+                log_product + log2(a0) - log2(b0) < -bits - 16):
+                ratio = max(Fraction(abs(pk*ak*b0), abs(qk*a0*bk)), limit)
+                if ratio <= (1 + limit)/2:
+                    return k, ratio.numerator, ratio.denominator
+            log_product += log2(pk) - log2(qk)
+            a0, b0 = ak, bk
+            k += 1
+
+    def _enclose(self, bits):
+        """Return (a, b, c, d), such that a/b <= self <= c/d."""
+
+        n, u, v = self._terms(bits)
+        p, q, b, t = _cf_series_split(0, n, self.p, self.q, self.a, self.b)
+        d = b*q
+        if d < 0:
+            t, d = -t, -d
+        if not u:
+            return t, d, t, d
+        # The tail is at most abs(the term n-1)*u/(v - u), which
+        # is rounded up, like the sum is rounded outwards, to keep
+        # the numbers short.
+        e = abs(_cf_polynomial(self.a, n - 1)*p)*u
+        f = abs(_cf_polynomial(self.b, n - 1)*q)*(v - u)
+        shift = f.bit_length() - bits - 64
+        if shift > 0:
+            e, f = (e >> shift) + 1, f >> shift
+        a, b, c, d = _cf_round_outwards((t, d, t, d), bits + 64)
+        return a*f - e*b, b*f, c*f + e*d, d*f
+
+def _cf_gcf_term(terms, n, first):
+    """Return the nth term of a generalized continued fraction, given
+    as a function of n or as a sequence starting with the term first,
+    or None after the last term."""
+
+    if callable(terms):
+        return terms(n)
+    try:
+        return terms[n - first]
+    except IndexError:
+        return None
+
+def _cf_gcf_product(terms, lo, hi):
+    """Return (p, q, r, s), where [[p, r], [q, s]] is the product of
+    the matrices [[b, a], [1, 0]] for the pairs (b, a) in terms[lo:hi],
+    like _cf_product() does for partial quotients."""
+
+    if hi - lo <= 16:
+        p, q, r, s = 1, 0, 0, 1
+        for b, a in terms[lo:hi]:
+            p, q, r, s = p*b + r, q*b + s, p*a, q*a
+        return p, q, r, s
+    middle = (lo + hi)//2
+    return _cf_matrix_product(_cf_gcf_product(terms, lo, middle),
+                              _cf_gcf_product(terms, middle, hi))
+
+class gcf(cf_base):
+    """Generalized continued fraction
+    b(0) + a(1)/(b(1) + a(2)/(b(2) + a(3)/(b(3) + ...))),
+    for integers a(n) and b(n), given as functions of n or as
+    sequences, a starting with a(1) and b with b(0). The fraction ends
+    at the end of either sequence, at the first None returned by
+    either function or at the first a(n) == 0; a missing a(n) counts
+    as 0 and a missing b(n) as infinite. For example,
+    gcf(lambda n: n*n, lambda n: 2*n + 1) is 4/pi,
+    gcf(lambda n: n > 1 and -1 or 1, lambda n: n > 1 and 2*n + 1 or
+    n + 1) is tan(1) == 1 + 1/(2 - 1/(5 - 1/(7 - ...))) and
+    gcf(lambda n: (n//2)**2 or 1, range(100000)) is log(2) to about
+    60000 digits.
+
+    The tails b(n) + a(n + 1)/(b(n + 1) + ...) must be at least 1 for
+    n >= 1, as they are when the a(n)'s are positive and the b(n)'s
+    at least 1, and for many classical fractions whose a(n)'s are
+    negative, once the first few terms are folded into b(0). The
+    terms are ingested block at a time, by default ingest_block,
+    multiplying in the product of their matrices, before the partial
+    quotients common to the ends of the enclosure are emitted in bulk.
+    Larger blocks pay off when many terms are needed per partial
+    quotient. The coefficients are divided by their gcd as binop()
+    and unop() do it; see renormalise_bits."""
+
+    __slots__ = ('a', 'b', 'block', 'cache', 'spill', 'next_pq')
+
+    def __new__(cls, a, b, block=None):
+        self = object.__new__(cls)
+        self.a = a
+        self.b = b
+        self.block = block or ingest_block
+        self.cache = array('l')
+        self.spill = None
+        self.next_pq = self._resume()
         return self
 
+    def _gcf_generator(self):
+        """Generate the partial quotients of self."""
+
+        a, b, block = self.a, self.b, self.block
+        term = _cf_gcf_term
+        n = 0
+        # self == (p*t + r)/(q*t + s) for the tail t >= 1, so that self
+        # lies between p/q and (p + r)/(q + s) unless q*t + s changes
+        # its sign.
+        p, q, r, s = 1, 0, 0, 1
+        # The determinant p*s - q*r, up to the sign.
+        determinant = 1
+        limit = renormalise_bits
+        renormalise_left = renormalise_period
+        while 1:
+            terms = []
+            end = None
+            for n in xrange(n, n + block):
+                bn = term(b, n, 0)
+                if bn is None:
+                    # The tail is infinite.
+                    end = 1, 0
+                    break
+                an = term(a, n + 1, 1)
+                if not an:
+                    # The tail is bn.
+                    end = bn, 1
+                    break
+                terms.append((bn, an))
+                determinant *= an
+            else:
+                n += 1
+            p, q, r, s = _cf_matrix_product((p, q, r, s),
+                _cf_gcf_product(terms, 0, len(terms)))
+            if end is not None:
+                t, v = end
+                u, v = p*t + r*v, q*t + s*v
+                if v < 0:
+                    u, v = -u, -v
+                for t in _cf_ratio(u, v):
+                    yield t
+                return
+            if q <= 0 and q + s <= 0:
+                p, q, r, s = -p, -q, -r, -s
+            if q >= 0 and q + s >= 0:
+                quotients, p, q, r, s = _cf_common_quotients(
+                    p, q, p + r, q + s, determinant)
+                for t in quotients:
+                    yield t
+                r, s = r - p, s - q
+            renormalise_left -= len(terms)
+            if renormalise_left <= 0:
+                renormalise_left = renormalise_period
+                coefficients = p, q, r, s
+                (p, q, r, s), limit = _cf_renormalise(
+                    coefficients, limit, None)
+                for t, u in zip(coefficients, (p, q, r, s)):
+                    if u:
+                        determinant //= (t//u)**2
+                        break
+
+    def _checkpoint(self):
+        """The cache is all the state there is."""
+
+        return ()
+
+    def _resume(self):
+        """Return the generator of the partial quotients of self
+        after those already cached, which are computed again."""
+
+        return _cf_skip(self._gcf_generator().next, len(self.cache)).next
+
+class _cf_sequence(cf):
+    """Class for continued fractions constructed from canned
+    partial quotients; see cf.__new__()."""
+
+    __slots__ = ('pq', 'sequence')
+
+    def _arguments(self):
+        """Return cf and the arguments that created self."""
+
+        return cf, self.sequence
+
+# The headers of the files of the constant store: format version 1,
+# with the size and the byte order of the machine words of the partial
+# quotients, and the side table of those that don't fit in them.
+_cf_store_header = 'cfpq\1%c%c\0' % (array('l').itemsize, sys.byteorder[0])
+_cf_store_big_header = 'cfbig 1\n'
+
+# The module constants backed by the constant store.
+_cf_stored_constants = []
+
+class _cf_stored(cf_base):
+    """Class for the module constants whose partial quotients are
+    kept in the constant store; see constant_store. The partial
+    quotients are those of self.node, whose cache starts with the
+    stored ones."""
+
+    __slots__ = ('name', 'node', 'directory', 'depth', 'pq')
+
+    def __new__(cls, name, node):
+        """Back node by the files named name in the constant store."""
+
+        self = object.__new__(cls)
+        self.name = name
+        self.node = node
+        self.directory = constant_store
+        # The store is read at the first call of self.pq(), which
+        # then becomes self.node.pq; self.depth is the stored depth.
+        self.depth = None
+        self.pq = self._load
+        _cf_stored_constants.append(self)
+        return self
+
+    def _load(self, n):
+        """Resume self.node after the stored partial quotients
+        and return its nth partial quotient."""
+
+        node = self.node
+        # Callers may have kept the bound method from before the load.
+        if self.depth is not None:
+            return node.pq(n)
+        self.pq = node.pq
+        words, spill = _cf_read_constant(self.directory, self.name)
+        self.depth = len(words)
+        # Nodes that compute their partial quotients with closures
+        # have no cache to fill, and those that have come as far or
+        # farther have nothing to gain.
+        if (hasattr(node, '_checkpoint') and hasattr(node, 'next_pq')
+            and len(node.cache) < len(words)):
+            node.cache, node.spill = words, spill
+            if _cf_lookup(node, len(words) - 1) is None:
+                node._finish()
+            else:
+                node.next_pq = node._resume(*node._checkpoint())
+        return node.pq(n)
+
+    def _arguments(self):
+        """Return _cf_constant and the arguments that created self."""
+
+        return _cf_constant, (self.name, self.node)
+
+def _cf_constant(name, x):
+    """Return x, backed by the constant store if there is one."""
+
+    if constant_store is None:
+        return x
+    return _cf_stored(name, x)
+
+def _cf_read_constant(directory, name):
+    """Return the partial quotients of the constant name kept in the
+    constant store in directory: an array of machine words and the
+    dictionary of those that don't fit in them, or None."""
+
+    path = os.path.join(directory, name)
+    words = array('l')
+    try:
+        f = open(path + '.pqs', 'rb')
+    except IOError:
+        return words, None
+    try:
+        data = f.read()
+    finally:
+        f.close()
+    start = len(_cf_store_header)
+    if data[:start] == _cf_store_header:
+        size = len(data) - (len(data) - start) % words.itemsize
+        words.fromstring(data[start:size])
+    spill = {}
+    if words.count(_cf_spilled):
+        # The side table holds lines of an index and a partial
+        # quotient, in hexadecimal, or None.
+        try:
+            f = open(path + '.big', 'rb')
+            try:
+                if f.readline() == _cf_store_big_header:
+                    for line in f:
+                        i, t = line.split()
+                        if t == 'None':
+                            spill[int(i, 16)] = None
+                        else:
+                            spill[int(i, 16)] = int(t, 16)
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            pass
+        # Don't trust the words past a partial quotient
+        # missing from the side table.
+        for i in xrange(len(words)):
+            if words[i] == _cf_spilled and i not in spill:
+                del words[i:]
+                break
+    return words, spill or None
+
+def _cf_stored_depth(path):
+    """Return the number of the partial quotients in the file path
+    of the constant store, or 0."""
+
+    try:
+        f = open(path, 'rb')
+        try:
+            if f.read(len(_cf_store_header)) != _cf_store_header:
+                return 0
+        finally:
+            f.close()
+        size = os.path.getsize(path) - len(_cf_store_header)
+    except (IOError, OSError):
+        return 0
+    return size//array('l').itemsize
+
+def _cf_write_constant(x):
+    """Replace the files of the constant x in the constant store with
+    the cached partial quotients of x.node, unless they are as deep
+    already. Return the stored depth."""
+
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+
+    node = x.node
+    if not os.path.isdir(x.directory):
+        try:
+            os.makedirs(x.directory)
+        except OSError:
+            # Made by a concurrent process.
+            if not os.path.isdir(x.directory):
+                raise
+    path = os.path.join(x.directory, x.name)
+    # Hold a lock on the store while comparing the depths, so that
+    # concurrent processes don't replace deeper files than their own.
+    lock = open(os.path.join(x.directory, '.lock'), 'a')
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        depth = _cf_stored_depth(path + '.pqs')
+        if len(node.cache) <= depth:
+            return depth
+        big = [_cf_store_big_header]
+        for i, t in sorted((node.spill or {}).iteritems()):
+            if t is None:
+                big.append('%x None\n' % i)
+            else:
+                big.append('%x %x\n' % (i, t))
+        # Write to temporary files and rename them, so that concurrent
+        # readers see either the old or the new files. The side table
+        # goes first, as the words refer to it.
+        for suffix, data in (('.big', ''.join(big)),
+                ('.pqs', _cf_store_header + node.cache.tostring())):
+            temporary = '%s%s.%d' % (path, suffix, os.getpid())
+            f = open(temporary, 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            os.rename(temporary, path + suffix)
+        return len(node.cache)
+    finally:
+        lock.close()
+
+def save_constants():
+    """Extend the constant store with the partial quotients of the
+    module constants computed beyond their stored depth; see
+    constant_store. Called at exit when there is a constant store."""
+
+    for x in _cf_stored_constants:
+        if x.depth is not None and len(x.node.cache) > x.depth:
+            x.depth = _cf_write_constant(x)
+
+if constant_store is not None:
+    import atexit
+    atexit.register(save_constants)
+
 # Not a Number, including also infinities.
 NaN = cf(())
 
@@ -668,31 +1959,241 @@ one = cf(1)
 class binop(cf_base):
     """Class for bihomographic binary operations."""
 
+    __slots__ = ('x', 'y', 'coefficients', 'cache', 'spill', 'next_pq')
+
     def __new__(cls, x, y, a, b, c, d, e, f, g, h):
         """Return (a*x*y + b*x + c*y + d)/(e*x*y + f*x + g*y + h)."""
 
+        # Substitute rational operands, leaving a unop or a constant.
+        ratio = _cf_foldable(y)
+        if ratio is not None:
+            r, s = ratio
+            return unop(x, a*r + b*s, c*r + d*s, e*r + f*s, g*r + h*s)
+        ratio = _cf_foldable(x)
+        if ratio is not None:
+            p, q = ratio
+            return unop(y, a*p + c*q, b*p + d*q, e*p + g*q, f*p + h*q)
+        if fuse_nodes:
+            fused = 0
+            if (type(x) is unop) and hasattr(x, 'next_pq'):
+                # Substitute x = (p*x' + q)/(r*x' + s) and multiply
+                # the numerator and the denominator by r*x' + s.
+                p, q, r, s = x.coefficients
+                a,b,c,d,e,f,g,h = (p*a+r*c, p*b+r*d, q*a+s*c, q*b+s*d,
+                    p*e+r*g, p*f+r*h, q*e+s*g, q*f+s*h)
+                x = x.x
+                fused = 1
+            if (type(y) is unop) and hasattr(y, 'next_pq'):
+                # The same for y = (p*y' + q)/(r*y' + s).
+                p, q, r, s = y.coefficients
+                a,b,c,d,e,f,g,h = (p*a+r*b, q*a+s*b, p*c+r*d, q*c+s*d,
+                    p*e+r*f, q*e+s*f, p*g+r*h, q*g+s*h)
+                y = y.x
+                fused = 1
+            if fused:
+                a,b,c,d,e,f,g,h = _cf_normalize((a,b,c,d,e,f,g,h))
+        if simplify_nodes and (x is y):
+            # (a*x*x + (b+c)*x + d)/(e*x*x + (f+g)*x + h)
+            if (a == e == 0) and ((b + c)*h != d*(f + g)):
+                return unop(x, b + c, d, f + g, h)
+            constant = _cf_cancelled((a, b + c, d), (e, f + g, h), x)
+            if constant is not None:
+                return constant
+        if intern_nodes:
+            if id(x) > id(y):
+                # z(x,y) with b, c and f, g swapped is z(y,x).
+                x, y, b, c, f, g = y, x, c, b, g, f
+            key = (cls, id(x), id(y),
+                _cf_normalize((a, b, c, d, e, f, g, h)))
+            self = _cf_interned(key)
+            if self is not None:
+                return self
         self = object.__new__(cls)
-        self.cache = []
-        self.next_pq = _cf_bihomographic(
-            x.pq, y.pq, a, b, c, d, e, f, g, h).next
+        self.x = x
+        self.y = y
+        self.coefficients = (a, b, c, d, e, f, g, h)
+        self.cache = array('l')
+        self.spill = None
+        self.next_pq = self._resume(self.coefficients)
+        if intern_nodes:
+            _cf_intern(key, self, (x, y))
         return self
 
+    def _finish(self):
+        """Release the operands along with the generator."""
+
+        del self.next_pq, self.x, self.y, self.coefficients
+
+    def _checkpoint(self):
+        """Return the coefficients of the complete quotient of self
+        after the cached partial quotients, as a function of the
+        complete quotients of self.x and self.y after nx and ny
+        partial quotients, and nx and ny."""
+
+        numerator, denominator = _cf_resumed(self,
+            self.coefficients[:4], self.coefficients[4:])
+        a, b, c, d = numerator
+        e, f, g, h = denominator
+        # The engine bounds z by its values at the corners of
+        # [0, inf]**2, which holds only when the denominator
+        # doesn't change its sign in between, so ingest partial
+        # quotients of x and y by turns until it doesn't. The engine
+        # of self got there without ingesting more partial quotients
+        # than x and y have cached, unless it had decided that z is
+        # rational; then give up and let the engine start over.
+        x_pq = self.x.pq
+        y_pq = self.y.pq
+        nx = ny = 0
+        x_ended = y_ended = 0
+        iters_left = _cf_ingest_limit(self, self.x, self.y)
+        while not ((e >= 0 and f >= 0 and g >= 0 and h >= 0) or
+                   (e <= 0 and f <= 0 and g <= 0 and h <= 0)):
+            if not iters_left:
+                return self.coefficients, 0, 0, len(self.cache)
+            iters_left -= 1
+            if not x_ended and (y_ended or nx <= ny):
+                t = x_pq(nx)
+                if t is None:
+                    # z no longer depends on x.
+                    c, d, g, h = a, b, e, f
+                    x_ended = 1
+                else:
+                    a,b,c,d,e,f,g,h = c+a*t,d+b*t,a,b,g+e*t,h+f*t,e,f
+                    nx += 1
+            else:
+                t = y_pq(ny)
+                if t is None:
+                    # z no longer depends on y.
+                    b, d, f, h = a, c, e, g
+                    y_ended = 1
+                else:
+                    a,b,c,d,e,f,g,h = b+a*t,a,d+c*t,c,f+e*t,e,h+g*t,g
+                    ny += 1
+        return _cf_normalize((a, b, c, d, e, f, g, h)), nx, ny, 0
+
+    def _resume(self, coefficients, nx=0, ny=0, skip=0):
+        """Return the generator of the partial quotients of
+        the bihomographic function with the given coefficients
+        of the complete quotients of self.x and self.y after
+        nx and ny partial quotients, skipping the first skip
+        of them."""
+
+        bits = track_coefficient_bits and _cf_track_bits(self) or None
+        if ingest_block > 1:
+            next_pq = _cf_bihomographic_blocks(self.x.pq, self.y.pq,
+                ingest_block, *(coefficients + (bits, nx, ny))).next
+        else:
+            next_pq = _cf_bihomographic(self.x.pq, self.y.pq,
+                *(coefficients + (bits, nx, ny))).next
+        if skip:
+            return _cf_skip(next_pq, skip).next
+        return next_pq
+
 class unop(cf_base):
     """Class for homographic unary operations."""
 
+    __slots__ = ('x', 'coefficients', 'cache', 'spill', 'next_pq')
+
     def __new__(cls, x, a, b, c, d):
         """Return (a*x + b)/(c*x + d)."""
 
+        ratio = _cf_foldable(x)
+        if ratio is not None:
+            # Fold the constant.
+            p, q = ratio
+            return _cf_fraction(a*p + b*q, c*p + d*q)
+        if simplify_nodes and (a*d == b*c):
+            constant = _cf_cancelled((a, b), (c, d), x)
+            if constant is not None:
+                return constant
+        if fuse_nodes and hasattr(x, 'next_pq'):
+            if type(x) is unop:
+                # Compose the two homographic functions.
+                p, q, r, s = x.coefficients
+                a, b, c, d = _cf_normalize(
+                    (a*p + b*r, a*q + b*s, c*p + d*r, c*q + d*s))
+                x = x.x
+                if (b == c == 0) and (a == d):
+                    return x
+            elif type(x) is binop:
+                # (a*n/d + b)/(c*n/d + d) == (a*n + b*d)/(c*n + d*d)
+                numerator = x.coefficients[:4]
+                denominator = x.coefficients[4:]
+                return binop(x.x, x.y, *_cf_normalize(
+                    [a*t + b*u for t, u in zip(numerator, denominator)] +
+                    [c*t + d*u for t, u in zip(numerator, denominator)]))
+        if intern_nodes:
+            key = (cls, id(x), _cf_normalize((a, b, c, d)))
+            self = _cf_interned(key)
+            if self is not None:
+                return self
         self = object.__new__(cls)
-        self.cache = []
-        self.next_pq = _cf_homographic(0, x.pq, a, b, c, d).next
+        self.x = x
+        self.coefficients = (a, b, c, d)
+        self.cache = array('l')
+        self.spill = None
+        self.next_pq = self._resume(self.coefficients)
+        if intern_nodes:
+            _cf_intern(key, self, (x,))
         return self
 
-def _cf_bihomographic(x_pq, y_pq, a, b, c, d, e, f, g, h):
+    def _finish(self):
+        """Release the operand along with the generator."""
+
+        del self.next_pq, self.x, self.coefficients
+
+    def _checkpoint(self):
+        """Return the coefficients of the complete quotient of self
+        after the cached partial quotients, as a function of the
+        complete quotient of self.x after nx partial quotients,
+        and nx."""
+
+        numerator, denominator = _cf_resumed(self,
+            self.coefficients[:2], self.coefficients[2:])
+        a, b = numerator
+        c, d = denominator
+        # See binop._checkpoint().
+        x_pq = self.x.pq
+        nx = 0
+        iters_left = _cf_ingest_limit(self, self.x)
+        while not ((c >= 0 and d >= 0) or (c <= 0 and d <= 0)):
+            if not iters_left:
+                return self.coefficients, 0, len(self.cache)
+            iters_left -= 1
+            t = x_pq(nx)
+            if t is None:
+                b, d = a, c
+            else:
+                a, b, c, d = b + a*t, a, d + c*t, c
+                nx += 1
+        return _cf_normalize((a, b, c, d)), nx, 0
+
+    def _resume(self, coefficients, nx=0, skip=0):
+        """Return the generator of the partial quotients of the
+        homographic function with the given coefficients of
+        the complete quotient of self.x after nx partial quotients,
+        skipping the first skip of them."""
+
+        bits = track_coefficient_bits and _cf_track_bits(self) or None
+        if ingest_block > 1:
+            next_pq = _cf_homographic_blocks(nx, self.x.pq,
+                ingest_block, *(coefficients + (bits,))).next
+        else:
+            next_pq = _cf_homographic(nx, self.x.pq,
+                *(coefficients + (bits,))).next
+        if skip:
+            return _cf_skip(next_pq, skip).next
+        return next_pq
+
+def _cf_bihomographic(x_pq, y_pq, a, b, c, d, e, f, g, h, bits=None,
+    nx=0, ny=0):
     """Generate subsequent partial quotients of the
     continued fraction
     z(x,y) = (a*x*y + b*x + c*y + d)/(e*x*y + f*x + g*y + h),
-    given x.pq, y.pq and the parameters a--h."""
+    given x.pq, y.pq and the parameters a--h. If bits is
+    not None, record the maximal bit length of a--h in bits[0].
+    If nx or ny are given, then x and y stand for the complete
+    quotients of the operands after that many partial quotients."""
 
     # This function is the workhorse of the module,
     # so it is extensively optimized at the cost of
@@ -711,7 +2212,12 @@ def _cf_bihomographic(x_pq, y_pq, a, b, c, d, e, f, g, h):
     iters_left = allowed_iters = max_iters
 
     # nx and ny count partial quotients requested from x_pq and y_pq.
-    nx = ny = 0
+    # Ingested partial quotients left until the next renormalisation.
+    limit = renormalise_bits
+    if bits is None:
+        renormalise_left = period = renormalise_period
+    else:
+        renormalise_left = period = 1
     while 1:
         ingest_x = None
 
@@ -736,6 +2242,7 @@ def _cf_bihomographic(x_pq, y_pq, a, b, c, d, e, f, g, h):
             bf = b//f
             if not any_results:
                 lower = upper = bf
+                any_results = 1
             elif (lower is None) or (bf < lower):
                 lower = bf
             else:
@@ -753,6 +2260,7 @@ def _cf_bihomographic(x_pq, y_pq, a, b, c, d, e, f, g, h):
             cg = c//g
             if not any_results:
                 lower = upper = cg
+                any_results = 1
             elif (lower is None) or (cg < lower):
                 lower = cg
             elif (upper is not None) and (cg > upper):
@@ -848,7 +2356,7 @@ def _cf_bihomographic(x_pq, y_pq, a, b, c, d, e, f, g, h):
             if bf is not None:
                 a,b,c,d,e,f,g,h = c+a*bf,d+b*bf,a,b,g+e*bf,h+f*bf,e,f
             else:
-                for bf in _cf_homographic(ny, y_pq, a, b, e, f):
+                for bf in _cf_homographic(ny, y_pq, a, b, e, f, bits):
                     yield bf
         else:
             bf = y_pq(ny)
@@ -856,15 +2364,27 @@ def _cf_bihomographic(x_pq, y_pq, a, b, c, d, e, f, g, h):
             if bf is not None:
                 a,b,c,d,e,f,g,h = b+a*bf,a,d+c*bf,c,f+e*bf,e,h+g*bf,g
             else:
-                for bf in _cf_homographic(nx, x_pq, a, c, e, g):
+                for bf in _cf_homographic(nx, x_pq, a, c, e, g, bits):
                     yield bf
 
-def _cf_homographic(nx, x_pq, a, b, c, d):
+        renormalise_left -= 1
+        if not renormalise_left:
+            renormalise_left = period
+            (a,b,c,d,e,f,g,h), limit = _cf_renormalise(
+                (a,b,c,d,e,f,g,h), limit, bits)
+
+def _cf_homographic(nx, x_pq, a, b, c, d, bits=None):
     """Generate subsequent partial quotients of the continued
     fraction z(x) = (a*x + b)/(c*x + d), given the number of
     x's partial quotients consumed so far, x.pq, and the
-    parameters a--d."""
+    parameters a--d. If bits is not None, record the maximal
+    bit length of a--d in bits[0]."""
 
+    limit = renormalise_bits
+    if bits is None:
+        renormalise_left = period = renormalise_period
+    else:
+        renormalise_left = period = 1
     while 1:
         # ac, bd == floor(z(infinity)), floor(z(0)).
         # ac or bd == None means that the corresponding value
@@ -897,6 +2417,11 @@ def _cf_homographic(nx, x_pq, a, b, c, d):
             nx += 1
             if ac is not None:
                 a, b, c, d = b+a*ac, a, d+c*ac, c
+                renormalise_left -= 1
+                if not renormalise_left:
+                    renormalise_left = period
+                    (a, b, c, d), limit = _cf_renormalise(
+                        (a, b, c, d), limit, bits)
             else:
                 while c:
                     ac, bd = divmod(a, c)
@@ -904,15 +2429,276 @@ def _cf_homographic(nx, x_pq, a, b, c, d):
                     a, c = c, bd
                 yield None
 
-def digits(x, base=10):
+def _cf_bihomographic_blocks(x_pq, y_pq, k, a, b, c, d, e, f, g, h,
+    bits=None, nx=0, ny=0):
+    """Like _cf_bihomographic(), but ingest k partial quotients
+    of x_pq or y_pq at a time."""
+
+    # Ingesting more partial quotients than necessary doesn't hurt
+    # the correctness, as the state a--h always stands for the exact
+    # value of z. It makes the coefficients grow faster, but saves
+    # passes through the loop, each of which costs four floor
+    # divisions. Those are skipped altogether when the bit lengths of
+    # the coefficients already show that the four values of z at the
+    # corners don't share their integral part: if the values are
+    # positive, then n/m lies between 2**(len(n)-len(m)-1) and
+    # 2**(len(n)-len(m)+1), so two values whose exponents differ by
+    # at least 2 are separated by a power of 2 that is an integer.
+    iters_left = allowed_iters = max_iters
+    limit = renormalise_bits
+    if bits is None:
+        renormalise_left = period = renormalise_period
+    else:
+        renormalise_left = period = 1
+    while 1:
+        ingest_x = None
+        if (a > 0 and b > 0 and c > 0 and d > 0 and
+            e > 0 and f > 0 and g > 0 and h > 0):
+            sb = b.bit_length() - f.bit_length()
+            sc = c.bit_length() - g.bit_length()
+            sd = d.bit_length() - h.bit_length()
+            lower = upper = a.bit_length() - e.bit_length()
+            for bf in sb, sc, sd:
+                if bf < lower:
+                    lower = bf
+                elif bf > upper:
+                    upper = bf
+            if upper > 0 and upper - lower > 1:
+                # Approximately ingest_x = (abs(bf-dh) > abs(cg-dh)).
+                if sb > sd:
+                    sb -= sd
+                else:
+                    sb = sd - sb
+                if sc > sd:
+                    sc -= sd
+                else:
+                    sc = sd - sc
+                ingest_x = (sb > sc)
+
+        if ingest_x is None:
+            # The pre-test didn't settle anything, so proceed
+            # exactly as _cf_bihomographic() does.
+            if e:
+                lower = upper = a//e
+                any_results = 1
+            else:
+                lower = upper = None
+                any_results = a
+
+            if f:
+                bf = b//f
+                if not any_results:
+                    lower = upper = bf
+                    any_results = 1
+                elif (lower is None) or (bf < lower):
+                    lower = bf
+                else:
+                    upper = bf
+            elif b:
+                upper = bf = None
+                any_results = 1
+            else:
+                ingest_x = 0
+
+            if g:
+                cg = c//g
+                if not any_results:
+                    lower = upper = cg
+                    any_results = 1
+                elif (lower is None) or (cg < lower):
+                    lower = cg
+                elif (upper is not None) and (cg > upper):
+                    upper = cg
+            elif c:
+                upper = cg = None
+                any_results = 1
+            else:
+                ingest_x = 1
+
+            if h:
+                dh = d//h
+                if not any_results:
+                    lower = upper = dh
+                elif (lower is None) or (dh < lower):
+                    lower = dh
+                elif (upper is not None) and (dh > upper):
+                    upper = dh
+            elif d:
+                upper = dh = None
+            else:
+                dh = 0
+
+            if lower == upper:
+                yield upper
+                a,b,c,d,e,f,g,h = (e,f,g,h,
+                    a-e*upper,b-f*upper,c-g*upper,d-h*upper)
+                iters_left = allowed_iters
+                continue
+            elif (upper is None) or (lower == upper - 1):
+                # Count every partial quotient of a block, so that
+                # max_iters keeps its meaning.
+                if iters_left <= 0:
+                    yield upper
+                    yield None
+                else:
+                    iters_left -= k
+
+            if ingest_x is None:
+                if bf is None:
+                    ingest_x = (dh is not None)
+                elif cg is None:
+                    ingest_x = (dh is None)
+                elif dh is None:
+                    if bf > 0:
+                        if cg > 0:
+                            ingest_x = (bf < cg)
+                        else:
+                            ingest_x = (bf < -cg)
+                    else:
+                        if cg > 0:
+                            ingest_x = (-bf < cg)
+                        else:
+                            ingest_x = (bf > cg)
+                elif bf > dh:
+                    if cg > dh:
+                        ingest_x = (bf > cg)
+                    else:
+                        ingest_x = (bf-dh > dh-cg)
+                else:
+                    if cg > dh:
+                        ingest_x = (dh-bf > cg-dh)
+                    else:
+                        ingest_x = (cg > bf)
+
+        # Multiply the partial quotients of the block into the matrix
+        # [[p, r], [q, s]], so that the ingested operand equals
+        # (p*t + r)/(q*t + s), where t is its remaining tail.
+        p, q, r, s = 1, 0, 0, 1
+        if ingest_x:
+            for bf in xrange(nx, nx + k):
+                bf = x_pq(bf)
+                if bf is None:
+                    break
+                p, q, r, s = p*bf + r, q*bf + s, p, q
+            nx += k
+            a,b,c,d,e,f,g,h = (a*p + c*q, b*p + d*q, a*r + c*s, b*r + d*s,
+                e*p + g*q, f*p + h*q, e*r + g*s, f*r + h*s)
+            if bf is None:
+                for bf in _cf_homographic_blocks(
+                    ny, y_pq, k, a, b, e, f, bits):
+                    yield bf
+        else:
+            for bf in xrange(ny, ny + k):
+                bf = y_pq(bf)
+                if bf is None:
+                    break
+                p, q, r, s = p*bf + r, q*bf + s, p, q
+            ny += k
+            a,b,c,d,e,f,g,h = (a*p + b*q, a*r + b*s, c*p + d*q, c*r + d*s,
+                e*p + f*q, e*r + f*s, g*p + h*q, g*r + h*s)
+            if bf is None:
+                for bf in _cf_homographic_blocks(
+                    nx, x_pq, k, a, c, e, g, bits):
+                    yield bf
+
+        renormalise_left -= k
+        if renormalise_left <= 0:
+            renormalise_left = period
+            (a,b,c,d,e,f,g,h), limit = _cf_renormalise(
+                (a,b,c,d,e,f,g,h), limit, bits)
+
+def _cf_homographic_blocks(nx, x_pq, k, a, b, c, d, bits=None):
+    """Like _cf_homographic(), but ingest k partial quotients
+    of x_pq at a time."""
+
+    # See _cf_bihomographic_blocks() for the bit length pre-test.
+    limit = renormalise_bits
+    if bits is None:
+        renormalise_left = period = renormalise_period
+    else:
+        renormalise_left = period = 1
+    while 1:
+        if a > 0 and b > 0 and c > 0 and d > 0:
+            ac = a.bit_length() - c.bit_length()
+            bd = b.bit_length() - d.bit_length()
+            if ac > bd + 1:
+                settled = (ac > 0)
+            elif bd > ac + 1:
+                settled = (bd > 0)
+            else:
+                settled = 0
+        else:
+            settled = 0
+
+        if settled:
+            # Any ac != bd will do.
+            ac, bd = 0, 1
+        elif c:
+            ac = a//c
+            if d:
+                bd = b//d
+            elif b:
+                bd = None
+            else:
+                bd = ac
+        elif d:
+            if a:
+                ac = None
+                bd = 0
+            else:
+                ac = bd = b//d
+        else:
+            ac = bd = None
+
+        if ac == bd:
+            yield ac
+            a, b, c, d = c, d, a-c*ac, b-d*bd
+        else:
+            p, q, r, s = 1, 0, 0, 1
+            for ac in xrange(nx, nx + k):
+                ac = x_pq(ac)
+                if ac is None:
+                    break
+                p, q, r, s = p*ac + r, q*ac + s, p, q
+            nx += k
+            a, b, c, d = a*p + b*q, a*r + b*s, c*p + d*q, c*r + d*s
+            if ac is None:
+                while c:
+                    ac, bd = divmod(a, c)
+                    yield ac
+                    a, c = c, bd
+                yield None
+            renormalise_left -= k
+            if renormalise_left <= 0:
+                renormalise_left = period
+                (a, b, c, d), limit = _cf_renormalise(
+                    (a, b, c, d), limit, bits)
+
+def digits(x, base=10, chunk=1):
     """Generate subsequent digits of x in a given base.
     Raises StopIteration when all the subsequent digits
     would be 0. The first result is actually the floor of x;
     subsequent results are digits of the fractional part of x.
     For negative x's you should call digits(-x) and prepend
-    '-' to the accumulated result."""
-
+    '-' to the accumulated result. If chunk is greater than 1,
+    then the digits of the fractional part come in chunks of
+    chunk digits, as digits in base base**chunk."""
+
+    base **= chunk
+    ratio = _cf_rational(x)
+    if ratio is not None:
+        # Long division.
+        p, q = ratio
+        t, r = divmod(p, q)
+        yield t
+        while r:
+            t, r = divmod(r*base, q)
+            yield t
+        return
     a, b, c, d, output_digits, nx, x_pq = 1, 0, 0, 1, 0, 0, x.pq
+    k = ingest_block
+    limit = renormalise_bits
+    renormalise_left = renormalise_period
     while a or b:
         if c:
             ac = a//c
@@ -937,16 +2723,244 @@ def digits(x, base=10):
             a, b = base*(a - c*ac), base*(b - d*bd)
             output_digits = 1
         else:
-            # Reuse ac instead of introducing another variable.
-            ac = x_pq(nx)
-            nx += 1
-            if ac is not None:
-                a,b,c,d = b+a*ac,a,d+c*ac,c
-            else:
+            # Ingest ingest_block partial quotients at a time, as
+            # _cf_homographic_blocks() does; reuse ac and bd instead
+            # of introducing other variables.
+            p, q, r, s = 1, 0, 0, 1
+            for ac in xrange(nx, nx + k):
+                ac = x_pq(ac)
+                if ac is None:
+                    break
+                p, q, r, s = p*ac + r, q*ac + s, p, q
+            nx += k
+            a, b, c, d = a*p + b*q, a*r + b*s, c*p + d*q, c*r + d*s
+            if ac is None:
                 b,d = a,c
+            else:
+                renormalise_left -= k
+                if renormalise_left <= 0:
+                    renormalise_left = renormalise_period
+                    (a,b,c,d), limit = _cf_renormalise(
+                        (a,b,c,d), limit, None)
     if not output_digits:
         yield 0
 
+def _cf_convergents(x):
+    """Generate tuples (p, q, r, s), where p/q are the subsequent
+    convergents of x and r/s their predecessors, starting with 1/0.
+    The denominators are non-negative and x lies between r/s and
+    p/q; after the last tuple of a finite continued fraction, x
+    equals p/q. Raises ValueError if x is a NaN."""
+
+    x_pq = x.pq
+    n = 0
+    p, q, r, s = 1, 0, 0, 1
+    while 1:
+        t = x_pq(n)
+        n += 1
+        if t is None:
+            if n == 1:
+                raise ValueError, 'NaN detected'
+            return
+        if t <= 0 and n > 1 and x_pq == x.pq:
+            # The convergents of an expansion such as cf((1, 0, -2))
+            # don't enclose x, so start over with the canonical
+            # expansion, as output by _cf_homographic().
+            x_pq = lambda n, next_pq=_cf_homographic(
+                0, x.pq, 1, 0, 0, 1).next: next_pq()
+            n = 0
+            p, q, r, s = 1, 0, 0, 1
+            continue
+        p, q, r, s = p*t + r, q*t + s, p, q
+        yield p, q, r, s
+
+def _cf_round_ratio(p, q):
+    """Return p/q rounded to the nearest integer, ties to even;
+    q must be positive."""
+
+    quotient, remainder = divmod(p, q)
+    remainder *= 2
+    if remainder > q or (remainder == q and quotient & 1):
+        quotient += 1
+    return quotient
+
+def _cf_ilog10(p, q):
+    """Return floor(log10(p/q)) for positive p and q."""
+
+    def below(k):
+        """Return p/q < 10**k."""
+        if k >= 0:
+            return p < q*10**k
+        return p*10**-k < q
+
+    # log10(2) =~= 0.30103, so the estimate is off by at most one.
+    k = int((p.bit_length() - q.bit_length())*0.30103)
+    while below(k):
+        k -= 1
+    while not below(k + 1):
+        k += 1
+    return k
+
+def _cf_product(pqs, lo, hi):
+    """Return (p, q, r, s), where [[p, r], [q, s]] is the product of
+    the matrices [[t, 1], [1, 0]] for the partial quotients t in
+    pqs[lo:hi], so that p/q and r/s are the last two convergents."""
+
+    # Splitting the product in halves lets the long multiplications
+    # work on operands of similar size, where Karatsuba's algorithm
+    # beats multiplying by one partial quotient after another.
+    if hi - lo <= 16:
+        p, q, r, s = 1, 0, 0, 1
+        for t in pqs[lo:hi]:
+            p, q, r, s = p*t + r, q*t + s, p, q
+        return p, q, r, s
+    middle = (lo + hi)//2
+    a, b, c, d = _cf_product(pqs, lo, middle)
+    e, f, g, h = _cf_product(pqs, middle, hi)
+    return a*e + c*f, b*e + d*f, a*g + c*h, b*g + d*h
+
+def _cf_rounded(x, places):
+    """Return x*10**places rounded to the nearest integer,
+    ties to even."""
+
+    if places >= 0:
+        numerator, denominator = 10**places, 1
+    else:
+        numerator, denominator = 1, 10**-places
+    # Both convergents p/q and r/s round to the same integer once
+    # 10**places/(q*s) is well below 1, unless x is close to a half
+    # integer. So fetch partial quotients in batches, until the bit
+    # lengths of q and s add up to needed, estimating that each one
+    # contributes as many bits as the previous ones did on average
+    # (Levy's constant gives 1.71 bits for almost all numbers), and
+    # only then do the two long divisions. Move the goal posts after
+    # a miss.
+    needed = numerator.bit_length() - denominator.bit_length() + 2
+    x_pq = x.pq
+    n = 0
+    p, q, r, s = 1, 0, 0, 1
+    while 1:
+        size = q.bit_length() + s.bit_length()
+        if size < needed or not q:
+            if q > 1:
+                count = (needed - size)*n//(2*q.bit_length()) + 1
+            else:
+                count = max(int((needed - size)/3.42), 0) + 1
+            pqs = []
+            for n in xrange(n, n + count):
+                t = x_pq(n)
+                if t is None:
+                    if not n:
+                        raise ValueError, 'NaN detected'
+                    break
+                if t <= 0 and n:
+                    break
+                pqs.append(t)
+            else:
+                n += 1
+            e, f, g, h = _cf_product(pqs, 0, len(pqs))
+            p, q, r, s = p*e + r*f, q*e + s*f, p*g + r*h, q*g + s*h
+            if t is None:
+                # x == p/q.
+                return _cf_round_ratio(p*numerator, q*denominator)
+            if t <= 0 and n:
+                return _cf_rounded_canonical(x, numerator, denominator)
+        elif s:
+            result = _cf_round_ratio(p*numerator, q*denominator)
+            if result == _cf_round_ratio(r*numerator, s*denominator):
+                return result
+            needed += 32
+        else:
+            needed = size + 1
+
+def _cf_rounded_canonical(x, numerator, denominator):
+    """Return x*numerator/denominator rounded to the nearest integer,
+    ties to even, going through the convergents one by one, as
+    _cf_convergents() normalises them."""
+
+    needed = numerator.bit_length() - denominator.bit_length() + 2
+    for p, q, r, s in _cf_convergents(x):
+        if s and q.bit_length() + s.bit_length() > needed:
+            result = _cf_round_ratio(p*numerator, q*denominator)
+            if result == _cf_round_ratio(r*numerator, s*denominator):
+                return result
+            needed += 32
+    # x == p/q.
+    return _cf_round_ratio(p*numerator, q*denominator)
+
+def to_decimal(x, n, significant=0):
+    """Return x correctly rounded to n digits after the decimal
+    point, or to n significant digits if significant is true, as
+    a decimal.Decimal. Ties are rounded to even. Use str() on the
+    result to get a string. Only as many partial quotients of x as
+    the requested accuracy needs are computed."""
+
+    from decimal import Decimal
+
+    x = cf(x)
+    if significant:
+        if n < 1:
+            raise ValueError, 'at least one significant digit is needed'
+        # Find the decimal exponent of x, i.e. floor(log10(abs(x))).
+        for p, q, r, s in _cf_convergents(x):
+            if s and p and r and (p < 0) == (r < 0):
+                exponent = _cf_ilog10(abs(p), q)
+                if exponent == _cf_ilog10(abs(r), s):
+                    break
+        else:
+            if not p:
+                return Decimal(0)
+            exponent = _cf_ilog10(abs(p), q)
+        places = n - 1 - exponent
+        result = _cf_rounded(x, places)
+        if abs(result) == 10**n:
+            # x was rounded up to the next power of 10.
+            result //= 10
+            places -= 1
+    else:
+        places = n
+        result = _cf_rounded(x, places)
+    return Decimal('%dE%d' % (result, -places))
+
+def to_fraction(x, tolerance):
+    """Return a fractions.Fraction within tolerance of x: the
+    convergent of x with the smallest denominator guaranteed
+    to be that close."""
+
+    from fractions import Fraction
+
+    x = cf(x)
+    tolerance = Fraction(tolerance)
+    if tolerance <= 0:
+        raise ValueError, 'tolerance must be positive'
+    for p, q, r, s in _cf_convergents(x):
+        # abs(x - r/s) <= abs(p/q - r/s) == 1/(q*s).
+        if s and q*s*tolerance.numerator >= tolerance.denominator:
+            return Fraction(r, s)
+    return Fraction(p, q)
+
+def _cf_digit_strings(x, chunk=18):
+    """Generate the floor of x, followed by strings of subsequent
+    decimal digits of the fractional part of x, chunk digits long
+    but the last one, which doesn't end with zeroes."""
+
+    # 10**18 < 2**63, so the default chunks fit in a machine word.
+    get_chunk = digits(x, 10, chunk).next
+    yield get_chunk()
+    # Keep a chunk back, as only the next call to get_chunk()
+    # tells whether its trailing zeroes are significant.
+    digit_string = None
+    while 1:
+        try:
+            t = get_chunk()
+        except StopIteration:
+            if digit_string is not None:
+                yield digit_string.rstrip('0')
+            return
+        if digit_string is not None:
+            yield digit_string
+        digit_string = '%0*d' % (chunk, t)
+
 def floor(x):
     """Round x down to an integer."""
 
@@ -1012,6 +3026,9 @@ def _cf_ipow(x, n):
     # than left-to-right algorithm for an argument which is
     # an irrational 2**k'th root of a rational number.
 
+    if simplify_nodes and isinstance(x, root) and not n % x.k:
+        # (x**(1/k))**(m*k) == x**m
+        return _cf_ipow(x.x, n//x.k)
     if n < 0:
         negative_exponent = 1
         n = -n
@@ -1187,6 +3204,10 @@ def copysign(x,y):
 def log1p(x):
     """Return the natural logarithm of 1+x (base e).
           The result is computed in a way which is accurate for x near zero."""
+    ratio = _cf_rational(x)
+    if ratio is not None:
+        # Add 1 exactly.
+        return log(cf(ratio[0] + ratio[1], ratio[1]))
     return log(x+1)
 
 def trunc(x):
@@ -1226,93 +3247,497 @@ def factorial(x):
         return reduce(operator.mul,(k for k in range(1,1+int(x))))
 
 def _cf_isqrt(x):
-    """Calculate an integer approximation of square root of x."""
+    """Calculate the integer part of the square root of x."""
 
     if x < 0:
         raise (ValueError,
             'the square root of a negative number cannot be computed')
-    r1 = 1
-    r2 = x
-    while not (-1 <= (r1-r2) <= 1):
-        r1 = (r1 + r2)//2
-        r2 = x//r1
-    return r1
+    if not x:
+        return 0
+    # Newton's method, doubling the precision of the root with each
+    # step, so that the whole takes about as long as the last division.
+    # The loop leaves either the integer part or the one greater by one.
+    c = (x.bit_length() - 1)//2
+    r = 1
+    d = 0
+    for shift in xrange(c.bit_length() - 1, -1, -1):
+        e = d
+        d = c >> shift
+        r = (r << d - e - 1) + (x >> 2*c - e - d + 1)//r
+    if r*r > x:
+        r -= 1
+    return r
+
+def _cf_iroot(x, k):
+    """Calculate the integer part of the kth root of x >= 0."""
+
+    if k == 2:
+        return _cf_isqrt(x)
+    if x < 0:
+        raise ValueError, 'the root of a negative number cannot be computed'
+    if not x:
+        return 0
+    n = x.bit_length()
+    if n <= 2*k:
+        r = 1 << (n + k - 1)//k
+    else:
+        # Start from a little above the root of the leading half of
+        # the bits, which is accurate to about as many bits, so that
+        # Newton's method, doubling them with each step, goes down
+        # to the integer part within a step or two.
+        shift = n//(2*k)
+        r = (_cf_iroot(x >> k*shift, k) + 1) << shift
+    while 1:
+        s = ((k - 1)*r + x//r**(k - 1))//k
+        if s >= r:
+            return r
+        r = s
+
+def _cf_squarefree(d):
+    """Return (f, d'), such that d == f*f*d', where d' has no square
+    factors k*k for k below 1000; factoring out all the squares would
+    take too long for large d's."""
+
+    f = 1
+    k = 2
+    while k < 1000 and k*k <= d:
+        while not d % (k*k):
+            d //= k*k
+            f *= k
+        k += 1
+    return f, d
+
+def _cf_surd(a, b, c, d):
+    """Return (a + b*sqrt(d))/c for integers a, b, c != 0 and d,
+    where d > 1 isn't a square, reduced to lowest terms; the
+    rational a/c if b == 0."""
+
+    if not b:
+        return cf(a, c)
+    divisor = _cf_gcd(_cf_gcd(a, b), c)
+    if c < 0:
+        divisor = -divisor
+    self = object.__new__(quadratic)
+    self.a, self.b, self.c, self.d = a//divisor, b//divisor, c//divisor, d
+    self.cache = array('l')
+    self.spill = None
+    self.next_pq = self._resume()
+    return self
+
+class quadratic(cf_base):
+    """Exact quadratic irrational (a + b*sqrt(d))/c, for integers
+    a, b, c != 0 and d >= 0; a rational number if b*b*d is a square.
+    Sums, differences, products, quotients and integer powers of
+    quadratics with the same d and rationals are quadratics again,
+    and compare exactly; mixed with other numbers, they fall back
+    to binop() and unop(). The partial quotients are eventually
+    periodic and come from integer recurrences; once the period
+    closes, each one is a copy of the one a period earlier.
+    sqrt() returns quadratics for rational arguments. Only the
+    square factors k*k of d with k below 1000 are taken out of the
+    square root, see _cf_squarefree(), so e.g. sqrt(3) and
+    sqrt(3*1009**2)/1009 have the same partial quotients, but
+    different d's, and don't combine exactly."""
+
+    __slots__ = ('a', 'b', 'c', 'd', 'cache', 'spill', 'next_pq')
+
+    def __new__(cls, a, b, d, c=1):
+        if not c:
+            raise ZeroDivisionError, 'quadratic with c == 0'
+        if d < 0:
+            raise ValueError, 'quadratic with d < 0'
+        f, d = _cf_squarefree(d)
+        b *= f
+        r = _cf_isqrt(d)
+        if r*r == d:
+            return cf(a + b*r, c)
+        return _cf_surd(a, b, c, d)
+
+    def _quadratic_generator(self):
+        """Generate the partial quotients of self."""
+
+        # The complete quotients are (p + sqrt(d))/q, where q divides
+        # d - p*p, starting with (a + b*sqrt(d))/c written so. Once
+        # one of them is reduced, i.e. greater than 1 with its
+        # conjugate between -1 and 0, so are all the following ones,
+        # and they are purely periodic.
+        a, b, c = self.a, self.b, self.c
+        if b < 0:
+            a, b, c = -a, -b, -c
+        p, q = a*abs(c), c*abs(c)
+        d = b*b*self.d*c*c
+        s = _cf_isqrt(d)
+        n = 0
+        start = None
+        while 1:
+            if start is None:
+                if 0 < p <= s and s - p < q <= s + p:
+                    start, first = n, (p, q)
+            elif (p, q) == first:
+                break
+            if q > 0:
+                t = (p + s)//q
+            else:
+                # The floor is that of (p + s + 1)/q, as sqrt(d)
+                # lies strictly between s and s + 1.
+                t = (p + s + 1)//q
+            yield t
+            p = t*q - p
+            q = (d - p*p)//q
+            n += 1
+        period = n - start
+        cache = self.cache
+        while 1:
+            yield _cf_lookup(self, len(cache) - period)
 
-class sqrt(cf_base):
-    """Lazily calculate the square root using Newton's method,
-    which doubles its accuracy with each iteration."""
+    def _checkpoint(self):
+        """The cache is all the state there is."""
 
-    def __new__(cls, x):
-        """Initialize the lazy calculation: set self.plain to the
-        best approximation of sqrt(x) that can be achieved with
-        integer calculations; set self.converse to x/self.plain."""
+        return ()
+
+    def _resume(self):
+        """Return the generator of the partial quotients of self
+        after those already cached, which are computed again."""
+
+        return _cf_skip(self._quadratic_generator().next,
+                        len(self.cache)).next
+
+    def _operand(self, other):
+        """Return (a, b, c) for other == (a + b*sqrt(self.d))/c,
+        if other is a rational number or a quadratic with the same d,
+        otherwise None."""
+
+        if type(other) is quadratic:
+            if other.d == self.d:
+                return other.a, other.b, other.c
+            return None
+        ratio = _cf_rational(other)
+        if ratio is None:
+            return None
+        return ratio[0], 0, ratio[1]
+
+    def __add__(self, other):
+        """Add other to self."""
+
+        operand = self._operand(other)
+        if operand is None:
+            return cf_base.__add__(self, other)
+        a, b, c = operand
+        return _cf_surd(self.a*c + a*self.c, self.b*c + b*self.c,
+                        self.c*c, self.d)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        """Subtract other from self."""
+
+        operand = self._operand(other)
+        if operand is None:
+            return cf_base.__sub__(self, other)
+        a, b, c = operand
+        return _cf_surd(self.a*c - a*self.c, self.b*c - b*self.c,
+                        self.c*c, self.d)
+
+    def __rsub__(self, other):
+        """Subtract self from other."""
+
+        operand = self._operand(other)
+        if operand is None:
+            return cf_base.__rsub__(self, other)
+        a, b, c = operand
+        return _cf_surd(a*self.c - self.a*c, b*self.c - self.b*c,
+                        self.c*c, self.d)
+
+    def __mul__(self, other):
+        """Multiply self by other."""
+
+        operand = self._operand(other)
+        if operand is None:
+            if type(other) is quadratic and not (self.a or other.a):
+                # b*sqrt(d)/c*f*sqrt(g)/h == b*f*sqrt(d*g)/(c*h)
+                return quadratic(0, self.b*other.b, self.d*other.d,
+                                 self.c*other.c)
+            return cf_base.__mul__(self, other)
+        a, b, c = operand
+        d = self.d
+        return _cf_surd(self.a*a + self.b*b*d, self.a*b + self.b*a,
+                        self.c*c, d)
+
+    __rmul__ = __mul__
+
+    def _inverse(self, a, b, c):
+        """Return c/(a + b*sqrt(self.d)) as (a', b', c')."""
+
+        # Multiply by the conjugate; the norm a*a - b*b*d
+        # vanishes only for a == b == 0.
+        return c*a, -c*b, a*a - b*b*self.d
+
+    def __div__(self, other):
+        """Divide self by other."""
+
+        operand = self._operand(other)
+        if operand is None:
+            if type(other) is quadratic and not (self.a or other.a):
+                # b*sqrt(d)/c/(f*sqrt(g)/h) == b*h*sqrt(d*g)/(c*f*g)
+                return quadratic(0, self.b*other.c, self.d*other.d,
+                                 self.c*other.b*other.d)
+            return cf_base.__div__(self, other)
+        if not (operand[0] or operand[1]):
+            return NaN
+        a, b, c = self._inverse(*operand)
+        d = self.d
+        return _cf_surd(self.a*a + self.b*b*d, self.a*b + self.b*a,
+                        self.c*c, d)
+
+    __truediv__ = __div__
+
+    def __rdiv__(self, other):
+        """Divide other by self."""
+
+        operand = self._operand(other)
+        if operand is None:
+            return cf_base.__rdiv__(self, other)
+        a, b, c = self._inverse(self.a, self.b, self.c)
+        e, f, g = operand
+        d = self.d
+        return _cf_surd(a*e + b*f*d, a*f + b*e, c*g, d)
+
+    __rtruediv__ = __rdiv__
+
+    def __neg__(self):
+        """Return self negated."""
+
+        return _cf_surd(-self.a, -self.b, self.c, self.d)
+
+    def __pow__(self, other, z=None):
+        """Return self to the power other, modulo z; exactly
+        for integer other."""
+
+        if z is not None or not isinstance(other, (int, long)):
+            return cf_base.__pow__(self, other, z)
+        if other < 0:
+            return 1/(self**-other)
+        result = one
+        x = self
+        while other:
+            if other & 1:
+                result = x*result
+            other >>= 1
+            if other:
+                x = x*x
+        return result
+
+    def __cmp__(self, other):
+        """Compare self to other, exactly if other is a rational
+        number or a quadratic with the same d."""
+
+        operand = self._operand(other)
+        if operand is None:
+            return cf_base.__cmp__(self, other)
+        a, b, c = operand
+        # The sign of (a + b*sqrt(d))/c, c > 0, for the difference.
+        d = self.d
+        a, b = self.a*c - a*self.c, self.b*c - b*self.c
+        if a >= 0 and b >= 0:
+            return int(bool(a or b))
+        if a <= 0 and b <= 0:
+            return -1
+        return cmp(a*a, b*b*d)*(a > 0 and 1 or -1)
+
+    def __nonzero__(self):
+        """Return True, as a quadratic irrational isn't 0."""
+
+        return True
+
+    def _square_root(self):
+        """Return the square root of self > 0 as the sum of two square
+        roots of rationals if it can be denested, otherwise None."""
+
+        # sqrt((a + b*sqrt(d))/c) == sqrt(A + B*sqrt(d))/c for A == a*c
+        # and B == b*c, which is sqrt((A + k)/2) + sqrt((A - k)/2), with
+        # the sign of B on the latter, if A*A - B*B*d is a square k*k.
+        a, b, c, d = self.a, self.b, self.c, self.d
+        a, b = a*c, b*c
+        n = a*a - b*b*d
+        if n < 0:
+            return None
+        k = _cf_isqrt(n)
+        if k*k != n:
+            return None
+        u, v = sqrt(cf(a + k, 2)), sqrt(cf(a - k, 2))
+        if b < 0:
+            v = -v
+        return (u + v)/c
+
+def _cf_root_bounds(p, q, k, bits):
+    """Return (r, shift), such that r/2**shift <= (p/q)**(1/k) <
+    (r + 1)/2**shift, for p/q > 0, with about bits significant bits."""
+
+    # The root has about (p.bit_length() - q.bit_length())/k bits
+    # before the binary point.
+    shift = max(bits - (p.bit_length() - q.bit_length())//k + 2, 0)
+    return _cf_iroot((p << k*shift)//q, k), shift
+
+class _cf_root_ratio(_cf_enclosure):
+    """Regular continued fraction for the kth root of a rational
+    number p/q > 0 that isn't the kth power of one; see root()."""
+
+    __slots__ = ('p', 'q', 'k')
+
+    def __new__(cls, p, q, k):
+        self = _cf_enclosure.__new__(cls)
+        self.p, self.q, self.k = p, q, k
+        return self
+
+    def _enclose(self, bits):
+        """Return (a, b, c, d), such that a/b <= self <= c/d."""
+
+        r, shift = _cf_root_bounds(self.p, self.q, self.k, bits)
+        return r, 1 << shift, r + 1, 1 << shift
+
+class root(_cf_enclosure):
+    """Lazily calculate the kth root of x; k must be a positive
+    integer. Odd roots of negative numbers are negative. The roots
+    of rational numbers are computed to increasing precision with
+    integer arithmetic, and exactly for the kth powers of rationals.
+    Those of other numbers come from the same integer roots of the
+    ends of the enclosure of x by two consecutive convergents,
+    which takes enough partial quotients of x for the precision,
+    without a Newton iteration on continued fractions."""
+
+    __slots__ = ('x', 'k', 'depth', 'convergents')
+
+    def __new__(cls, x, k):
+        if not isinstance(k, (int, long)) or k < 1:
+            raise ValueError, 'the degree of a root must be a positive integer'
+        if k == 1:
+            return cf(x)
+        if k == 2:
+            return sqrt(x)
+        ratio = _cf_rational(x)
+        if ratio is not None:
+            p, q = ratio
+            if p < 0:
+                if not k & 1:
+                    raise ValueError, \
+                        'even roots of negative numbers cannot be computed'
+                return -root(cf(-p, q), k)
+            if not p:
+                return zero
+            divisor = _cf_gcd(p, q)
+            p, q = p//divisor, q//divisor
+            u, v = _cf_iroot(p, k), _cf_iroot(q, k)
+            if u**k == p and v**k == q:
+                return cf(u, v)
+            return _cf_root_ratio(p, q, k)
+        x = cf(x)
+        t = x.pq(0)
+        if t is None:
+            return NaN
+        if t < 0:
+            if not k & 1:
+                raise ValueError, \
+                    'even roots of negative numbers cannot be computed'
+            return -root(-x, k)
+        self = _cf_enclosure.__new__(cls)
+        self.x, self.k = x, k
+        self._start()
+        return self
+
+    def _start(self):
+        """Start taking the partial quotients of self.x from the first
+        one on. self.depth is the number of those taken, or None after
+        the last one; self.convergents is the product of their matrices,
+        as returned by _cf_product()."""
+
+        self.depth = 0
+        self.convergents = 1, 0, 0, 1
+
+    def _enclose(self, bits):
+        """Return (a, b, c, d), such that a/b <= self <= c/d."""
+
+        x_pq, k = self.x.pq, self.k
+        n = self.depth
+        p, q, r, s = self.convergents
+        # x lies between p/q and r/s, which differ by 1/(q*s), that is,
+        # by about 1/(p*s) times x, and the kth root differs by about
+        # 1/k times as much relative to itself. Go on from the partial
+        # quotients of x taken for the previous enclosures, doubling
+        # their number until there are enough of them.
+        while n is not None and (p*s).bit_length() <= bits + 2:
+            pqs = []
+            for i in xrange(n, 2*n or 16):
+                t = x_pq(i)
+                if t is None:
+                    break
+                if t <= 0 and i:
+                    # The convergents of an expansion such as
+                    # cf((1, 0, -2)) don't enclose x, so start over
+                    # with the canonical expansion, as output by
+                    # _cf_homographic().
+                    self.x = unop(self.x, 1, 0, 0, 1)
+                    self._start()
+                    return self._enclose(bits)
+                pqs.append(t)
+            p, q, r, s = _cf_matrix_product((p, q, r, s),
+                _cf_product(pqs, 0, len(pqs)))
+            if t is None:
+                n = None
+            else:
+                n += len(pqs)
+        self.depth = n
+        self.convergents = p, q, r, s
+        if n is None:
+            # x == p/q after all.
+            u, v = _cf_iroot(p, k), _cf_iroot(q, k)
+            if u**k == p and v**k == q:
+                return u, v, u, v
+            r, shift = _cf_root_bounds(p, q, k, bits)
+            return r, 1 << shift, r + 1, 1 << shift
+        if p*s > q*r:
+            p, q, r, s = r, s, p, q
+        a, shift = _cf_root_bounds(p, q, k, bits)
+        c, shift2 = _cf_root_bounds(r, s, k, bits)
+        return a, 1 << shift, c + 1, 1 << shift2
+
+class sqrt(root):
+    """Lazily calculate the square root of x; see root(). The square
+    roots of rational numbers are periodic continued fractions,
+    computed with integer recurrences, and exact for the squares
+    of rationals."""
+
+    __slots__ = ()
 
+    def __new__(cls, x):
         if x == 0:
-            # Newton's method doesn't work for x == 0.
             return zero
         if isinstance(x, float) and str(x)=='inf':
 	    return x
         if isinstance(x, float) and str(x)=='nan':
 	    return x
-        self = object.__new__(cls)
-        if isinstance(x, (int, long)):
-            # Precompute self.plain as the integer approximation
-            # to sqrt(x).
-            integer_root = _cf_isqrt(x)
-            self.plain = cf(integer_root)
-            self.converse = cf(x, integer_root)
-        else:
-            x = cf(x)
-            if (x.pq(0) == 0) and (x.pq(1) > 1):
-                # For 0 < x <= 1/2 precompute self.plain as the
-                # inverse of the integer approximation of sqrt(1/x).
-                integer_root = _cf_isqrt(x.pq(1))
-                self.plain = cf(1,integer_root)
-                self.converse = x*integer_root
-            else:
-                # For x > 1/2 precompute self.plain as the integer
-                # approximation to sqrt(x).
-                integer_root = _cf_isqrt(x.pq(0))
-                self.plain = cf(integer_root)
-                self.converse = x/integer_root
-        self.x = x
-        self.cache = []
+        ratio = _cf_rational(x)
+        if ratio is not None:
+            p, q = ratio
+            if p < 0:
+                raise (ValueError,
+                    'the square root of a negative number cannot be computed')
+            # sqrt(p/q) == sqrt(p*q)/q
+            return quadratic(0, 1, p*q, q)
+        x = cf(x)
+        t = x.pq(0)
+        if t is None or t < 0:
+            # This includes cf(-inf), which is a NaN.
+            raise (ValueError,
+                'the square root of a negative number cannot be computed')
+        if type(x) is quadratic:
+            result = x._square_root()
+            if result is not None:
+                return result
+        self = _cf_enclosure.__new__(cls)
+        self.x, self.k = x, 2
+        self._start()
         return self
 
-    def pq(self, n):
-        """Return the nth partial quotient of sqrt(self.x)."""
-
-        # I'd love to plug the result back to itself, but alas
-        # it wouldn't work if the continued fraction of the
-        # square root ends in 1, 1, 1,...
-        if n < len(self.cache):
-            return self.cache[n]
-        while 1:
-            # As Newton's method doubles the accuracy with each
-            # iteration, it should also double the number of correct
-            # partial quotients, so the loop should actually iterate
-            # only twice.
-            pq = self.plain.pq(n)
-            if pq == self.converse.pq(n):
-                # Memoize the partial quotient and return it.
-                self.cache.append(pq)
-                return pq
-
-            # self.plain = (self.plain + self.converse)/2
-            self.plain = binop(self.plain, self.converse,
-                0, 1, 1, 0, 0, 0, 0, 2)
-            self.converse = self.x/self.plain
-
-            # Compute the partial quotients number 0..n-1
-            # of self.plain and self.converse, so that we
-            # can examine their pq(n) in the next iteration
-            # of the main loop.
-            plain_pq = self.plain.pq
-            converse_pq = self.converse.pq
-            for i in xrange(n):
-                plain_pq(i)
-                converse_pq(i)
-
 def hypot(x, y):
     """Return the Euclidean norm of (x, y)."""
     if str(x)=='inf' or str(x)=='-inf':
@@ -1328,11 +3753,14 @@ class _cf_exp_1n(cf_base):
     """Return e**(1/n) == cf(1;n-1,1,1,3*n-1,1,1,5*n-1,1,1,...).
     Used in exp() and log()."""
 
+    __slots__ = ('pq', 'inverse_exponent')
+
     def __new__(cls, inverse_exponent):
         """Set self.pq to a closure that returns the nth partial
         quotient of e**(1/inverse_exponent) quickly, regardless of n."""
 
         self = object.__new__(cls)
+        self.inverse_exponent = inverse_exponent
         if inverse_exponent > 1:
             # This is the most frequent case; called repeatedly
             # from exp.pq().
@@ -1365,6 +3793,11 @@ class _cf_exp_1n(cf_base):
             # e**(1/0) == NaN.
             return NaN
 
+    def _arguments(self):
+        """Return the class and the argument that created self."""
+
+        return type(self), (self.inverse_exponent,)
+
 # The base of the natural logarithm.
 e = _cf_exp_1n(1)
 
@@ -1373,7 +3806,8 @@ def _cf_exp_2_to_nth(n, cache=[e]):
     Used to speed up exp() and log()."""
 
     while len(cache) <= n:
-        cache.append(cache[-1]*cache[-1])
+        cache.append(_cf_constant('exp_2_to_%d' % len(cache),
+            cache[-1]*cache[-1]))
     return cache[n]
 
 def _cf_iexp(n):
@@ -1411,6 +3845,90 @@ def _cf_iexp(n):
         k += 1
     return result
 
+def _cf_exp_series(a, b, p, q):
+    """Return (P, Q, T) for the terms a..b-1 of the Taylor series of
+    e**(p/q), so that the sum of the terms 0..b-1 is T/Q for a == 0
+    and the term b-1 is P/Q; see _cf_exp_enclosure()."""
+
+    if b - a == 1:
+        if a:
+            return p, a*q, p
+        return 1, 1, 1
+    middle = (a + b)//2
+    p1, q1, t1 = _cf_exp_series(a, middle, p, q)
+    p2, q2, t2 = _cf_exp_series(middle, b, p, q)
+    return p1*p2, q1*q2, t1*q2 + p1*t2
+
+def _cf_exp_enclosure(p, q, bits):
+    """Return (a, b, c, d), such that a/b <= e**(p/q) <= c/d, for
+    integers p >= 0 and q > 0, with c/d - a/b about 2**-bits times
+    e**(p/q)."""
+
+    if not p:
+        return 1, 1, 1, 1
+    # Halve the argument m times, to below 1/2, so that the series
+    # converges quickly, then square its sum m times. Every squaring
+    # doubles the relative error, hence the m extra bits.
+    m = (p//q).bit_length() + 1
+    bits += m + 32
+    q <<= m
+    # Find n such that the term n-1, x**(n-1)/(n-1)!, is below 2**-bits.
+    from math import log
+    log_x = log(p, 2) - log(q, 2)
+    n = 1
+    log_term = 0.0
+    while log_term > -bits:
+        log_term += log_x - log(n, 2)
+        n += 1
+    # Make up for the rounding errors of the floats above.
+    n += 1
+    p, q, t = _cf_exp_series(0, n, p, q)
+    # With x <= 1/2, the tail of the series after the term n-1 is at
+    # most x/n/(1 - x/n) <= 1 times the term n-1, which is p/q.
+    a, b, c, d = t, q, t + p, q
+    for i in xrange(m):
+        a, b, c, d = _cf_round_outwards((a, b, c, d), bits)
+        a, b, c, d = a*a, b*b, c*c, d*d
+    return a, b, c, d
+
+class _cf_exp_ratio(_cf_enclosure):
+    """Regular continued fraction for exp, sinh, cosh or tanh of
+    a rational number p/q; see exp() and sinh() et al."""
+
+    __slots__ = ('p', 'q', 'function')
+
+    def __new__(cls, p, q, function='exp'):
+        self = _cf_enclosure.__new__(cls)
+        self.p, self.q, self.function = p, q, function
+        return self
+
+    def _enclose(self, bits):
+        """Return (a, b, c, d), such that a/b <= self <= c/d, from
+        the enclosure [a/b, c/d] of E == e**abs(p/q) >= 1, using
+        the monotonicity of exp, sinh, cosh and tanh in E."""
+
+        p, q, function = self.p, self.q, self.function
+        negative = p < 0
+        a, b, c, d = _cf_exp_enclosure(abs(p), q, bits)
+        if function == 'exp':
+            if negative:
+                return d, c, b, a
+            return a, b, c, d
+        aa, bb, cc, dd = a*a, b*b, c*c, d*d
+        if function == 'sinh':
+            # (E - 1/E)/2
+            lower, upper = (aa - bb, 2*a*b), (cc - dd, 2*c*d)
+        elif function == 'cosh':
+            # (E + 1/E)/2, which is even.
+            return aa + bb, 2*a*b, cc + dd, 2*c*d
+        else:
+            # (E*E - 1)/(E*E + 1)
+            lower, upper = (aa - bb, aa + bb), (cc - dd, cc + dd)
+        if negative:
+            # sinh and tanh are odd.
+            lower, upper = (-upper[0], upper[1]), (-lower[0], lower[1])
+        return lower + upper
+
 class exp(cf_base):
     """Calculate e to the power x, lazily decomposing x into
     an alternating sum of fractions with alternatingly a bit
@@ -1418,6 +3936,8 @@ class exp(cf_base):
     denominators, known as the Ostrogradsky series of second
     kind."""
 
+    __slots__ = ('x', 'better', 'worse', 'muldiv', 'cache', 'spill')
+
     # References for the Ostrogradsky series of second kind:
     # * Wac{\l}aw Sierpi\'nski, O kilku algorytmach dla rozwijania
     #   liczb rzeczywistych na szeregi, Sprawozdania z posiedze\'n
@@ -1435,14 +3955,38 @@ class exp(cf_base):
         """Initialize the lazy calculation: set self.better
         to e**floor(x) and self.x to x - floor(x)."""
 
-        if isinstance(x, (int,long)):
-            # Fast track for integer exponents.
+        if isinstance(x, (int,long)) and -1 <= x <= 1:
+            # Fast track for e, 1 and 1/e.
             return _cf_iexp(x)
         if isinstance(x, float) and str(x)=='inf':
             return x
         if isinstance(x, float) and str(x)=='-inf':
             return 0.0
+        if simplify_nodes:
+            # exp(log(y)) == y
+            y = _cf_inverse(x, 'log')
+            if y is not None:
+                return y
+        ratio = _cf_rational(x)
+        if ratio is not None:
+            # Sum the Taylor series of an exact rational
+            # exponent by binary splitting.
+            if intern_nodes:
+                key = (_cf_exp_ratio, ratio)
+                self = _cf_interned(key)
+                if self is not None:
+                    return self
+            self = _cf_exp_ratio(*ratio)
+            if intern_nodes:
+                _cf_intern(key, self, ())
+            return _cf_remember(self, 'exp', cf(*ratio))
         x = cf(x)
+        if intern_nodes:
+            operand, operands = _cf_operand_key(x)
+            key = (cls, operand)
+            self = _cf_interned(key)
+            if self is not None:
+                return self
         exponent = x.pq(0)
         if exponent is None:
             return NaN
@@ -1451,8 +3995,11 @@ class exp(cf_base):
         self.worse = NaN
         self.x = x - exponent
         self.muldiv = 1
-        self.cache = []
-        return self
+        self.cache = array('l')
+        self.spill = None
+        if intern_nodes:
+            _cf_intern(key, self, operands)
+        return _cf_remember(self, 'exp', x)
 
     def pq(self, n):
         """Return the common partial quotients of e**(the last
@@ -1469,7 +4016,7 @@ class exp(cf_base):
         1 - 1/2 + 1/6 - 1/42 + ... == cf(0; 1, 1, 4, 9, 196,...)"""
 
         if n < len(self.cache):
-            return self.cache[n]
+            return _cf_lookup(self, n)
         # We need to compute another term.
         assert n == len(self.cache)
         while 1:
@@ -1482,7 +4029,7 @@ class exp(cf_base):
                 # quotients of self.worse and self.better coincide,
                 # the actual partial quotient of e**x will be equal
                 # to them.
-                self.cache.append(greater)
+                _cf_store(self, greater)
                 return greater
             elif lesser is not None:
                 if lesser > greater:
@@ -1510,8 +4057,8 @@ class exp(cf_base):
                         # then heuristically decide that the result
                         # is a rational number: emit greater and
                         # end the continued fraction.
-                        self.cache.append(greater)
-                        self.cache.append(None)
+                        _cf_store(self, greater)
+                        _cf_store(self, None)
                         return greater
             # Compute self.x.pq(0), so that
             # we can compute self.x.pq(1).
@@ -1544,6 +4091,169 @@ class exp(cf_base):
             for i in xrange(n):
                 better_pq(i)
 
+def _cf_ln2_enclosure(bits, cache=[0, None]):
+    """Return (a, b, c, d), such that a/b <= log(2) <= c/d, with c/d -
+    a/b about 2**-bits, using log(2) == 18*atanh(1/26) -
+    2*atanh(1/4801) + 8*atanh(1/8749), summed by binary splitting.
+    Keeps the most precise enclosure computed so far in cache."""
+
+    if cache[0] < bits:
+        # Grow the cache geometrically, for callers that
+        # ask for a few more bits each time.
+        work = max(bits, 2*cache[0])
+        a, b, c, d = 0, 1, 0, 1
+        for factor, n in (18, 26), (-2, 4801), (8, 8749):
+            # atanh(1/n) == sum(prod((2*j - 1)/((2*j + 1)*n*n),
+            # j=1..k), k=0..inf)/n; see _cf_atan_sum().
+            v = n*n
+            p, q, t = _cf_atan_series(0, work//(v.bit_length() - 2) + 2,
+                                      1, v, 1)
+            e, f, g, h = t, n*q, t + p, n*q
+            if factor < 0:
+                e, f, g, h = g, h, e, f
+            a, b, c, d = _cf_round_outwards((a*f + factor*b*e, b*f,
+                c*h + factor*d*g, d*h), work + 8)
+        cache[:] = [work, (a, b, c, d)]
+    return _cf_round_outwards(cache[1], bits)
+
+def _cf_log_enclosure(p, q, bits):
+    """Return (a, b, c, d), such that a/b <= log(p/q) <= c/d, with
+    c/d - a/b about 2**-bits times abs(log(p/q)), for integers p, q > 0,
+    p != q. Writes p/q as 2**k*m, with 2/3 <= m <= 4/3, so that
+    log(p/q) == k*log(2) + 2*atanh((m - 1)/(m + 1)), where
+    abs((m - 1)/(m + 1)) <= 1/5."""
+
+    k = p.bit_length() - q.bit_length()
+    if k > 0:
+        u, v = p, q << k
+    else:
+        u, v = p << -k, q
+    if 3*u < 2*v:
+        k -= 1
+        u <<= 1
+    elif 3*u > 4*v:
+        k += 1
+        v <<= 1
+    u, v = u - v, u + v
+    if not k:
+        # log(p/q) is about 2*u/v, which may be small.
+        bits += v.bit_length() - abs(u).bit_length()
+    bits += 8
+    a, b, c, d = _cf_atan_sum(abs(u), v, bits, 1)
+    a, c = 2*a, 2*c
+    if u < 0:
+        a, b, c, d = -c, d, -a, b
+    if k:
+        e, f, g, h = _cf_ln2_enclosure(bits)
+        if k < 0:
+            e, f, g, h = g, h, e, f
+        a, b, c, d = _cf_round_outwards(
+            (a*f + k*b*e, b*f, c*h + k*d*g, d*h), bits)
+    return a, b, c, d
+
+class _cf_log_ratio(_cf_enclosure):
+    """Regular continued fraction for log(p/q), or log(p/q)/log(r/s)
+    if r is not None; see _cf_rational_log()."""
+
+    __slots__ = ('p', 'q', 'r', 's')
+
+    def __new__(cls, p, q, r=None, s=None):
+        self = _cf_enclosure.__new__(cls)
+        self.p, self.q, self.r, self.s = p, q, r, s
+        return self
+
+    def _enclose(self, bits):
+        """Return (a, b, c, d), such that a/b <= self <= c/d."""
+
+        a, b, c, d = _cf_log_enclosure(self.p, self.q, bits)
+        if self.r is None:
+            return a, b, c, d
+        # The enclosure of log(r/s) is relatively tight, so it
+        # doesn't contain 0.
+        e, f, g, h = _cf_log_enclosure(self.r, self.s, bits)
+        if g < 0:
+            a, b, c, d = -c, d, -a, b
+            e, f, g, h = -g, h, -e, f
+        if a >= 0:
+            a, b = a*h, b*g
+        else:
+            a, b = a*f, b*e
+        if c >= 0:
+            c, d = c*f, d*e
+        else:
+            c, d = c*h, d*g
+        return a, b, c, d
+
+def _cf_rational_log(x, base=None):
+    """Return log(p/q) for the ratio x == (p, q), p, q > 0, or
+    log(p/q)/log(r/s) for base == (r, s), r, s > 0, r != s,
+    summing the series for atanh by binary splitting."""
+
+    p, q = x
+    if p == q:
+        return zero
+    if base is None:
+        return _cf_log_ratio(p, q)
+    r, s = base
+    # By the Gelfond-Schneider theorem, log(p/q)/log(r/s) is either
+    # transcendental or rational, and then p/q and r/s are powers of
+    # some u/v; see _cf_power_exponents().
+    g = _cf_gcd(p, q)
+    p, q = p//g, q//g
+    g = _cf_gcd(r, s)
+    r, s = r//g, s//g
+    if p < q:
+        if r < s:
+            quotients = _cf_power_exponents(q, p, s, r)
+        else:
+            quotients = _cf_power_exponents(q, p, r, s)
+    elif r < s:
+        quotients = _cf_power_exponents(p, q, s, r)
+    else:
+        quotients = _cf_power_exponents(p, q, r, s)
+    if quotients is not None:
+        m, n = _cf_product(quotients, 0, len(quotients))[:2]
+        if (p < q) != (r < s):
+            m = -m
+        return cf(m, n)
+    return _cf_log_ratio(p, q, r, s)
+
+def _cf_power_exponents(p, q, r, s):
+    """Return the partial quotients of m/n if p/q == (u/v)**m and
+    r/s == (u/v)**n for some integers m, n > 0 and u > v > 0, or None,
+    given p/q, r/s > 1 in lowest terms."""
+
+    # p, q, r and s are then u**m, v**m, u**n and v**n, so Euclid's
+    # algorithm on m and n can divide p by the greatest power of r that
+    # it holds, and q by the same power of s; any remainder shows that
+    # there is no such u/v. The quotients only shrink, so it takes
+    # O(log(m)) steps.
+    quotients = []
+    while 1:
+        # The greatest t with r**t <= p, by repeated squaring.
+        powers = [r]
+        while 2*powers[-1].bit_length() - 1 <= p.bit_length():
+            powers.append(powers[-1]*powers[-1])
+        t, power = 0, 1
+        for i in xrange(len(powers) - 1, -1, -1):
+            if power*powers[i] <= p:
+                power *= powers[i]
+                t += 1 << i
+        p, remainder = divmod(p, power)
+        if remainder:
+            return None
+        q, remainder = divmod(q, s**t)
+        if remainder:
+            return None
+        quotients.append(t)
+        if p == 1:
+            if q == 1:
+                return quotients
+            return None
+        if p <= q:
+            return None
+        p, q, r, s = r, s, p, q
+
 def _cf_ilog(x):
     """Return a tuple (floor(log(x)), x/e**floor(log(x))); the
     second element belongs to the range [1, e). Uses a cached
@@ -1576,12 +4286,23 @@ class log(cf_base):
     large [or exact] exponent) and 1/e**(a bit too small
     [or exact] exponent) and adding the exponents."""
 
+    __slots__ = ('x', 'better', 'worse', 'addsub', 'cache', 'spill')
+
     def __new__(cls, x, base=e):
         """Initialize the lazy calculation: set self.better
         to floor(log(x)) and self.x to x/floor(log(x))."""
 
         if base is not e:
+            ratio = _cf_rational(x), _cf_rational(base)
+            if (None not in ratio and ratio[0][0] > 0 and
+                ratio[1][0] > 0 and ratio[1][0] != ratio[1][1]):
+                return _cf_rational_log(*ratio)
             return log(x)/log(base)
+        if simplify_nodes:
+            # log(exp(y)) == y
+            y = _cf_inverse(x, 'exp')
+            if y is not None:
+                return y
         if isinstance(x, cf_base) and (x.pq(0) is None):
             return NaN
         if isinstance(x, float) and str(x)=='inf':
@@ -1591,12 +4312,17 @@ class log(cf_base):
         if x <= 0:
             raise (ValueError,
                 'the logarithm of a non-positive number cannot be computed')
+        ratio = _cf_rational(x)
+        if ratio is not None:
+            # Sum the series for atanh by binary splitting.
+            return _cf_remember(_cf_rational_log(ratio), 'log', cf(*ratio))
         self = object.__new__(cls)
         self.better, self.x = _cf_ilog(x)
         self.worse = NaN
         self.addsub = 1
-        self.cache = []
-        return self
+        self.cache = array('l')
+        self.spill = None
+        return _cf_remember(self, 'log', x)
 
     def pq(self, n):
         """Return the common partial quotients of the last partial
@@ -1608,7 +4334,7 @@ class log(cf_base):
         least doubles with each term."""
 
         if n < len(self.cache):
-            return self.cache[n]
+            return _cf_lookup(self, n)
         # We need to compute another term.
         while 1:
             q = self.worse.pq(n)
@@ -1620,7 +4346,7 @@ class log(cf_base):
                 # the two approximations coincide, the actual
                 # partial quotient of log(x) will be equal to
                 # them.
-                self.cache.append(q)
+                _cf_store(self, q)
                 return q
             # Compute self.x.pq(0), so that
             # we can compute self.x.pq(1).
@@ -1670,12 +4396,15 @@ class log(cf_base):
             for i in xrange(n):
                 better_pq(i)
 
-log_of_10 = log(10)
-log_of_2 = log(2)
+log_of_10 = _cf_constant('log_of_10', log(10))
+log_of_2 = _cf_constant('log_of_2', log(2))
 
 def log10(x):
     """Return the decimal logarithm of x."""
 
+    if _cf_rational(x) is not None:
+        # Let log() find the exact results, like log10(1000) == 3.
+        return log(x, 10)
     return log(x)/log_of_10
 
 def sinh(x):
@@ -1684,6 +4413,9 @@ def sinh(x):
     if isinstance(x, float) and ( str(x)=='inf' or str(x)=='-inf'):
         return x
 
+    ratio = _cf_rational(x)
+    if ratio is not None:
+        return _cf_exp_ratio(ratio[0], ratio[1], 'sinh')
     # return (exp(x) - exp(-x))/2
     return binop(exp(x), exp(-x), 0, 1, -1, 0, 0, 0, 0, 2)
 
@@ -1692,6 +4424,9 @@ def cosh(x):
     if isinstance(x, float) and ( str(x)=='inf' or str(x)=='-inf'):
         return float('inf')
 
+    ratio = _cf_rational(x)
+    if ratio is not None:
+        return _cf_exp_ratio(ratio[0], ratio[1], 'cosh')
     # return (exp(x) + exp(-x))/2
     return binop(exp(x), exp(-x), 0, 1, 1, 0, 0, 0, 0, 2)
 
@@ -1708,18 +4443,24 @@ def tanh(x):
 
     if x==0:
 	return x
+    ratio = _cf_rational(x)
+    if ratio is not None:
+        return _cf_exp_ratio(ratio[0], ratio[1], 'tanh')
     # return (exp(x) - exp(-x))/(exp(x) + exp(-x))
     return binop(exp(x), exp(-x), 0, 1, -1, 0, 0, 1, 1, 0)
 
 class _cf_tan_1n(cf_base):
     """Return tan(1/n) == cf(0;n-1,1,3*n-2,1,5*n-2,1,...)."""
 
+    __slots__ = ('pq', 'inverse_argument')
+
     def __new__(cls, inverse_argument):
         """Set self.term to a closure that returns the nth
         partial quotient of tan(1/inverse_argument) quickly,
         regardless of n."""
 
         self = object.__new__(cls)
+        self.inverse_argument = inverse_argument
         if inverse_argument > 1:
             # This is the most frequent case; called repeatedly
             # from _cf_tan.term().
@@ -1754,11 +4495,18 @@ class _cf_tan_1n(cf_base):
             # tan(1/0) == NaN.
             return NaN
 
+    def _arguments(self):
+        """Return the class and the argument that created self."""
+
+        return type(self), (self.inverse_argument,)
+
 class _cf_tan(cf_base):
     """Calculate the tangent of x for 0 <= x <= pi/4
     (actually even for 0 <= x < 1), lazily decomposing x
     into the Ostrogradsky series of second kind."""
 
+    __slots__ = ('x', 'better', 'worse', 'addsub', 'cache', 'spill')
+
     def __new__(cls, x):
         """Initialize the lazy calculation: set self.better
         to tan(0) == 0 and self.x to x."""
@@ -1766,12 +4514,21 @@ class _cf_tan(cf_base):
         if x.pq(0) is None:
             return NaN
         assert x.pq(0) == 0
+        if intern_nodes:
+            operand, operands = _cf_operand_key(x)
+            key = (cls, operand)
+            self = _cf_interned(key)
+            if self is not None:
+                return self
         self = object.__new__(cls)
         self.x = x
         self.better = zero
         self.addsub = 1
         self.worse = NaN
-        self.cache = []
+        self.cache = array('l')
+        self.spill = None
+        if intern_nodes:
+            _cf_intern(key, self, operands)
         return self
 
     def pq(self, n):
@@ -1787,7 +4544,7 @@ class _cf_tan(cf_base):
         least doubles with each term."""
 
         if n < len(self.cache):
-            return self.cache[n]
+            return _cf_lookup(self, n)
         # We need to compute another term.
         while 1:
             # Here lesser needn't be less than greater at all.
@@ -1799,7 +4556,7 @@ class _cf_tan(cf_base):
                 # when the partial quotients of self.worse and
                 # self.better coincide, the actual partial quotient
                 # of e**x will be equalto them.
-                self.cache.append(greater)
+                _cf_store(self, greater)
                 return greater
             elif lesser is not None:
                 if lesser > greater:
@@ -1827,8 +4584,8 @@ class _cf_tan(cf_base):
                         # then heuristically decide that the result
                         # is a rational number: emit greater and
                         # end the continued fraction.
-                        self.cache.append(greater)
-                        self.cache.append(None)
+                        _cf_store(self, greater)
+                        _cf_store(self, None)
                         return greater
             # Compute self.x.pq(0), so that
             # we can compute self.x.pq(1).
@@ -1875,8 +4632,19 @@ def tan(x):
         raise ValueError,"math domain error"
     if isinstance(x, float) and str(x)=='-inf':
         raise ValueError,"math domain error"
+    if simplify_nodes:
+        # tan(atan(y)) == y
+        y = _cf_inverse(x, 'atan')
+        if y is not None:
+            return y
     octant = x//quarter_pi
     reduced_octant = octant%4
+    if (simplify_nodes and (reduced_octant & 1) and
+        _cf_rational(x - octant*quarter_pi) == (0, 1)):
+        # x is an odd multiple of pi/4, which x - octant*quarter_pi
+        # found out exactly when x and quarter_pi are homographic
+        # functions of pi.
+        return (one, -one)[reduced_octant == 3]
     if reduced_octant < 2:
         if reduced_octant == 0:
             return _cf_tan(x - octant*quarter_pi)
@@ -1937,6 +4705,8 @@ class _cf_atan(cf_base):
     lazily decomposing x into tan**(partial sum of the
     Ostrogradsky series of the second kind of x)."""
 
+    __slots__ = ('x', 'better', 'worse', 'add_sub', 'cache', 'spill')
+
     def __new__(cls, x):
         """Initialize the lazy calculation: set self.better
         to atan(0) == 0 and self.x to x."""
@@ -1946,7 +4716,8 @@ class _cf_atan(cf_base):
         self.worse = NaN
         self.x = cf(x)
         self.add_sub = 1
-        self.cache = []
+        self.cache = array('l')
+        self.spill = None
         return self
 
     def pq(self, n):
@@ -1959,7 +4730,7 @@ class _cf_atan(cf_base):
         least doubles with each term."""
 
         if n < len(self.cache):
-            return self.cache[n]
+            return _cf_lookup(self, n)
         # We need to compute another term.
         while 1:
             q = self.worse.pq(n)
@@ -1971,7 +4742,7 @@ class _cf_atan(cf_base):
                 # partial quotients of the two approximations
                 # coincide, the actual partial quotient of
                 # atan(x) will be equal to them.
-                self.cache.append(q)
+                _cf_store(self, q)
                 return q
             # Compute self.x.pq(0), so that
             # we can compute self.x.pq(1).
@@ -2027,6 +4798,147 @@ class _cf_atan(cf_base):
             for i in xrange(n):
                 better_pq(i)
 
+def _cf_atan_series(a, b, u, v, hyperbolic=0):
+    """Return (P, Q, T) for the terms a..b-1 of Euler's series
+    sum(prod(2*j*u/((2*j + 1)*v), j=1..k), k=0..inf), or of the series
+    sum(prod((2*j - 1)*u/((2*j + 1)*v), j=1..k), k=0..inf) if hyperbolic
+    is true, so that the sum of the terms 0..b-1 is T/Q for a == 0 and
+    the term b-1 is P/Q; see _cf_atan_sum()."""
+
+    if b - a == 1:
+        if a:
+            p = (2*a - hyperbolic)*u
+            return p, (2*a + 1)*v, p
+        return 1, 1, 1
+    middle = (a + b)//2
+    p1, q1, t1 = _cf_atan_series(a, middle, u, v, hyperbolic)
+    p2, q2, t2 = _cf_atan_series(middle, b, u, v, hyperbolic)
+    return p1*p2, q1*q2, t1*q2 + p1*t2
+
+def _cf_atan_sum(p, q, bits, hyperbolic=0):
+    """Return (a, b, c, d), such that a/b <= atan(p/q) <= c/d, or
+    atanh(p/q) if hyperbolic is true, for integers 0 <= p <= q/2, with
+    c/d - a/b about 2**-bits, by the bit-burst algorithm: atan(p/q) is
+    the sum of atan(s/2**chunk) for the leading chunk bits of p/q, and
+    of atan of the remainder, (p/q - s/2**chunk)/(1 + p/q*s/2**chunk),
+    which is below 2**-chunk; likewise for atanh, with a minus in the
+    denominator of the remainder. The chunk doubles each time, so that
+    the numerators of the terms grow about as fast as the series
+    converges."""
+
+    a, b, c, d = 0, 1, 0, 1
+    chunk = 16
+    while p:
+        if chunk >= bits:
+            # atan(x) lies between x/(1 + x*x) and x, and atanh(x)
+            # between x and x/(1 - x*x), which differ by less than
+            # 2*x**3 < 2**(1 - 3*chunk/2) <= 2**(1 - bits) here.
+            if hyperbolic:
+                e, f, g, h = p, q, p*q, q*q - p*p
+            else:
+                e, f, g, h = p*q, p*p + q*q, p, q
+        else:
+            s = (p << chunk)//q
+            if not s:
+                chunk *= 2
+                continue
+            # atan(x) == x/(1 + x*x)*sum(prod(2*j*x*x/((2*j + 1)*
+            # (1 + x*x)), j=1..k), k=0..inf), where x*x/(1 + x*x)
+            # is u/v <= 1/5, and atanh(x) == x*sum(prod((2*j - 1)*
+            # x*x/(2*j + 1), j=1..k), k=0..inf), where x*x is u/v
+            # <= 1/4, so that every term brings at least
+            # v.bit_length() - u.bit_length() - 1 bits, and the
+            # tail after the term n-1 is below the term n-1.
+            u = s*s
+            if hyperbolic:
+                v = 1 << 2*chunk
+            else:
+                v = u + (1 << 2*chunk)
+            n = bits//(v.bit_length() - u.bit_length() - 1) + 2
+            pp, qq, t = _cf_atan_series(0, n, u, v, hyperbolic)
+            if hyperbolic:
+                x = s
+                qq <<= chunk
+                p, q = (p << chunk) - s*q, (q << chunk) - p*s
+            else:
+                x = s << chunk
+                qq *= v
+                p, q = (p << chunk) - s*q, (q << chunk) + p*s
+            e, f, g, h = x*t, qq, x*(t + pp), qq
+        a, b, c, d = _cf_round_outwards(
+            (a*f + b*e, b*f, c*h + d*g, d*h), bits)
+        if chunk >= bits:
+            break
+        chunk *= 2
+    return a, b, c, d
+
+def _cf_atan_enclosure(p, q, bits, quarters=0):
+    """Return (a, b, c, d), such that a/b <= quarters*pi/4 + atan(p/q)
+    <= c/d, with c/d - a/b about 2**-bits, for integers p and q > 0.
+    Reduces p/q to the range [0, 1/2] by atan(-x) == -atan(x),
+    atan(x) == pi/2 - atan(1/x) and atan(x) == pi/4 -
+    atan((1 - x)/(1 + x))."""
+
+    sign = 1
+    if p < 0:
+        sign, p = -1, -p
+    if p > q:
+        quarters += 2*sign
+        sign, p, q = -sign, q, p
+    if 2*p > q:
+        quarters += sign
+        sign, p, q = -sign, q - p, q + p
+    a, b, c, d = _cf_atan_sum(p, q, bits)
+    if sign < 0:
+        a, b, c, d = -c, d, -a, b
+    if quarters:
+        e, f, g, h = _cf_pi_enclosure(bits)
+        if quarters < 0:
+            e, f, g, h = g, h, e, f
+        e, f, g, h = quarters*e, 4*f, quarters*g, 4*h
+        a, b, c, d = _cf_round_outwards(
+            (a*f + b*e, b*f, c*h + d*g, d*h), bits)
+    return a, b, c, d
+
+class _cf_atan_ratio(_cf_enclosure):
+    """Regular continued fraction for quarters*pi/4 + atan(t), where
+    t is p/q, p/sqrt(q*q - p*p) or sqrt(q*q - p*p)/p for function ==
+    'atan', 'asin' or 'acos', respectively, and p is nonzero; see
+    atan(), asin(), acos() and atan2()."""
+
+    __slots__ = ('p', 'q', 'function', 'quarters')
+
+    def __new__(cls, p, q, function='atan', quarters=0):
+        self = _cf_enclosure.__new__(cls)
+        self.p, self.q = p, q
+        self.function, self.quarters = function, quarters
+        return self
+
+    def _enclose(self, bits):
+        """Return (a, b, c, d), such that a/b <= self <= c/d."""
+
+        p, q, function, quarters = self.p, self.q, self.function, self.quarters
+        # Add bits for small values, and some more against the
+        # rounding errors.
+        if function == 'acos':
+            d = q*q - p*p
+            bits += max(q.bit_length() - d.bit_length()//2, 0)
+        else:
+            bits += max(q.bit_length() - abs(p).bit_length(), 0)
+        bits += 32
+        if function == 'atan':
+            return _cf_atan_enclosure(p, q, bits, quarters)
+        # t lies between t0/2**bits and (t0 + 1)/2**bits in
+        # absolute value, and atan(t) changes less than t does.
+        if function == 'asin':
+            t0 = _cf_isqrt((p*p << 2*bits)//(q*q - p*p))
+        else:
+            t0 = _cf_isqrt((d << 2*bits)//(p*p))
+        if p < 0:
+            t0 = -t0
+        a, b, c, d = _cf_atan_enclosure(t0, 1 << bits, bits, quarters)
+        return (a << bits) - b, b << bits, (c << bits) + d, d << bits
+
 def atan(x):
     """Return the arc tangent of x."""
     if isinstance(x, float) and str(x)=='inf':
@@ -2035,19 +4947,26 @@ def atan(x):
         return -half_pi
     if isinstance(x, float) and str(x)=='nan':
         return float('nan')
+    ratio = _cf_rational(x)
+    if ratio is not None:
+        # Sum Euler's series for an exact rational argument.
+        if not ratio[0]:
+            return zero
+        return _cf_remember(_cf_atan_ratio(*ratio), 'atan', cf(*ratio))
     x = cf(x)
     if x.pq(0) is None:
         return NaN
     elif x.pq(0) < 0:
         if x.pq(0) == -1:
-            return -_cf_atan(-x)
+            y = -_cf_atan(-x)
         else:
-            return _cf_atan(-1/x) - half_pi
+            y = _cf_atan(-1/x) - half_pi
     else:
         if x.pq(0) == 0:
-            return _cf_atan(x)
+            y = _cf_atan(x)
         else:
-            return half_pi - _cf_atan(1/x)
+            y = half_pi - _cf_atan(1/x)
+    return _cf_remember(y, 'atan', x)
 
 def asin(x):
     """Return the arc sine of x."""
@@ -2058,6 +4977,18 @@ def asin(x):
          raise ValueError,"math domain error"
     if isinstance(x, float) and str(x)=='nan':
         return float('nan')
+    ratio = _cf_rational(x)
+    if ratio is not None:
+        p, q = ratio
+        if abs(p) > q:
+            raise ValueError, 'the argument must lie in the range [-1,+1]'
+        elif p == q:
+            return half_pi
+        elif p == -q:
+            return -half_pi
+        elif not p:
+            return zero
+        return _cf_atan_ratio(p, q, 'asin')
     x1 = cf(x)
     if x1.pq(0) is None:
         return NaN
@@ -2081,6 +5012,20 @@ def acos(x):
          raise ValueError,"math domain error"
     if isinstance(x, float) and str(x)=='nan':
         return float('nan')
+    ratio = _cf_rational(x)
+    if ratio is not None:
+        p, q = ratio
+        if abs(p) > q:
+            raise ValueError, 'the argument must lie in the range [-1,+1]'
+        elif p == q:
+            return zero
+        elif p == -q:
+            return pi
+        elif not p:
+            return half_pi
+        elif p > 0:
+            return _cf_atan_ratio(p, q, 'acos')
+        return _cf_atan_ratio(p, q, 'acos', 4)
     return half_pi - asin(x)
 
 def atan2(y, x):
@@ -2111,6 +5056,27 @@ def atan2(y, x):
         
     s=copysign(1,y)
     sx=copysign(1,x)
+    ratio = _cf_rational(y), _cf_rational(x)
+    if None not in ratio and ratio[1][0]:
+        # Both are exact rationals and x is nonzero;
+        # the quadrants are those of the code below.
+        (p, q), (r, t) = ratio
+        p, q = p*t, q*r
+        if q < 0:
+            p, q = -p, -q
+        if r > 0:
+            quarters = 0
+        elif y >= 0:
+            quarters = 4*int(s)
+        else:
+            quarters = -4
+        if p:
+            return _cf_atan_ratio(p, q, 'atan', quarters)
+        elif quarters > 0:
+            return pi
+        elif quarters < 0:
+            return -pi
+        return zero
     y = cf(y)
     if x > 0:
         if isinstance(x, float) and str(x)=='inf':
@@ -2143,60 +5109,229 @@ def atan2(y, x):
                 return -pi
             return pi
 
-class _cf_pi(cf_base):
+def _cf_chudnovsky(a, b):
+    """Return (P, Q, T) for the terms a..b-1 of the Chudnovsky series,
+    so that the sum of the terms 0..b-1 is T/Q for a == 0; see
+    _cf_pi._enclose()."""
+
+    if b - a == 1:
+        if a:
+            p = (6*a - 5)*(2*a - 1)*(6*a - 1)
+            q = 10939058860032000*a**3
+        else:
+            p = q = 1
+        t = p*(13591409 + 545140134*a)
+        if a & 1:
+            t = -t
+        return p, q, t
+    middle = (a + b)//2
+    p1, q1, t1 = _cf_chudnovsky(a, middle)
+    p2, q2, t2 = _cf_chudnovsky(middle, b)
+    return p1*p2, q1*q2, t1*q2 + p1*t2
+
+def _cf_pi_enclosure(bits):
+    """Return (a, b, c, d), such that a/b <= pi <= c/d, with
+    c/d - a/b about 2**-bits times pi, using the Chudnovsky series
+    426880*sqrt(10005)/pi == sum((-1)**k*(6*k)!*(13591409 +
+        545140134*k)/((3*k)!*k!**3*640320**(3*k)), k=0..inf),
+    summed by binary splitting."""
+
+    # Each term adds about 47.11 bits.
+    n = bits//47 + 2
+    p, q, t = _cf_chudnovsky(0, n)
+    p1, q1, t1 = _cf_chudnovsky(n, n + 1)
+    # The terms alternate and decrease, so the sum lies between
+    # any two consecutive partial sums.
+    sums = [(t, q), (t*q1 + p*t1, q*q1)]
+    if sums[0][0]*sums[1][1] > sums[1][0]*sums[0][1]:
+        sums.reverse()
+    (t_lower, q_lower), (t_upper, q_upper) = sums
+    root = _cf_isqrt(10005 << 2*bits)
+    # root/2**bits <= sqrt(10005) < (root + 1)/2**bits.
+    return (426880*root*q_upper, t_upper << bits,
+        426880*(root + 1)*q_lower, t_lower << bits)
+
+class _cf_pi(_cf_enclosure):
     """Regular continued fraction for pi."""
 
-    def _cf_pi_generator(self):
-        """Return subsequent partial quotients of pi, using
-        a generalized continued fraction for 4/pi."""
-    
-        def gcd(x, y):
-            """Return the gcd of x and y."""
-            while y:
-                x, y = y, x%y
-            return x
-    
-        # c and d would equal zero at the very beginning of
-        # the iteration if we had started it from scratch with
-        # a,b,c,d,p,q = 4,0,1,1,1,3. By emitting the first
-        # partial quotient verbatim and initializing the
-        # parameters with later values, we dispose of the
-        # cases c == 0 and d == 0 inside the loop.
-        yield 3
-        a, b, c, d, p, q = 51, 6, 7, 1, 16, 9
-        while 1:
-            ac, a_mod_c = divmod(a, c)
-            bd, b_mod_d = divmod(b, d)
-            if ac == bd:
-                yield ac
-                a, b, c, d = c, d, a_mod_c, b_mod_d
-            else:
-                a, b, c, d = p*b + q*a, a, p*d + q*c, c
-                # The p's are consecutive squares;
-                # the q's are consecutive odd integers.
-                p += q
-                q += 2
-                if q&2047 == 1:
-                    # Once in a while reduce a, b, c, d.
-                    gcd_abcd = gcd(a, gcd(c, gcd(b, d)))
-                    a //= gcd_abcd
-                    b //= gcd_abcd
-                    c //= gcd_abcd
-                    d //= gcd_abcd
-
-    def __new__(cls):
-        """Memoize the results of _cf_pi_generator()
-        via self.pq() inherited from cf_base."""
+    __slots__ = ()
 
-        self = object.__new__(cls)
-        self.cache = []
-        self.next_pq = self._cf_pi_generator().next
-        return self
+    def _enclose(self, bits):
+        """Return (a, b, c, d), such that a/b <= pi <= c/d;
+        see _cf_pi_enclosure()."""
+
+        return _cf_pi_enclosure(bits)
 
 # Singletons for pi, pi/2 and pi/4.
-pi = _cf_pi()
-half_pi = pi/2
-quarter_pi = pi/4
+pi = _cf_constant('pi', _cf_pi())
+half_pi = _cf_constant('half_pi', pi/2)
+quarter_pi = _cf_constant('quarter_pi', pi/4)
+
+# The names that string expressions of evaluate_many() may use;
+# see _cf_expression_namespace().
+_cf_namespace = {}
+
+def _cf_expression_namespace():
+    """Return the namespace of the string expressions of
+    evaluate_many(): the constants, classes and functions of this
+    module, except those that change its state, and no builtins."""
+
+    if not _cf_namespace:
+        for name, value in globals().items():
+            if name.startswith('_') or name in (
+                    'set_cf_parameter', 'save_constants', 'evaluate_many'):
+                continue
+            if (isinstance(value, cf_base) or
+                getattr(value, '__module__', None) == __name__):
+                _cf_namespace[name] = value
+        _cf_namespace['__builtins__'] = {}
+    return _cf_namespace
+
+def _cf_evaluate_task(task):
+    """Evaluate a single task of evaluate_many()."""
+
+    expression, n, significant = task
+    if isinstance(expression, basestring):
+        x = eval(expression, _cf_expression_namespace())
+    elif isinstance(expression, tuple):
+        x = expression[0](*expression[1:])
+    else:
+        x = expression
+    return to_decimal(x, n, significant)
+
+def _cf_evaluate_chunk(chunk):
+    """Return (True, results) for a chunk of the tasks of
+    evaluate_many(), or (False, exception)."""
+
+    try:
+        return True, map(_cf_evaluate_task, chunk)
+    except Exception, exception:
+        return False, exception
+
+def _cf_evaluate_timed(tasks, processes, chunksize, timeout):
+    """Evaluate the tasks of evaluate_many() on a pool of processes
+    workers, chunksize at a time. A chunk that doesn't finish within
+    timeout seconds per task gets None for all its results, and the
+    pool is replaced by a new one, which kills the worker stuck in it;
+    the other unfinished chunks start over on the new pool."""
+
+    from multiprocessing import Pool
+    from Queue import Queue, Empty
+    from time import time
+
+    chunks = [tasks[i:i + chunksize]
+        for i in xrange(0, len(tasks), chunksize)]
+    results = [[None]*len(chunk) for chunk in chunks]
+    pending = range(len(chunks))
+    pending.reverse()
+    # The pool runs the callbacks, which report the finished chunks,
+    # in a thread of its own. Chunks at most as many as the workers
+    # run at a time, so that their deadlines count from their start.
+    finished = Queue()
+    running = {}
+    pool = None
+    generation = 0
+    try:
+        while pending or running:
+            if pool is None:
+                pool = Pool(processes)
+                generation += 1
+            while pending and len(running) < processes:
+                index = pending.pop()
+                result = pool.apply_async(_cf_evaluate_chunk,
+                    (chunks[index],), callback=lambda value,
+                    key=(generation, index): finished.put(key))
+                running[index] = result, (
+                    time() + timeout*len(chunks[index]))
+            wait = min([deadline for _, deadline in running.itervalues()])
+            try:
+                key = finished.get(True, max(wait - time(), 0))
+            except Empty:
+                now = time()
+                for index, (result, deadline) in running.items():
+                    if result.ready():
+                        continue
+                    del running[index]
+                    if deadline > now:
+                        pending.append(index)
+                pool.terminate()
+                pool.join()
+                pool = None
+                # Collect the chunks that made it before the pool went.
+                for index, (result, deadline) in running.items():
+                    success, value = result.get(0)
+                    if not success:
+                        raise value
+                    results[index] = value
+                running.clear()
+                continue
+            if key[0] != generation or key[1] not in running:
+                continue
+            success, value = running.pop(key[1])[0].get(0)
+            if not success:
+                raise value
+            results[key[1]] = value
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return [value for chunk in results for value in chunk]
+
+def evaluate_many(expressions, n, significant=0, processes=None,
+                  chunksize=None, timeout=None, stats=None):
+    """Evaluate many independent expressions on a pool of processes
+    and return the list of the results of to_decimal(x, n, significant)
+    in the order of the expressions. An expression is either a string,
+    evaluated in the namespace of this module, e.g. 'exp(1)/3', or
+    a tuple of a function and its arguments, e.g. (atan2, 1, 2), or
+    a number, including a cf object, which goes to the workers with
+    its cached partial quotients. A string may only use the constants,
+    functions and classes of this module, e.g. not set_cf_parameter(),
+    and no builtins; this keeps stray names out, but is no sandbox, so
+    untrusted input should come as functions and arguments. The pool
+    has processes workers, by default one per CPU; with processes=1
+    and no timeout the expressions are evaluated in this process.
+    The workers get the tasks chunksize at a time. A chunk that takes
+    longer than timeout seconds per task is abandoned and the results
+    of its tasks are None. With a timeout, the tasks always run in the
+    pool, by default one per chunk, and the pool is replaced when a
+    chunk runs out of time, which kills its worker, so that it can't
+    leave the shared constants, e.g. pi, in the middle of computing
+    their partial quotients.
+    If stats is a dictionary, then it is filled with the number of
+    processes, tasks, timeouts, the elapsed seconds and the tasks
+    per second. The workers are forked, so they see the parameters
+    set by set_cf_parameter()."""
+
+    from time import time
+
+    tasks = [(expression, n, significant) for expression in expressions]
+    start_time = time()
+    if processes is None:
+        from multiprocessing import cpu_count
+        processes = cpu_count()
+    if timeout:
+        results = _cf_evaluate_timed(tasks, processes, chunksize or 1,
+                                     timeout)
+    elif processes == 1:
+        results = map(_cf_evaluate_task, tasks)
+    else:
+        from multiprocessing import Pool
+        pool = Pool(processes)
+        try:
+            results = pool.map(_cf_evaluate_task, tasks, chunksize)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    if stats is not None:
+        elapsed = time() - start_time
+        stats['processes'] = processes
+        stats['tasks'] = len(tasks)
+        stats['timeouts'] = results.count(None)
+        stats['seconds'] = elapsed
+        stats['tasks_per_second'] = len(tasks) / max(elapsed, 1e-9)
+    return results
 
 if __name__ == '__main__':
     import math
@@ -2209,9 +5344,9 @@ if __name__ == '__main__':
     y = cf(3*random())
 
     def digit_by_digit(x, precision):
-        get_digit = digits(x).next
+        get_digits = _cf_digit_strings(x).next
         try:
-            integer_part = get_digit()
+            integer_part = get_digits()
             if integer_part < 0:
                 sys.stdout.write('-')
                 digit_by_digit(-x, precision)
@@ -2221,9 +5356,11 @@ if __name__ == '__main__':
             sys.stdout.write('NaN')
             return
         try:
-            for i in xrange(precision):
-                sys.stdout.write(str(get_digit()))
+            while precision > 0:
+                digit_string = get_digits()[:precision]
+                sys.stdout.write(digit_string)
                 sys.stdout.flush()
+                precision -= len(digit_string)
         except StopIteration:
             pass
 
@@ -83,6 +83,17 @@ def acc_check(expected, got, rel_err=2e-15, abs_err = 5e-323):
     return "error = {}; permitted error = {}".format(error,
                                                      permitted_error)
 
+def pqs(x, n):
+    """Return the first n partial quotients of the continued fraction
+    x, or all of them up to the None that ends it, if there are fewer."""
+
+    result = []
+    for i in xrange(n):
+        result.append(x.pq(i))
+        if result[-1] is None:
+            break
+    return result
+
 def parse_mtestfile(fname):
     """Parse a file with test values
 
@@ -900,6 +911,590 @@ class MathTests(unittest.TestCase):
         self.assertFalse(math.isinf(0.))
         self.assertFalse(math.isinf(1.))
 
+    def testSpilledQuotients(self):
+        # Partial quotients that don't fit in a machine word, including
+        # the one that marks them in the cache, come back unchanged.
+        for t in (-sys.maxint - 1, sys.maxint + 1, 2**100, -2**100):
+            x = math.cf(t)
+            self.assertEqual([x.pq(0), x.pq(1)], [t, None])
+            self.assertEqual([x.pq(0), x.pq(1)], [t, None])
+            y = math.pi + (t - 3)
+            expected = [y.pq(i) for i in xrange(5)]
+            self.assertEqual(expected[0], t)
+            self.assertEqual([y.pq(i) for i in xrange(5)], expected)
+
+    def testInternNodes(self):
+        # Not a rational, whose products would be folded.
+        x = math.e/7
+        self.assertFalse((x*x) is (x*x))
+        math.set_cf_parameter('intern_nodes', 1)
+        try:
+            hits, misses = math.intern_stats()
+            self.assertTrue((x*x) is (x*x))
+            self.assertTrue((x+1) is (x+1))
+            self.assertEqual(math.intern_stats(), (hits + 2, misses + 2))
+            self.ftest('sin(x)**2+cos(x)**2',
+                       math.sin(x)**2 + math.cos(x)**2, 1)
+            # Rational operands are keyed by value, not by identity.
+            self.assertTrue(math.exp(0.5) is math.exp(math.cf(1, 2)))
+            self.assertTrue(math.exp(-x) is math.exp(-x))
+            self.assertFalse(math.exp(math.cf(1, 3)) is
+                             math.exp(math.cf(1, 4)))
+            self.assertTrue(math.tan(math.cf(1, 3)) is
+                            math.tan(math.cf(1, 3)))
+        finally:
+            math.set_cf_parameter('intern_nodes', 0)
+
+    def testFuseNodes(self):
+        x = math.pi
+        y = (2*x + 3)/5 - 1
+        self.assertTrue(type(y) is math.unop and y.x is x)
+        self.ftest('(2*pi+3)/5-1', y, (2*3.141592653589793 + 3)/5 - 1)
+        self.assertTrue((x + 1) - 1 is x)
+        self.ftest('cos(0)', math.cos(0), 1)
+
+    def testIngestBlock(self):
+        x = math.e/math.pi + math.sqrt(2)
+        try:
+            math.set_cf_parameter('ingest_block', 1)
+            expected = [(x + 1).pq(i) for i in xrange(200)]
+            math.set_cf_parameter('ingest_block', 32)
+            self.assertEqual([(x + 1).pq(i) for i in xrange(200)], expected)
+        finally:
+            math.set_cf_parameter('ingest_block', 1)
+
+    def testMaxIters(self):
+        # A result that is probably rational ends after max_iters
+        # undecided partial quotients of the operands, as it did
+        # before ingest_block.
+        try:
+            for iters in 50, 100, 200:
+                math.set_cf_parameter('max_iters', iters)
+                x, y = math.pi*math.e, math.e*math.pi
+                z = x - y
+                self.assertEqual(pqs(z, 3), [0, None])
+                self.assertEqual(len(x.cache) + len(y.cache), iters + 1)
+            math.set_cf_parameter('ingest_block', 8)
+            x, y = math.pi*math.e, math.e*math.pi
+            self.assertEqual(pqs(x - y, 3), [0, None])
+            self.assertTrue(len(x.cache) + len(y.cache) < iters + 8)
+        finally:
+            math.set_cf_parameter('max_iters', 100)
+            math.set_cf_parameter('ingest_block', 1)
+
+    def testCoefficientBits(self):
+        self.assertEqual(math.coefficient_bits(math.e), None)
+        math.set_cf_parameter('track_coefficient_bits', 1)
+        try:
+            x = math.e*math.pi
+            y = math.binop(math.e, math.pi, 3**200, 0, 0, 0, 0, 0, 0, 3**200)
+        finally:
+            math.set_cf_parameter('track_coefficient_bits', 0)
+        self.assertEqual([x.pq(i) for i in xrange(100)],
+                         [y.pq(i) for i in xrange(100)])
+        self.assertTrue(0 < math.coefficient_bits(x) < 1000)
+        self.assertTrue(math.coefficient_bits(y) < 1000)
+
+    def testToDecimal(self):
+        from decimal import Decimal
+        self.assertEqual(math.to_decimal(math.pi, 20),
+                         Decimal('3.14159265358979323846'))
+        self.assertEqual(str(math.to_decimal(-math.e, 3)), '-2.718')
+        self.assertEqual(str(math.to_decimal(math.cf(1, 8), 2)), '0.12')
+        self.assertEqual(str(math.to_decimal(math.cf(3, 8), 2)), '0.38')
+        self.assertEqual(str(math.to_decimal(math.exp(-50), 5, 1)),
+                         '1.9287E-22')
+        self.assertEqual(str(math.to_decimal(math.cf(99999, 1000), 2, 1)),
+                         '1.0E+2')
+        self.assertRaises(ValueError, math.to_decimal, math.NaN, 3)
+
+    def testToFraction(self):
+        from fractions import Fraction
+        self.assertEqual(math.to_fraction(math.pi, Fraction(1, 100)),
+                         Fraction(22, 7))
+        self.assertEqual(math.to_fraction(math.pi, 1e-6), Fraction(355, 113))
+        self.assertEqual(math.to_fraction(math.cf(3, 7), 1e-9),
+                         Fraction(3, 7))
+        self.assertRaises(ValueError, math.to_fraction, math.pi, 0)
+
+    def testDigitChunks(self):
+        get_digit = math.digits(math.pi).next
+        get_chunk = math.digits(math.pi, 10, 18).next
+        self.assertEqual(get_digit(), get_chunk())
+        self.assertEqual(''.join([str(get_digit()) for i in xrange(90)]),
+                         ''.join(['%018d' % get_chunk() for i in xrange(5)]))
+        self.assertEqual(str(math.cf(3, 8)), '0.375')
+        self.assertEqual(str(math.cf(1, 10**20)), '1.e-20')
+
+    def testFloat(self):
+        self.assertEqual(float(math.cf(1, 3)), 1.0/3)
+        self.assertEqual(float(math.pi), 3.141592653589793)
+        self.assertEqual(float(-math.e), -2.718281828459045)
+        # The convergents exceed the range of floats.
+        self.assertEqual(float(math.cf((1, 10**200, 10**200, 7))), 1.0)
+        self.assertTrue(float(math.NaN) != float(math.NaN))
+
+    def testExactConstruction(self):
+        from decimal import Decimal
+        from fractions import Fraction
+        self.assertEqual(pqs(math.cf(Fraction(1, 3)), 3), [0, 3, None])
+        self.assertEqual(pqs(math.cf(Decimal('0.1')), 3), [0, 10, None])
+        self.assertEqual(math.cf(Decimal('-1.5E3')).pq(0), -1500)
+        self.assertEqual(math.cf(10**30 + 1).pq(0), 10**30 + 1)
+        self.assertEqual(pqs(math.cf(1, Decimal(3)), 3), [0, 3, None])
+        x = math.cf(0.1)
+        self.assertEqual([x.pq(i) for i in xrange(4)],
+                         [0, 9, 1, 1801439850948197])
+        self.assertEqual(math.cf(float('inf')).pq(0), None)
+
+    def testHalfGcd(self):
+        p, q = 7**12345 + 2**30001, 3**19000 + 12345
+        cases = [(p*11**777, q*11**777), (p, q), (-p, q), (q, p), (-q, p),
+                 (-(3**1256), 2**1074)]
+        for p, q in cases:
+            x = math.cf(p, q)
+            n = 0
+            while q:
+                t, r = divmod(p, q)
+                self.assertEqual(x.pq(n), t)
+                p, q = q, r
+                n += 1
+            self.assertEqual(x.pq(n), None)
+
+    def testEvaluateMany(self):
+        expressions = ['exp(1)/3', (math.atan2, 1, 2), (math.sqrt, 2), 7]
+        expected = [math.to_decimal(math.exp(1)/3, 30),
+                    math.to_decimal(math.atan2(1, 2), 30),
+                    math.to_decimal(math.sqrt(2), 30),
+                    math.to_decimal(7, 30)]
+        stats = {}
+        self.assertEqual(math.evaluate_many(expressions, 30, processes=2,
+                                            chunksize=1, stats=stats),
+                         expected)
+        self.assertEqual(stats['tasks'], 4)
+        self.assertEqual(stats['timeouts'], 0)
+        self.assertEqual(math.evaluate_many(['exp(10**9)', 'log(10)'], 10,
+                                            processes=1, timeout=0.2),
+                         [None, math.to_decimal(math.log(10), 10)])
+        # A timed out task must leave the generators of the shared
+        # constants working, in this process and in later tasks.
+        self.assertEqual(math.evaluate_many(['to_decimal(pi, 200000)'], 10,
+                                            processes=1, timeout=0.5),
+                         [None])
+        pi = math.to_decimal(math.pi, 2000)
+        self.assertEqual(str(pi)[:22], '3.14159265358979323846')
+        self.assertEqual(
+            math.evaluate_many(['pi**0 + 0*to_decimal(pi, 200000)', 'pi'],
+                               2000, processes=2, timeout=0.5),
+            [None, pi])
+        # A chunk that runs out of time takes all its tasks with it.
+        self.assertEqual(math.evaluate_many(['exp(10**9)', '1', '2'], 5,
+                                            processes=1, chunksize=2,
+                                            timeout=0.2),
+                         [None, None, math.to_decimal(2, 5)])
+        # String expressions see only the mathematics of the module.
+        for expression in ('__import__("os")', 'open("x")',
+                           'set_cf_parameter("max_iters", 1)'):
+            self.assertRaises(NameError, math.evaluate_many,
+                              [expression], 5, processes=1)
+
+    def testPickle(self):
+        import pickle
+        expressions = [lambda: math.cf(10**40 + 7, 3**80),
+                       lambda: math.pi*math.e - math.log(3),
+                       lambda: math.sqrt(math.cf(7, 3))/(math.pi - 3),
+                       lambda: math.tan(math.cf(2, 7)) + math.cf([1, 2], [3])]
+        for expression in expressions:
+            expected = pqs(expression(), 40)
+            for n in (0, 1, 7, 20):
+                for protocol in (0, 2):
+                    x = expression()
+                    pqs(x, n)
+                    x = pickle.loads(pickle.dumps(x, protocol))
+                    self.assertEqual(pqs(x, 40), expected)
+        # The max_iters heuristics have found a rational number.
+        x = math.sqrt(2)*math.sqrt(2)
+        self.assertEqual(x.pq(0), 2)
+        x = pickle.loads(pickle.dumps(x))
+        self.assertEqual(x.pq(1), None)
+        for x in math.NaN, math.zero, math.one, math.e:
+            self.assertTrue(pickle.loads(pickle.dumps(x)) is x)
+
+    def testConstantStore(self):
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        store = math.constant_store
+        constants = len(math._cf_stored_constants)
+        math.set_cf_parameter('constant_store', directory)
+        try:
+            expected = [math.pi.pq(i) for i in xrange(400)]
+            x = math._cf_constant('pi', math._cf_pi())
+            self.assertEqual([x.pq(i) for i in xrange(300)], expected[:300])
+            x = math._cf_constant('big', math.cf(2**100, 3))
+            self.assertEqual([x.pq(i) for i in xrange(3)],
+                             [2**100//3, 3, None])
+            math.save_constants()
+            # The store is read at the first use and the node resumes
+            # after the stored partial quotients.
+            x = math._cf_constant('pi', math._cf_pi())
+            self.assertEqual(x.depth, None)
+            x_pq = x.pq
+            self.assertEqual(x_pq(0), 3)
+            self.assertEqual(len(x.node.cache), 300)
+            self.assertEqual(x_pq(1), 7)
+            self.assertEqual(x.depth, 300)
+            self.assertEqual([x.pq(i) for i in xrange(400)], expected)
+            math.save_constants()
+            x = math._cf_constant('pi', math.pi)
+            x.pq(0)
+            self.assertEqual(x.depth, 400)
+            x = math._cf_constant('big', math.cf(2**100, 3))
+            self.assertEqual(x.pq(0), 2**100//3)
+            self.assertEqual(len(x.node.cache), 3)
+            self.assertFalse(hasattr(x.node, 'next_pq'))
+            # A shallower constant doesn't replace a deeper one.
+            x = math._cf_constant('pi', math._cf_pi())
+            y = math._cf_constant('pi', math._cf_pi())
+            pqs(x, 501)
+            pqs(y, 451)
+            math.save_constants()
+            self.assertEqual(x.depth, 501)
+            self.assertEqual(y.depth, 501)
+            self.assertEqual(math._cf_read_constant(directory, 'pi')[0],
+                             x.node.cache)
+            # Files of another format or version are ignored.
+            path = os.path.join(directory, 'pi.pqs')
+            data = open(path, 'rb').read()
+            open(path, 'wb').write('cfpq\0' + data[5:])
+            x = math._cf_constant('pi', math._cf_pi())
+            self.assertEqual(x.pq(10), expected[10])
+            self.assertEqual(x.depth, 0)
+            open(os.path.join(directory, 'big.big'), 'wb').write(
+                'cfbig 1\n0 zz\n')
+            self.assertEqual(math._cf_read_constant(directory, 'big'),
+                             (math.array('l'), None))
+        finally:
+            math.set_cf_parameter('constant_store', store)
+            del math._cf_stored_constants[constants:]
+            shutil.rmtree(directory)
+        # The module constants are stored by a process that imports
+        # the module with CF_CACHE_DIR set and uses them.
+        import subprocess
+        directory = tempfile.mkdtemp()
+        try:
+            subprocess.check_call([sys.executable, '-c',
+                'import cf; cf.to_decimal(cf.atan(5*cf.pi), 50); '
+                'cf.to_decimal(cf.log10(cf.e), 50); '
+                'cf.to_decimal(cf.exp(cf.cf(5)), 50)'],
+                env=dict(os.environ, CF_CACHE_DIR=directory))
+            names = os.listdir(directory)
+            for name in ('pi', 'half_pi', 'log_of_10', 'exp_2_to_1'):
+                self.assertTrue(name + '.pqs' in names)
+                self.assertTrue(name + '.big' in names)
+        finally:
+            shutil.rmtree(directory)
+
+    def testEnclosureRational(self):
+        # Enclosures of an exactly rational value never shrink to it;
+        # max_iters ends the continued fraction all the same.
+        class third(math._cf_enclosure):
+            __slots__ = ()
+            def _enclose(self, bits):
+                return 2**bits - 1, 3 << bits, 2**bits + 1, 3 << bits
+        self.assertEqual(pqs(third(), 5), [0, 3, None])
+        class seven(math._cf_enclosure):
+            __slots__ = ()
+            def _enclose(self, bits):
+                return 7 << bits, 2**bits + 1, 7 << bits, 2**bits - 1
+        self.assertEqual(pqs(seven(), 5), [7, None])
+
+    def testPi(self):
+        x = math._cf_pi()
+        self.assertEqual([x.pq(i) for i in xrange(20)],
+                         [3, 7, 15, 1, 292, 1, 1, 1, 2, 1,
+                          3, 1, 14, 2, 1, 1, 2, 2, 2, 2])
+        self.assertEqual(str(math.to_decimal(x, 100)),
+            '3.1415926535897932384626433832795028841971693993751058209'
+            '749445923078164062862089986280348253421170680')
+        self.assertEqual([x.pq(i) for i in xrange(20001)][-3:], [24, 2, 2])
+        for n in range(1000) + [10**100, 10**100 - 1, 2**4001 + 12345]:
+            root = math._cf_isqrt(n)
+            self.assertTrue(root*root <= n < (root + 1)**2)
+
+    def testExpRational(self):
+        from fractions import Fraction
+        x = math.tanh(Fraction(1, 2))
+        self.assertTrue(isinstance(x, math._cf_exp_ratio))
+        self.assertEqual(pqs(x, 100), [0] + range(2, 398, 4))
+        self.assertEqual(pqs(math.exp(0.5), 8), [1, 1, 1, 1, 5, 1, 1, 9])
+        self.assertEqual(pqs(math.exp(0.0), 3), [1, None])
+        self.assertEqual(pqs(math.sinh(math.cf(0)), 3), [0, None])
+        self.assertEqual(pqs(math.cosh(0), 3), [1, None])
+        # The general algorithms see a sequence, not a rational.
+        for x in [2, -3, 0.25, Fraction(-22, 7), math.cf(1, 100000)]:
+            sequence = math.cf(tuple(pqs(math.cf(x), 100)))
+            for function in math.exp, math.sinh, math.cosh, math.tanh:
+                self.assertEqual(pqs(function(x), 200),
+                                 pqs(function(sequence), 200))
+
+    def testAtanRational(self):
+        from fractions import Fraction
+        x = math.atan(1)
+        self.assertTrue(isinstance(x, math._cf_atan_ratio))
+        self.assertEqual(pqs(x, 300), pqs(math.quarter_pi, 300))
+        self.assertEqual(pqs(math.asin(0.5), 200), pqs(math.pi/6, 200))
+        self.assertEqual(pqs(math.acos(Fraction(-1, 2)), 200),
+                         pqs(2*math.pi/3, 200))
+        self.assertEqual(pqs(math.atan2(-1, -1), 200),
+                         pqs(-3*math.pi/4, 200))
+        self.assertEqual(pqs(math.atan(Fraction(-7, 3)), 200),
+                         pqs(math.atan(math.cf((-3, 1, 2))), 200))
+        self.assertTrue(math.atan(0) is math.zero)
+        self.assertTrue(math.acos(1) is math.zero)
+        self.ftest('asin(-1.0)', math.asin(-1.0), -1.5707963267948966)
+        self.assertRaises(ValueError, math.asin, Fraction(3, 2))
+        self.assertRaises(ValueError, math.acos, -1.5)
+        for y, x, expected in [(0.5, 2.0, 0.24497866312686414),
+                               (0.5, -2.0, 2.896613990462929),
+                               (-0.5, -2.0, -2.896613990462929),
+                               (-0.5, 2.0, -0.24497866312686414),
+                               (0.0, -1.0, 3.141592653589793),
+                               (-0.0, -1.0, -3.141592653589793),
+                               (1e-300, 1.0, 1e-300)]:
+            self.ftest('atan2(%r, %r)' % (y, x), math.atan2(y, x), expected)
+
+    def testLogRational(self):
+        from fractions import Fraction
+        x = math.log(2)
+        self.assertTrue(isinstance(x, math._cf_log_ratio))
+        self.assertEqual(pqs(x, 20), [0, 1, 2, 3, 1, 6, 3, 1, 1, 2,
+                                      1, 1, 1, 1, 3, 10, 1, 1, 1, 2])
+        # The general algorithm sees a sequence, not a rational.
+        for x in [Fraction(22, 7), Fraction(7, 8), 1e-300,
+                  Fraction(1000001, 1000000)]:
+            sequence = math.cf(tuple(pqs(math.cf(x), 100)[:-1]))
+            self.assertEqual(pqs(math.log(x), 150),
+                             pqs(math.log(sequence), 150))
+        self.assertEqual(pqs(math.log(8, 2), 3), [3, None])
+        self.assertEqual(pqs(math.log(2, 8), 3), [0, 3, None])
+        self.assertEqual(pqs(math.log10(Fraction(1, 1000)), 3), [-3, None])
+        self.assertEqual(pqs(math.log(Fraction(4, 9), Fraction(27, 8)), 4),
+                         [-1, 3, None])
+        self.assertEqual(pqs(math.log(Fraction(8, 27), Fraction(9, 4)), 4),
+                         [-2, 2, None])
+        self.assertEqual(pqs(math.log(Fraction(1, 32), 8), 4),
+                         [-2, 3, None])
+        # Exact powers are recognised however large they are.
+        self.assertEqual(pqs(math.log(2**600000, 8), 2), [200000, None])
+        self.assertEqual(pqs(math.log10(10**200000), 2), [200000, None])
+        self.assertEqual(pqs(math.log(6**3000, 6**1001), 6),
+                         [2, 1, 332, 1, 2, None])
+        for x, base in [(2**1000 + 1, 2), (2**1000, 2**999 + 1),
+                        (12**50, 6), (Fraction(3**40, 2**41), 1.5)]:
+            self.assertTrue(isinstance(math.log(x, base),
+                                       math._cf_log_ratio))
+        self.assertTrue(math.log(1.0) is math.zero)
+        self.ftest('log(3, 0.5)', math.log(3, 0.5), -1.5849625007211563)
+        self.ftest('log1p(1e-20)*1e20', math.log1p(1e-20)*10**20, 1)
+        self.assertRaises(ValueError, math.log, Fraction(-1, 2))
+
+    def testSeries(self):
+        x = math.series(1, (0, 1))
+        self.assertEqual(pqs(x, 1000), pqs(math.e, 1000))
+        x = math.series((0, 1), (1, 2), 2)
+        self.assertEqual(pqs(x, 1000), pqs(math.pi, 1000))
+        x = math.series((-1, -1), (2, 4), 5, (4, 12, 12, 4))
+        self.assertEqual(str(math.to_decimal(x, 40)),
+                         '1.2020569031595942853997381615114499907650')
+        x = math.series(-1, (0, 0, 4))
+        self.assertEqual(str(math.to_decimal(x, 40)),
+                         '0.7651976865579665514497175261026632209093')
+        x = math.series(0, 1, 3, 2)
+        self.assertEqual([x.pq(i) for i in xrange(3)], [1, 2, None])
+        self.assertRaises(ValueError, math.series, 1, 1)
+        self.assertRaises(ValueError, math.series, (0, 2), (1, 1))
+        self.assertRaises(ZeroDivisionError, math.series, 1, 0)
+
+    def testGcf(self):
+        import pickle
+        for block in 1, 8, 100:
+            x = math.gcf(lambda n: n*n, lambda n: 2*n + 1, block)
+            self.assertEqual(pqs(x, 300), pqs(4/math.pi, 300))
+        x = math.gcf(lambda n: n > 1 and -1 or 1,
+                     lambda n: n > 1 and 2*n + 1 or n + 1)
+        self.assertEqual(pqs(x, 100), pqs(math.tan(math.one), 100))
+        x = math.gcf(lambda n: (n//2)**2 or 1, range(2000))
+        self.assertEqual(pqs(x, 500), pqs(math.log_of_2, 500))
+        x = math.gcf((1, 1, 1), (2, 3, 4, 5))
+        self.assertEqual(pqs(x, 5), [2, 3, 4, 5, None])
+        x = math.gcf((1, 2, 1), (2, 3))
+        self.assertEqual(pqs(x, 3), [2, 3, None])
+        x = math.gcf((1, 0, 1), (2, 3, 4, 5))
+        self.assertEqual(pqs(x, 3), [2, 3, None])
+        x = math.gcf((1,), (0, 0))
+        self.assertEqual(pqs(x, 1), [None])
+        x = math.gcf((1,)*50, (1,)*51)
+        pqs(x, 3)
+        y = pickle.loads(pickle.dumps(x))
+        self.assertEqual(pqs(y, 51), [1]*49 + [2, None])
+
+    def testRoot(self):
+        for i in xrange(1000):
+            k = random.randint(3, 9)
+            x = random.getrandbits(random.randint(1, 400))
+            r = math._cf_iroot(x, k)
+            self.assertTrue(r**k <= x < (r + 1)**k)
+        self.assertEqual(pqs(math.root(2, 3), 12),
+                         [1, 3, 1, 5, 1, 1, 4, 1, 1, 8, 1, 14])
+        self.assertEqual(pqs(math.root(math.cf(-27, 8), 3), 3), [-2, 2, None])
+        self.assertEqual(pqs(math.cf(16)**0.25, 2), [2, None])
+        self.assertEqual(pqs(math.cf(4, 9)**-1.5, 5), [3, 2, 1, 2, None])
+        self.assertEqual(pqs(math.cf(2)**math.cf(3, 5), 200),
+                         pqs(math.root(8, 5), 200))
+        x = math.root(math.pi, 3)
+        self.assertEqual(pqs(x, 100), pqs(math.exp(math.log(math.pi)/3), 100))
+        x = math.pi**math.cf(-2, 3)
+        self.assertEqual(pqs(x, 50),
+                         pqs(math.exp(-2*math.log(math.pi)/3), 50))
+        self.assertRaises(ValueError, math.root, -2, 4)
+        self.assertRaises(ValueError, math.root, 2, 0)
+
+    def testSqrtRatio(self):
+        import pickle
+        self.assertEqual(pqs(math.sqrt(7), 9), [2] + [1, 1, 1, 4]*2)
+        self.assertEqual(pqs(math.sqrt(math.cf(9, 4)), 3), [1, 2, None])
+        self.assertEqual(pqs(math.sqrt(0.25), 3), [0, 2, None])
+        for p, q in (2, 1), (22, 7), (1, 1000), (10**20 + 1, 3):
+            x = math.sqrt(math.cf(p, q))
+            y = math._cf_root_ratio(p, q, 2)
+            self.assertEqual(pqs(x, 200), pqs(y, 200))
+        x = math.sqrt(61)
+        pqs(x, 5)
+        y = pickle.loads(pickle.dumps(x))
+        self.assertEqual(pqs(y, 40), pqs(math.sqrt(61), 40))
+        self.assertRaises(ValueError, math.sqrt, -2)
+
+    def testRootStream(self):
+        import pickle
+        x = math.sqrt(math.pi)
+        self.assertEqual(pqs(x, 300), pqs(math.exp(math.log(math.pi)/2), 300))
+        x = math.sqrt(1/math.pi)
+        self.assertEqual(pqs(x, 100), pqs(math.exp(-math.log(math.pi)/2), 100))
+        x = math.root(math.e, 5)
+        self.assertEqual(pqs(x, 300), pqs(math.exp(math.cf(1, 5)), 300))
+        x = math.root(-math.pi, 3)
+        self.assertEqual(pqs(x, 100), pqs(-math.exp(math.log(math.pi)/3), 100))
+        x = math.sqrt(math.e)
+        pqs(x, 50)
+        y = pickle.loads(pickle.dumps(x))
+        self.assertEqual(pqs(y, 200), pqs(math.sqrt(math.e), 200))
+        # The enclosures go on from the partial quotients of x taken for
+        # the previous ones, after a non-canonical stretch deep in x too.
+        x = math.cf((1,)*510 + (3, -1, 2), (1, 2))
+        y = math.root(x, 3)
+        self.assertEqual(pqs(y, 400), pqs(math.exp(math.log(x)/3), 400))
+        self.assertTrue(type(y.x) is math.unop)
+        n = y.depth
+        self.assertEqual(y.convergents, math._cf_product(pqs(y.x, n), 0, n))
+        self.assertRaises(ValueError, math.sqrt, -math.pi)
+        self.assertRaises(ValueError, math.root, -math.pi, 4)
+
+    def testQuadratic(self):
+        import pickle
+        sqrt, cf = math.sqrt, math.cf
+        x = (1 - sqrt(2))*(1 + sqrt(2))
+        self.assertEqual(pqs(x, 2), [-1, None])
+        self.assertEqual(pqs(sqrt(2)**2, 2), [2, None])
+        self.assertEqual(pqs(sqrt(8)/sqrt(2), 2), [2, None])
+        self.assertEqual(pqs(sqrt(2)*sqrt(3) - sqrt(6), 1), [0])
+        g = (1 + sqrt(5))/2
+        self.assertEqual(pqs(g, 10), [1]*10)
+        self.assertEqual(pqs(g**20 - 6765*g, 2), [4181, None])
+        self.assertTrue(type(g*g) is math.quadratic)
+        self.assertTrue(g > cf(1618033, 10**6))
+        self.assertTrue(g < cf(1618034, 10**6))
+        self.assertTrue(g == g*g - 1)
+        self.assertTrue(g != sqrt(5))
+        x = math.quadratic(-7, -3, 11, 5)
+        self.assertEqual(pqs(x, 12), [-4, 1, 1, 1, 1, 3, 2, 1, 1, 3, 2, 1])
+        x = (3 - sqrt(7))/(2 + sqrt(7))
+        self.assertEqual(pqs(x, 8), [0, 13, 8, 1, 2, 1, 8, 13])
+        x = sqrt(5 + 2*sqrt(6))
+        self.assertEqual(pqs(x, 100), pqs(sqrt(2) + sqrt(3), 100))
+        self.assertEqual(pqs(sqrt(2) + math.pi, 20),
+                         pqs(math.binop(sqrt(2), math.pi,
+                                        0, 1, 1, 0, 0, 0, 0, 1), 20))
+        x = sqrt(cf(22, 7))
+        pqs(x, 5)
+        y = pickle.loads(pickle.dumps(x))
+        self.assertEqual(pqs(y, 30), pqs(sqrt(cf(22, 7)), 30))
+        # Square factors of primes from 1000 on stay in d.
+        x, y = sqrt(3), sqrt(3*997**2)/997
+        self.assertEqual((x.d, y.d), (3, 3))
+        self.assertTrue(x == y)
+        y = sqrt(3*1009**2)/1009
+        self.assertEqual(y.d, 3*1009**2)
+        self.assertTrue(type(x - y) is math.binop)
+        self.assertEqual(pqs(x, 100), pqs(y, 100))
+        self.assertRaises(ZeroDivisionError, math.quadratic, 1, 1, 2, 0)
+
+    def testFolding(self):
+        from fractions import Fraction
+        cf = math.cf
+        x = cf(3, 7)**100
+        self.assertTrue(type(x) is cf)
+        self.assertEqual(x.ratio, (3**100, 7**100))
+        x = (cf(1, 3) + 0.25)*7 - 1
+        self.assertEqual(x.ratio, (37, 12))
+        self.assertEqual(pqs(x, 3), [3, 12, None])
+        self.assertEqual((int(x), int(-x), float(x)), (3, -3, 37/12.0))
+        self.assertEqual(str(x), '3.0833333333333333333333333333')
+        self.assertEqual(list(math.digits(cf(1, 8))), [0, 1, 2, 5])
+        self.assertTrue(cf(1, 3) != 1.0/3)
+        self.assertTrue(cf(1, 4) == 0.25 == Fraction(1, 4))
+        self.assertTrue(cf(1, 3) < Fraction(1, 2))
+        self.assertTrue(type(cf(2, 3)*math.pi) is math.unop)
+        self.assertEqual(pqs(cf(2, 3)*math.pi, 50), pqs(2*math.pi/3, 50))
+        # Too long to fold.
+        self.assertFalse(type(cf(2)**10**10) is cf)
+        self.assertFalse(type(cf(3**300000, 2**475000 + 1) +
+                              cf(1, 5**200000 + 7)) is cf)
+        self.assertFalse(type(cf(3, 7)**60000 + cf(1, 3**60000 - 1)) is cf)
+
+    def testSimplify(self):
+        cf = math.cf
+        x = math.pi
+        self.assertEqual((x - x).ratio, (0, 1))
+        self.assertEqual((x/x).ratio, (1, 1))
+        self.assertEqual((x*1/x).ratio, (1, 1))
+        self.assertEqual((2*x/x).ratio, (2, 1))
+        self.assertEqual(math.binop(x, x, 1, 0, 0, 0, 2, 0, 0, 0).ratio,
+                         (1, 2))
+        self.assertEqual(math.degrees(2*x).ratio, (360, 1))
+        self.assertTrue(type(x + x) is math.unop)
+        self.assertTrue(type(x*x) is math.binop)
+        self.assertTrue(math.exp(math.log(x)) is x)
+        self.assertTrue(math.log(math.exp(x)) is x)
+        self.assertTrue(math.tan(math.atan(x)) is x)
+        self.assertEqual(math.exp(math.log(cf(2, 3))).ratio, (2, 3))
+        self.assertEqual(math.tan(math.atan(0.5)).ratio, (1, 2))
+        self.assertEqual(math.tan(x/4).ratio, (1, 1))
+        self.assertEqual(math.tan(-x/4).ratio, (-1, 1))
+        self.assertEqual(math.tan(11*x/4).ratio, (-1, 1))
+        self.assertEqual(math.sin(x/2).ratio, (1, 1))
+        self.assertTrue(math.sqrt(x)**2 is x)
+        self.assertTrue(math.root(x, 3)**-6 == 1/(x*x))
+        # NaNs don't cancel out.
+        self.assertEqual((math.NaN - math.NaN).pq(0), None)
+        self.assertEqual((math.NaN/math.NaN).pq(0), None)
+        math.set_cf_parameter('simplify_nodes', 0)
+        try:
+            self.assertTrue(type(x - x) is math.binop)
+            self.assertFalse(math.tan(math.atan(x)) is x)
+        finally:
+            math.set_cf_parameter('simplify_nodes', 1)
+
     # RED_FLAG 16-Oct-2000 Tim
     # While 2.0 is more consistent about exceptions than previous releases, it
     # still fails this part of the test on some platforms.  For now, we only